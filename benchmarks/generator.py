@@ -0,0 +1,187 @@
+import re
+from pathlib import Path
+from typing import Tuple
+
+import numpy as np
+import pandas as pd
+import yaml
+from keycloak_sync.model.csvloader import Template
+
+
+class Generator:
+    """Generate a synthetic users file and its template from a client template,
+    every generated value is valid against the data model of the template
+
+    Args:
+        template (Path): client template, e.g. client-template/template.yaml
+        rows (int): number of users
+        attributes (int): number of extra attribute columns mapped to user attributes
+        null_ratio (float): ratio of empty values in nullable columns
+        seed (int): random seed, the same arguments always generate the same file
+    """
+    ATTRIBUTE_COLUMN = 'Attribute {}'
+    ATTRIBUTE_KEY = 'attribute{}'
+    ATTRIBUTE_REGEX = '^[0-9A-Z]*$'
+    ANY_REGEX = '^.*$'
+    DATE = 'date'
+    EMAIL = 'email'
+    CODE = 'code'
+    NAME = 'name'
+    TEXT = 'text'
+    # first kind whose sample matches a column regex generates the column, free text first
+    SAMPLES = {TEXT: 'text 1',
+               DATE: '01/02/21',
+               CODE: 'AB12CD',
+               NAME: 'Name1',
+               EMAIL: 'user1@testonly.com'}
+    POOL_SIZE = 1000
+    DEFAULT_ROLES = ['Admin', 'User']
+
+    class GeneratorError(Exception):
+        """Exception raised for errors in the Generator.
+
+        Attributes:
+            message -- explanation of the error
+        """
+
+        def __init__(self, message):
+            self.message = message
+
+    def __init__(self, template: Path, rows: int, attributes: int = 0, null_ratio: float = 0.0, seed: int = 0):
+        if rows < 1 or attributes < 0 or not 0 <= null_ratio < 1:
+            raise Generator.GeneratorError(
+                f'rows should be positive, attributes not negative and null ratio in [0, 1)')
+        with open(template, 'r') as stream:
+            self.template = yaml.safe_load(stream)
+        self.rows = rows
+        self.attributes = attributes
+        self.null_ratio = null_ratio
+        self.random = np.random.default_rng(seed)
+        self._fix_regexes()
+        self._add_attributes()
+
+    @staticmethod
+    def _compile(regex: str):
+        """compile a data model regex the way cerberus matches it
+
+        Args:
+            regex (str): data model regex
+
+        Returns:
+            compiled regex, None when regex is invalid
+        """
+        try:
+            return re.compile(regex if regex.endswith('$') else regex + '$')
+        except re.error:
+            return None
+
+    def _fix_regexes(self):
+        """replace invalid regexes of the data model, cerberus rejects the whole template otherwise"""
+        for data_model in self.template[Template.DATA_MODEL]:
+            regex = data_model.get(Template.DATA_MODEL_REGEX)
+            if regex is not None and Generator._compile(regex) is None:
+                data_model[Template.DATA_MODEL_REGEX] = Generator.ANY_REGEX
+
+    def _add_attributes(self):
+        """add attribute columns to the data model and the mapper"""
+        mapper = self.template[Template.MAPPER]
+        if not isinstance(mapper.get(Template.MAPPER_ATTRIBUTES), list):
+            mapper[Template.MAPPER_ATTRIBUTES] = []
+        for index in range(self.attributes):
+            column = Generator.ATTRIBUTE_COLUMN.format(index)
+            self.template[Template.DATA_MODEL].append({Template.DATA_MODEL_NAME: column,
+                                                       Template.DATA_MODEL_TYPE: Template.DATA_MODEL_TYPE_STRING,
+                                                       Template.DATA_MODEL_REGEX: Generator.ATTRIBUTE_REGEX,
+                                                       Template.DATA_MODEL_NULLABLE: True})
+            mapper[Template.MAPPER_ATTRIBUTES].append({Template.MAPPER_ATTRIBUTES_KEY: Generator.ATTRIBUTE_KEY.format(index),
+                                                       Template.MAPPER_ATTRIBUTES_VALUE: column})
+
+    def _kind(self, data_model: dict) -> str:
+        """choose how to generate a column
+
+        Args:
+            data_model (dict): column data model
+
+        Returns:
+            str: one of SAMPLES kinds
+        """
+        mapper = self.template[Template.MAPPER]
+        if data_model[Template.DATA_MODEL_NAME] in (mapper.get(Template.MAPPER_USERNAME), mapper.get(Template.MAPPER_EMAIL)):
+            return Generator.EMAIL
+        regex = Generator._compile(data_model.get(
+            Template.DATA_MODEL_REGEX) or Generator.ANY_REGEX)
+        for kind, sample in Generator.SAMPLES.items():
+            if regex.match(sample):
+                return kind
+        raise Generator.GeneratorError(
+            f'Unable to generate values for column {data_model[Template.DATA_MODEL_NAME]}')
+
+    def _column(self, kind: str) -> pd.Series:
+        """generate the values of a column
+
+        Args:
+            kind (str): one of SAMPLES kinds
+
+        Returns:
+            pd.Series: column values
+        """
+        if kind == Generator.EMAIL:
+            return 'user' + pd.Series(np.arange(self.rows)).astype(str) + '@testonly.com'
+        if kind == Generator.DATE:
+            dates = pd.Timestamp('2020-01-01') + \
+                pd.to_timedelta(self.random.integers(0, 365, self.rows), unit='D')
+            return pd.Series(dates).dt.strftime('%d/%m/%y')
+        if kind == Generator.CODE:
+            letters = np.array(list('ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789'))
+            pool = [''.join(self.random.choice(letters, 6))
+                    for _ in range(Generator.POOL_SIZE)]
+        elif kind == Generator.NAME:
+            pool = [f'Name{index}' for index in range(Generator.POOL_SIZE)]
+        else:
+            pool = [f'text {index}' for index in range(Generator.POOL_SIZE)]
+        return pd.Series(np.array(pool, dtype=object)[self.random.integers(0, len(pool), self.rows)])
+
+    def dataframe(self) -> pd.DataFrame:
+        """generate the users rows
+
+        Returns:
+            pd.DataFrame: one column per data model
+        """
+        mapper = self.template[Template.MAPPER]
+        roles = (self.template.get(Template.EXPORT) or {}).get(
+            Template.EXPORT_ROLES) or Generator.DEFAULT_ROLES
+        columns = {}
+        for data_model in self.template[Template.DATA_MODEL]:
+            name = data_model[Template.DATA_MODEL_NAME]
+            if name == mapper.get(Template.MAPPER_ROLE):
+                column = pd.Series(np.array(roles, dtype=object)[
+                                   self.random.integers(0, len(roles), self.rows)])
+            else:
+                column = self._column(self._kind(data_model))
+            if data_model.get(Template.DATA_MODEL_NULLABLE) and self.null_ratio:
+                column[self.random.random(self.rows) < self.null_ratio] = None
+            columns[name] = column
+        return pd.DataFrame(columns)
+
+    def write(self, directory: Path) -> Tuple[Path, Path]:
+        """write the users file and its template
+
+        Args:
+            directory (Path): output directory
+
+        Returns:
+            Tuple[Path, Path]: template path, users file path
+        """
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        template_path = directory / 'template.yaml'
+        csv_path = directory / 'users.csv'
+        with open(template_path, 'w') as stream:
+            yaml.safe_dump(self.template, stream, allow_unicode=True)
+        encoding = self.template.get(Template.ENCODING) or 'utf-8'
+        with open(csv_path, 'w', encoding=encoding, newline='') as stream:
+            for index in range(self.template.get(Template.IGNORE_N_ROWS, 0)):
+                stream.write(f'generated by benchmarks {index}\n')
+            self.dataframe().to_csv(stream, sep=self.template.get(Template.SEPARATOR) or ',',
+                                    index=False)
+        return template_path, csv_path
@@ -0,0 +1,82 @@
+"""Memory of the users list built from a users file, today's representation against the compact one
+
+Usage:
+    python -m benchmarks.memory --rows 200000 --attributes 5 --null-ratio 0.1
+"""
+import gc
+import logging
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+import click
+from keycloak_sync.model.csvloader import CSVLoader
+from keycloak_sync.model.kc import Keycloak
+from keycloak_sync.model.kcuser import KCUser
+
+from benchmarks.generator import Generator
+from benchmarks.pipeline import TEMPLATE
+
+logger = logging.getLogger(__name__)
+
+REPRESENTATIONS = {'default': False, 'compact': True}
+
+
+def measure(csvloader: CSVLoader, compact: bool) -> dict:
+    """build the users list once with tracemalloc for its memory, once without for its time,
+    then materialise every keycloak payload as add_users does
+
+    Args:
+        csvloader (CSVLoader): loaded users file
+        compact (bool): representation passed to KCUser.create_list_users
+
+    Returns:
+        dict: {build_seconds, payload_seconds, retained_mib, peak_mib, bytes_per_user}
+    """
+    gc.collect()
+    tracemalloc.start()
+    list_users = KCUser.create_list_users(csvloader, compact=compact)
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del list_users
+    gc.collect()
+    start = time.perf_counter()
+    list_users = KCUser.create_list_users(csvloader, compact=compact)
+    build_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    for user in list_users:
+        Keycloak._user_payload(user)
+    payload_seconds = time.perf_counter() - start
+    return {'build_seconds': round(build_seconds, 4),
+            'payload_seconds': round(payload_seconds, 4),
+            'retained_mib': round(retained / 2 ** 20, 1),
+            'peak_mib': round(peak / 2 ** 20, 1),
+            'bytes_per_user': round(retained / len(list_users))}
+
+
+@click.command()
+@click.option('--rows', type=click.IntRange(min=1), default=200000, show_default=True, help='Number of generated users')
+@click.option('--attributes', type=click.IntRange(min=0), default=5, show_default=True, help='Number of generated attribute columns')
+@click.option('--null-ratio', type=click.FloatRange(min=0, max=0.99), default=0.1, show_default=True, help='Ratio of empty values in nullable columns')
+@click.option('--seed', type=int, default=0, show_default=True, help='Random seed of the generator')
+def main(rows, attributes, null_ratio, seed):
+    """Compare the memory retained by the default and compact users lists"""
+    logging.disable(logging.INFO)
+    with tempfile.TemporaryDirectory() as directory:
+        template, csvfile = Generator(template=TEMPLATE, rows=rows, attributes=attributes,
+                                      null_ratio=null_ratio, seed=seed).write(Path(directory))
+        csvloader = CSVLoader(template=template, csvfile=csvfile)
+        results = {name: measure(csvloader, compact)
+                   for name, compact in REPRESENTATIONS.items()}
+    click.echo(f'rows={rows},attributes={attributes},null_ratio={null_ratio}')
+    for name, result in results.items():
+        click.echo(f'{name:<8} retained {result["retained_mib"]:>9.1f}MiB  peak {result["peak_mib"]:>9.1f}MiB  '
+                   f'{result["bytes_per_user"]:>6}B/user  build {result["build_seconds"]:>8.4f}s  '
+                   f'payload {result["payload_seconds"]:>8.4f}s')
+    click.echo(
+        f'compact retains {1 - results["compact"]["retained_mib"] / results["default"]["retained_mib"]:.0%} less memory')
+
+
+if __name__ == '__main__':
+    main()
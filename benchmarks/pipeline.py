@@ -0,0 +1,187 @@
+"""Offline benchmark of the CSV -> KCUser -> export pipeline, no keycloak is needed
+
+Usage:
+    python -m benchmarks.pipeline --rows 20000 --attributes 5 --null-ratio 0.1
+    python -m benchmarks.pipeline --save      # record baseline of the scenario
+    python -m benchmarks.pipeline --check     # fail on regression
+"""
+import json
+import logging
+import platform
+import statistics
+import sys
+import tempfile
+from datetime import datetime
+from pathlib import Path
+
+import click
+import pandas as pd
+import pyarrow as pa
+from keycloak_sync.model.csvloader import CSVLoader
+from keycloak_sync.model.kcuser import KCUser
+from keycloak_sync.model.profiler import Profiler
+
+from benchmarks.generator import Generator
+
+logger = logging.getLogger(__name__)
+
+BASELINE = Path(__file__).parent / 'baseline.json'
+TEMPLATE = Path(__file__).parent.parent / 'client-template' / 'template.yaml'
+STAGES = ['parse', 'validate', 'build', 'custom_attributes', 'export']
+# slowdowns smaller than this are timer noise on the fastest stages
+MIN_SLOWDOWN_SECONDS = 0.01
+# slowdowns within this many median absolute deviations of both runs are machine noise
+NOISE_DEVIATIONS = 3
+
+
+def run_pipeline(template: Path, csvfile: Path, export_path: Path, trace_malloc: bool) -> dict:
+    """run every local stage once
+
+    Args:
+        template (Path): generated template
+        csvfile (Path): generated users file
+        export_path (Path): export destination
+        trace_malloc (bool): measure peak memory, slows stages down
+
+    Returns:
+        dict: {stage: Profiler.Phase}
+    """
+    profiler = Profiler(trace_malloc=trace_malloc, top_allocators=0)
+    profiler.start()
+    try:
+        csvloader = CSVLoader(template=template, csvfile=csvfile)
+        with Profiler.phase('validate'):
+            csvloader.validate()
+        with Profiler.phase('build'):
+            list_users = KCUser._create_list_empty_users(csvloader)
+            KCUser._assign_parameters_to_list_users(
+                csvloader=csvloader, list_users=list_users, compact=True)
+        with Profiler.phase('custom_attributes'):
+            KCUser._add_custom_attributes(
+                csvloader, list_users, compact=True)
+        with Profiler.phase('export'):
+            csvloader.export_users_to_csv(
+                list_users=list_users, export_path=export_path)
+    finally:
+        profiler.stop()
+    return {phase.name: phase for phase in profiler.phases if phase.name in STAGES}
+
+
+def scenario_key(rows: int, attributes: int, null_ratio: float) -> str:
+    """name of a benchmark scenario in the baseline
+
+    Returns:
+        str: scenario name
+    """
+    return f'rows={rows},attributes={attributes},null_ratio={null_ratio}'
+
+
+def environment() -> dict:
+    """describe the machine and the libraries the results were measured with
+
+    Returns:
+        dict: environment metadata
+    """
+    return {'python': platform.python_version(),
+            'pandas': pd.__version__,
+            'pyarrow': pa.__version__,
+            'platform': platform.platform(),
+            'processor': platform.processor() or platform.machine()}
+
+
+def benchmark(rows: int, attributes: int, null_ratio: float, repeat: int, seed: int) -> dict:
+    """generate a users file and measure each stage, time is the median of repeat runs
+    with their median absolute deviation, and peak memory is measured by one more run with tracemalloc
+
+    Returns:
+        dict: {stage: {seconds, deviation, peak_mib}}
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        template, csvfile = Generator(template=TEMPLATE, rows=rows, attributes=attributes,
+                                      null_ratio=null_ratio, seed=seed).write(Path(directory))
+        export_path = Path(directory) / 'export.csv'
+        timings = {stage: [] for stage in STAGES}
+        for _ in range(repeat):
+            for stage, phase in run_pipeline(template, csvfile, export_path, trace_malloc=False).items():
+                timings[stage].append(phase.elapsed)
+        results = {}
+        for stage, seconds in timings.items():
+            median = statistics.median(seconds)
+            results[stage] = {'seconds': round(median, 4),
+                              'deviation': round(statistics.median(abs(value - median) for value in seconds), 4),
+                              'peak_mib': None}
+        for stage, phase in run_pipeline(template, csvfile, export_path, trace_malloc=True).items():
+            results[stage]['peak_mib'] = round(phase.peak / 2 ** 20, 1)
+    return results
+
+
+def check(results: dict, baseline: dict, threshold: float) -> list:
+    """compare stage times with the baseline, a stage regresses when it is slower than
+    threshold and than the noise of both runs
+
+    Args:
+        results (dict): {stage: {seconds, deviation, peak_mib}}
+        baseline (dict): baseline of the same scenario
+        threshold (float): allowed slowdown ratio, 0.25 fails above 125% of baseline
+
+    Returns:
+        list: descriptions of the regressions
+    """
+    regressions = []
+    for stage, result in results.items():
+        reference = baseline.get(stage, {}).get('seconds')
+        noise = max(MIN_SLOWDOWN_SECONDS, NOISE_DEVIATIONS * (
+            baseline.get(stage, {}).get('deviation', 0) + result['deviation']))
+        if reference and result['seconds'] > max(reference * (1 + threshold), reference + noise):
+            regressions.append(
+                f'{stage}: {result["seconds"]:.4f}s > {reference:.4f}s + max({threshold:.0%}, {noise:.4f}s)')
+    return regressions
+
+
+@click.command()
+@click.option('--rows', type=click.IntRange(min=1), default=20000, show_default=True, help='Number of generated users')
+@click.option('--attributes', type=click.IntRange(min=0), default=5, show_default=True, help='Number of generated attribute columns')
+@click.option('--null-ratio', type=click.FloatRange(min=0, max=0.99), default=0.1, show_default=True, help='Ratio of empty values in nullable columns')
+@click.option('--repeat', type=click.IntRange(min=1), default=5, show_default=True, help='Number of timed runs, the median is kept')
+@click.option('--seed', type=int, default=0, show_default=True, help='Random seed of the generator')
+@click.option('--baseline', 'baseline_path', type=click.Path(dir_okay=False), default=str(BASELINE), show_default=True, help='Baseline results file')
+@click.option('--save', is_flag=True, help='Record results as the baseline of this scenario')
+@click.option('--check', 'check_baseline', is_flag=True, help='Fail when a stage is slower than baseline by more than threshold')
+@click.option('--threshold', type=click.FloatRange(min=0), default=0.25, show_default=True, help='Allowed slowdown ratio')
+def main(rows, attributes, null_ratio, repeat, seed, baseline_path, save, check_baseline, threshold):
+    """Benchmark parsing, validation, user building and export without keycloak"""
+    logging.disable(logging.INFO)
+    key = scenario_key(rows, attributes, null_ratio)
+    results = benchmark(rows, attributes, null_ratio, repeat, seed)
+    click.echo(key)
+    for stage, result in results.items():
+        click.echo(
+            f'{stage:<18} {result["seconds"]:>10.4f}s ±{result["deviation"]:.4f}s  peak {result["peak_mib"]:>9.1f}MiB')
+    baselines = {}
+    if Path(baseline_path).exists():
+        with open(baseline_path, 'r') as stream:
+            baselines = json.load(stream)
+    if check_baseline:
+        if key not in baselines:
+            click.echo(f'No baseline for {key} in {baseline_path}', err=True)
+            sys.exit(1)
+        if baselines[key]['environment'] != environment():
+            click.echo(
+                f'Baseline was recorded on {baselines[key]["environment"]}, results may not be comparable', err=True)
+        regressions = check(results, baselines[key]['stages'], threshold)
+        for regression in regressions:
+            click.echo(f'Regression {regression}', err=True)
+        if regressions:
+            sys.exit(1)
+    if save:
+        baselines[key] = {'recorded_at': datetime.now().isoformat(timespec='seconds'),
+                          'environment': environment(),
+                          'stages': results}
+        with open(baseline_path, 'w') as stream:
+            json.dump(baselines, stream, indent=2, sort_keys=True)
+            stream.write('\n')
+        click.echo(f'Save baseline {key} to {baseline_path}')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,14 +1,30 @@
+import asyncio
+import gzip
 import logging
 import sys
+from contextlib import contextmanager
+from urllib.parse import urlparse
 
 import click
 import coloredlogs
 from colorama import Fore, Style
-from keycloak_sync.model.csvloader import CSVLoader
+from keycloak_sync.model.csvloader import CSVLoader, Template
 from keycloak_sync.model.kc import Keycloak
+from keycloak_sync.model.kcasync import AsyncKeycloak
 from keycloak_sync.model.kcuser import KCUser
 from keycloak_sync.model.googlestorage import GoogleStorage
-from pathlib import PurePath, Path
+from keycloak_sync.model.s3storage import S3Storage
+from keycloak_sync.model.fileformat import FileFormat
+from keycloak_sync.model.kcquery import KCQuery
+from keycloak_sync.model.profiler import Profiler
+from keycloak_sync.model.report import RunReport
+from keycloak_sync.model.shard import Shard
+from keycloak_sync.model.rowdelta import RowDelta
+from keycloak_sync.model.passwordhasher import PasswordHasher
+from keycloak_sync.model.watermark import Watermark
+from keycloak_sync.model.pagefetcher import PageFetcher
+from pathlib import PurePath, PurePosixPath, Path
+from typing import BinaryIO, Iterator, Union
 
 from keycloak_sync import __version__
 from pathlib import Path
@@ -26,6 +42,37 @@ class Arguments:
     CSV_FILE_NAME = 'csv_file_name'
     CSV_FILE_TEMPLATE = 'csv_file_template'
     OUTPUT_FILE_PATH = 'output_file_path'
+    WORKERS = 'workers'
+    ASYNC = 'use_async'
+    PROFILE = 'profile'
+    PROFILE_MODE = 'profile_mode'
+    TRACE_MALLOC = 'trace_malloc'
+    SHARD = 'shard'
+    REPORT_FILE = 'report_file'
+    REPORT_FILES = 'report_files'
+    DELTA = 'delta'
+    DELTA_STATE = 'delta_state'
+    DELETE_REMOVED = 'delete_removed'
+    HASH_PASSWORDS = 'hash_passwords'
+    HASH_ITERATIONS = 'hash_iterations'
+    HASH_ALGORITHM = 'hash_algorithm'
+    HASH_PROCESSES = 'hash_processes'
+    INCREMENTAL = 'incremental'
+    MODIFIED = 'modified'
+    WATERMARK = 'watermark'
+    OUTPUT_MODE = 'output_mode'
+    PAGE_SIZE = 'page_size'
+    PREFETCH = 'prefetch'
+    ON_INVALID = 'on_invalid'
+    ON_INVALID_VALUES = ['abort', 'quarantine']
+    REJECT_FILE = 'reject_file'
+    MAX_REJECT_RATIO = 'max_reject_ratio'
+    REJECT_SUFFIX = '.rejected'
+    GZIP = 'gzip'
+    S3_ENDPOINT_URL = 's3_endpoint_url'
+    GS_SCHEME = 'gs'
+    S3_SCHEME = 's3'
+    BUCKET_SCHEMES = [GS_SCHEME, S3_SCHEME]
 
     BUCKET_NAME = 'bucket_name'
     BUCKET_SOURCE_FILE = 'bucket_source_file'
@@ -36,19 +83,377 @@ class Arguments:
     STORAGE_TYPE_VALUES = ['google', 'scaleway']
 
 
+def echo_results(results: list, action: str):
+    """print failed users and a summary of users results
+
+    Args:
+        results (list): list of Keycloak.Result
+        action (str): verb describing the operation
+
+    Returns:
+        int: number of failed users
+    """
+    failed = [result for result in results if result.error]
+    for result in failed:
+        click.echo(
+            f'{Fore.RED}Failed {result.username}: {result.error}{Style.RESET_ALL}')
+    click.echo(
+        f'Total {action} users: {len(results) - len(failed)}, failed: {len(failed)}')
+    return len(failed)
+
+
+def run_async(kwargs: dict, action: str, **action_kwargs):
+    """run one AsyncKeycloak operation in an event loop
+
+    Args:
+        kwargs (dict): command arguments
+        action (str): AsyncKeycloak method name
+
+    Returns:
+        result of the operation
+    """
+    async def run():
+        async with AsyncKeycloak(server_url=kwargs.get(Arguments.KEYCLOAK_SERVER_URL),
+                                 client_id=kwargs.get(
+                                     Arguments.KEYCLOAK_CLIENT_ID),
+                                 realm_name=kwargs.get(
+                                     Arguments.KEYCLOAK_REALM_NAME),
+                                 client_secret_key=kwargs.get(
+                                     Arguments.KEYCLOAK_CLIENT_SECRET),
+                                 concurrency=kwargs.get(Arguments.WORKERS),
+                                 page_size=kwargs.get(Arguments.PAGE_SIZE) or AsyncKeycloak.PAGE_SIZE) as kc:
+            return await getattr(kc, action)(**action_kwargs)
+    return asyncio.run(run())
+
+
+def parse_shard(ctx, param, value):
+    """click callback parsing --shard i/N"""
+    if value is None:
+        return None
+    try:
+        return Shard.parse(value)
+    except Shard.ShardError as error:
+        raise click.BadParameter(error.message)
+
+
+def select_shard(kwargs: dict, csvloader: CSVLoader):
+    """keep the rows of the shard given by --shard
+
+    Args:
+        kwargs (dict): command arguments
+        csvloader (CSVLoader): loaded users file
+    """
+    shard = kwargs.get(Arguments.SHARD)
+    if shard is not None:
+        csvloader.data = shard.filter_dataframe(
+            csvloader.data, csvloader.template[Template.MAPPER][Template.MAPPER_USERNAME])
+
+
+def write_report(kwargs: dict, report: RunReport):
+    """write run report when --report is given
+
+    Args:
+        kwargs (dict): command arguments
+        report (RunReport): report of the run
+    """
+    if kwargs.get(Arguments.REPORT_FILE):
+        report.write(Path(kwargs.get(Arguments.REPORT_FILE)))
+
+
+def is_bucket_url(output: str) -> bool:
+    """check output is a gs:// or s3:// url
+
+    Args:
+        output (str): output path or url
+
+    Returns:
+        bool: true when output is in a bucket
+    """
+    return urlparse(output).scheme in Arguments.BUCKET_SCHEMES
+
+
+@contextmanager
+def open_output(kwargs: dict, output: str) -> Iterator[Union[Path, BinaryIO]]:
+    """open export destination, gs:// and s3:// outputs are streamed to the bucket
+    and compressed on the fly with --gzip, nothing is written to local disk
+
+    Args:
+        kwargs (dict): command arguments
+        output (str): output path or url
+
+    Yields:
+        Iterator[Union[Path, BinaryIO]]: local path, or binary stream
+    """
+    url = urlparse(output)
+    destination_file = PurePath(url.path.lstrip('/'))
+    if url.scheme == Arguments.GS_SCHEME:
+        writer = GoogleStorage.open_writer(
+            bucket_name=url.netloc, destination_file=destination_file)
+    elif url.scheme == Arguments.S3_SCHEME:
+        writer = S3Storage(endpoint_url=kwargs.get(Arguments.S3_ENDPOINT_URL)).open_writer(
+            bucket_name=url.netloc, destination_file=destination_file)
+    elif kwargs.get(Arguments.GZIP):
+        writer = open(output, 'wb')
+    else:
+        yield Path(output)
+        return
+    with writer as stream:
+        if not kwargs.get(Arguments.GZIP):
+            yield stream
+            return
+        with gzip.GzipFile(filename=destination_file.name, fileobj=stream, mode='wb') as compressed:
+            yield compressed
+
+
+def get_watermark_path(kwargs: dict, output: str) -> Path:
+    """get the watermark path of an export
+
+    Args:
+        kwargs (dict): command arguments
+        output (str): output path or url
+
+    Returns:
+        Path: --watermark, or a watermark next to the output file, in the working directory for bucket outputs
+    """
+    if kwargs.get(Arguments.WATERMARK):
+        return Path(kwargs.get(Arguments.WATERMARK))
+    if is_bucket_url(output):
+        return Watermark.default_path(Path(PurePosixPath(urlparse(output).path).name))
+    return Watermark.default_path(Path(output))
+
+
+def get_part_output(output: str) -> str:
+    """get the dated part file of an export
+
+    Args:
+        output (str): output path or url
+
+    Returns:
+        str: part file path or url
+    """
+    url = urlparse(output)
+    if url.scheme in Arguments.BUCKET_SCHEMES:
+        return url._replace(path=Watermark.part_path(PurePosixPath(url.path)).as_posix()).geturl()
+    return str(Watermark.part_path(Path(output)))
+
+
+def get_reject_path(kwargs: dict, csvloader: CSVLoader, csvfile: Path) -> Path:
+    """get the reject file path of a users file
+
+    Args:
+        kwargs (dict): command arguments
+        csvloader (CSVLoader): loaded users file
+        csvfile (Path): users file path
+
+    Returns:
+        Path: --reject-file or a reject file next to csvfile, one per shard
+    """
+    if kwargs.get(Arguments.REJECT_FILE):
+        return Path(kwargs.get(Arguments.REJECT_FILE))
+    shard = kwargs.get(Arguments.SHARD)
+    suffix = Arguments.REJECT_SUFFIX + \
+        ('' if shard is None else f'.{shard.index}-{shard.count}')
+    extension = csvfile.suffix
+    if csvloader.reject_format() != csvloader.template[Template.FORMAT].upper():
+        extension = f'.{csvloader.reject_format().lower()}'
+    return csvfile.with_name(f'{csvfile.stem}{suffix}{extension}')
+
+
+def validate_rows(kwargs: dict, csvloader: CSVLoader, reject_path: Path, report: RunReport,
+                  delta: Union[RowDelta, None] = None) -> int:
+    """validate users file, with --on-invalid quarantine invalid rows are written to the reject
+    file and only valid rows are kept, the run is aborted when they exceed --max-reject-ratio
+
+    Args:
+        kwargs (dict): command arguments
+        csvloader (CSVLoader): loaded users file
+        reject_path (Path): reject file path
+        report (RunReport): report of the run, rejected users are reported as failed
+        delta (Union[RowDelta, None]): delta of the file, the reject ratio is computed on all its rows
+
+    Returns:
+        int: number of rejected rows
+    """
+    with Profiler.phase('validate'):
+        if kwargs.get(Arguments.ON_INVALID) != Arguments.ON_INVALID_VALUES[1]:
+            csvloader.validate()
+            logger.info(f"CSV file is valid")
+            return 0
+        rejects = csvloader.quarantine(reject_path=reject_path,
+                                       max_reject_ratio=kwargs.get(
+                                           Arguments.MAX_REJECT_RATIO),
+                                       total_rows=None if delta is None else len(delta.state))
+    username = csvloader.template[Template.MAPPER][Template.MAPPER_USERNAME]
+    report.add_results([Keycloak.Result(None, row[username] if isinstance(row[username], str) else None, f'rejected: {row[CSVLoader.REJECT_REASON]}')
+                        for row in rejects[[username, CSVLoader.REJECT_REASON]].to_dict('records')])
+    if len(rejects):
+        click.echo(
+            f'{Fore.YELLOW}Rejected {len(rejects)} invalid rows to {reject_path}{Style.RESET_ALL}')
+    return len(rejects)
+
+
+def get_state_path(kwargs: dict, csvfile: Path) -> Path:
+    """get the row hashes state path of a users file
+
+    Args:
+        kwargs (dict): command arguments
+        csvfile (Path): users file path
+
+    Returns:
+        Path: --delta-state or a state file next to csvfile, one per shard
+    """
+    if kwargs.get(Arguments.DELTA_STATE):
+        return Path(kwargs.get(Arguments.DELTA_STATE))
+    shard = kwargs.get(Arguments.SHARD)
+    return RowDelta.default_state_path(csvfile, '' if shard is None else f'.{shard.index}-{shard.count}')
+
+
+def select_delta(kwargs: dict, csvloader: CSVLoader, state_path: Path) -> Union[RowDelta, None]:
+    """keep the rows added or changed since the last run when --delta is given
+
+    Args:
+        kwargs (dict): command arguments
+        csvloader (CSVLoader): loaded users file
+        state_path (Path): row hashes state of the last run
+
+    Returns:
+        Union[RowDelta, None]: delta of the file, None without --delta
+    """
+    if not kwargs.get(Arguments.DELTA):
+        return None
+    with Profiler.phase('delta'):
+        delta = RowDelta.load(csvloader, state_path)
+        delta.select_rows(csvloader)
+    return delta
+
+
+def apply_delta(kwargs: dict, delta: Union[RowDelta, None], state_path: Path, report: RunReport) -> int:
+    """delete removed users when --delete-removed is given and save the row hashes state
+
+    Args:
+        kwargs (dict): command arguments
+        delta (Union[RowDelta, None]): delta of the file
+        state_path (Path): row hashes state path
+        report (RunReport): report of the run, its failed users are applied again next run
+
+    Returns:
+        int: number of users which could not be deleted
+    """
+    if delta is None:
+        return 0
+    pending_removed = delta.removed
+    if kwargs.get(Arguments.DELETE_REMOVED) and delta.removed:
+        list_users = [KCUser(username=username) for username in delta.removed]
+        with Profiler.phase('apply'):
+            if kwargs.get(Arguments.ASYNC):
+                results = run_async(
+                    kwargs, 'delete_users', list_users=list_users)
+            else:
+                kc = Keycloak(server_url=kwargs.get(Arguments.KEYCLOAK_SERVER_URL),
+                              client_id=kwargs.get(Arguments.KEYCLOAK_CLIENT_ID),
+                              realm_name=kwargs.get(
+                                  Arguments.KEYCLOAK_REALM_NAME),
+                              client_secret_key=kwargs.get(Arguments.KEYCLOAK_CLIENT_SECRET))
+                results = kc.delete_users(
+                    list_users=list_users, workers=kwargs.get(Arguments.WORKERS))
+        pending_removed = [result.username for result in results if result.error]
+        echo_results(results, 'delete removed')
+    delta.write_state(state_path,
+                      failed_usernames=[failed[RunReport.FAILED_USERNAME]
+                                        for failed in report.failed],
+                      pending_removed=pending_removed)
+    return len(pending_removed) if kwargs.get(Arguments.DELETE_REMOVED) else 0
+
+
+def hash_passwords(kwargs: dict, list_users: list):
+    """hash passwords locally when --hash-passwords is given, iterations and algorithm
+    not given on command line are read from the realm password policy
+
+    Args:
+        kwargs (dict): command arguments
+        list_users (list): list of users
+    """
+    if not kwargs.get(Arguments.HASH_PASSWORDS):
+        return
+    with Profiler.phase('hash'):
+        policy = None
+        if kwargs.get(Arguments.HASH_ITERATIONS) is None or kwargs.get(Arguments.HASH_ALGORITHM) is None:
+            policy = Keycloak(server_url=kwargs.get(Arguments.KEYCLOAK_SERVER_URL),
+                              client_id=kwargs.get(Arguments.KEYCLOAK_CLIENT_ID),
+                              realm_name=kwargs.get(
+                                  Arguments.KEYCLOAK_REALM_NAME),
+                              client_secret_key=kwargs.get(Arguments.KEYCLOAK_CLIENT_SECRET)).get_password_policy()
+        hasher = PasswordHasher.from_policy(policy,
+                                            algorithm=kwargs.get(
+                                                Arguments.HASH_ALGORITHM),
+                                            iterations=kwargs.get(Arguments.HASH_ITERATIONS))
+        hasher.hash_users(
+            list_users, workers=kwargs.get(Arguments.HASH_PROCESSES))
+
+
+def add_users(kwargs: dict, list_users: list, report: RunReport) -> int:
+    """add or update users on keycloak
+
+    Args:
+        kwargs (dict): command arguments
+        list_users (list): list of users
+        report (RunReport): report of the run
+
+    Returns:
+        int: number of failed users
+    """
+    with Profiler.phase('apply'):
+        if kwargs.get(Arguments.ASYNC):
+            results = run_async(kwargs, 'add_users', users=list_users)
+        else:
+            kc = Keycloak(server_url=kwargs.get(Arguments.KEYCLOAK_SERVER_URL),
+                          client_id=kwargs.get(Arguments.KEYCLOAK_CLIENT_ID),
+                          realm_name=kwargs.get(Arguments.KEYCLOAK_REALM_NAME),
+                          client_secret_key=kwargs.get(Arguments.KEYCLOAK_CLIENT_SECRET))
+            results = kc.add_users(
+                list_users, workers=kwargs.get(Arguments.WORKERS))
+    report.add_results(results)
+    return echo_results(results, 'update/add')
+
+
 def set_log(verbose: int):
     level = Arguments.LOG_LEVEL[verbose]
     coloredlogs.install(level=level, logger=logger)
     Keycloak.set_log_level(level)
+    AsyncKeycloak.set_log_level(level)
     KCUser.set_log_level(level)
     CSVLoader.set_log_level(level)
     GoogleStorage.set_log_level(level)
+    FileFormat.set_log_level(level)
+    KCQuery.set_log_level(level)
+    Profiler.set_log_level(level)
+    Shard.set_log_level(level)
+    RunReport.set_log_level(level)
+    RowDelta.set_log_level(level)
+    PasswordHasher.set_log_level(level)
+    Watermark.set_log_level(level)
+    PageFetcher.set_log_level(level)
+    S3Storage.set_log_level(level)
 
 
 @click.group()
 @click.version_option(version=__version__)
-def kcctl():
+@click.option('--profile', Arguments.PROFILE, envvar=Arguments.PROFILE.upper(), type=click.Path(dir_okay=False, writable=True), help='Write a cProfile pstats file or a collapsed stacks file')
+@click.option('--profile-mode', Arguments.PROFILE_MODE, envvar=Arguments.PROFILE_MODE.upper(), type=click.Choice(Profiler.MODES, case_sensitive=False), default=Profiler.CPROFILE, show_default=True, help='cprofile writes pstats, sample writes collapsed stacks')
+@click.option('--trace-malloc', Arguments.TRACE_MALLOC, envvar=Arguments.TRACE_MALLOC.upper(), is_flag=True, help='Report peak memory and top allocators per phase')
+@click.pass_context
+def kcctl(ctx, **kwargs):
     """Keycloak command line tool"""
+    if kwargs.get(Arguments.PROFILE) or kwargs.get(Arguments.TRACE_MALLOC):
+        profiler = Profiler(profile_path=kwargs.get(Arguments.PROFILE),
+                            mode=kwargs.get(Arguments.PROFILE_MODE).lower(),
+                            trace_malloc=kwargs.get(Arguments.TRACE_MALLOC))
+        profiler.start()
+
+        def stop_profiler():
+            profiler.stop()
+            list(map(lambda line: click.echo(line, err=True), profiler.summary()))
+        ctx.call_on_close(stop_profiler)
 
 
 @kcctl.command()
@@ -58,26 +463,51 @@ def kcctl():
 @click.option('--kc-clt-sct', Arguments.KEYCLOAK_CLIENT_SECRET, envvar=Arguments.KEYCLOAK_CLIENT_SECRET.upper(), required=True, help='Keycloak client secret')
 @click.option('-f', '--file', Arguments.CSV_FILE_NAME, envvar=Arguments.CSV_FILE_NAME.upper(), required=True, help='Csv file path')
 @click.option('-t', '--template', Arguments.CSV_FILE_TEMPLATE, envvar=Arguments.CSV_FILE_TEMPLATE.upper(), required=True, help='Custom template file')
+@click.option('-w', '--workers', Arguments.WORKERS, envvar=Arguments.WORKERS.upper(), type=int, default=Keycloak.DEFAULT_WORKERS, show_default=True, help='Number of concurrent requests')
+@click.option('--async/--no-async', Arguments.ASYNC, envvar=Arguments.ASYNC.upper(), default=False, help='Use the asyncio keycloak client')
+@click.option('--shard', Arguments.SHARD, envvar=Arguments.SHARD.upper(), callback=parse_shard, help='Only process users of shard i/N, i from 0 to N-1')
+@click.option('--report', Arguments.REPORT_FILE, envvar=Arguments.REPORT_FILE.upper(), type=click.Path(dir_okay=False, writable=True), help='Write a json run report')
+@click.option('--delta/--no-delta', Arguments.DELTA, envvar=Arguments.DELTA.upper(), default=False, help='Only apply rows added or changed since the last successful run')
+@click.option('--delta-state', Arguments.DELTA_STATE, envvar=Arguments.DELTA_STATE.upper(), type=click.Path(dir_okay=False), help='Row hashes state file, next to the users file by default')
+@click.option('--delete-removed', Arguments.DELETE_REMOVED, envvar=Arguments.DELETE_REMOVED.upper(), is_flag=True, help='With --delta, delete users whose row was removed')
+@click.option('--on-invalid', Arguments.ON_INVALID, envvar=Arguments.ON_INVALID.upper(), type=click.Choice(Arguments.ON_INVALID_VALUES), default=Arguments.ON_INVALID_VALUES[0], show_default=True, help='Abort on the first invalid value or quarantine invalid rows and sync the others')
+@click.option('--reject-file', Arguments.REJECT_FILE, envvar=Arguments.REJECT_FILE.upper(), type=click.Path(dir_okay=False), help='With --on-invalid quarantine, invalid rows file, next to the users file by default')
+@click.option('--max-reject-ratio', Arguments.MAX_REJECT_RATIO, envvar=Arguments.MAX_REJECT_RATIO.upper(), type=click.FloatRange(min=0, max=1), default=0.05, show_default=True, help='With --on-invalid quarantine, abort when more rows are invalid')
+@click.option('--hash-passwords', Arguments.HASH_PASSWORDS, envvar=Arguments.HASH_PASSWORDS.upper(), is_flag=True, help='Hash passwords locally instead of on keycloak')
+@click.option('--hash-iterations', Arguments.HASH_ITERATIONS, envvar=Arguments.HASH_ITERATIONS.upper(), type=click.IntRange(min=1), help='Hash iterations, read from the realm password policy by default')
+@click.option('--hash-algorithm', Arguments.HASH_ALGORITHM, envvar=Arguments.HASH_ALGORITHM.upper(), type=click.Choice(list(PasswordHasher.ALGORITHMS)), help='Hash algorithm, read from the realm password policy by default')
+@click.option('--hash-processes', Arguments.HASH_PROCESSES, envvar=Arguments.HASH_PROCESSES.upper(), type=click.IntRange(min=1), help='Number of hashing processes, cpu count by default')
 @click.option('-v', '--verbose', count=True)
 def sync(**kwargs):
     """Synchronize users from CSV file to keycloak"""
     set_log(int(kwargs.get(Arguments.VERBOSE)))
+    report = RunReport(command='sync', shard=kwargs.get(Arguments.SHARD) and str(
+        kwargs.get(Arguments.SHARD)))
     try:
         csvloader = CSVLoader(template=Path(kwargs.get(
             Arguments.CSV_FILE_TEMPLATE)), csvfile=Path(kwargs.get(Arguments.CSV_FILE_NAME)))
-        csvloader.validate()
-        logger.info(f"CSV file is valid")
-        list_users = KCUser.create_list_users(csvloader)
+        select_shard(kwargs, csvloader)
+        state_path = get_state_path(
+            kwargs, Path(kwargs.get(Arguments.CSV_FILE_NAME)))
+        delta = select_delta(kwargs, csvloader, state_path)
+        validate_rows(kwargs, csvloader, get_reject_path(
+            kwargs, csvloader, Path(kwargs.get(Arguments.CSV_FILE_NAME))), report, delta)
+        with Profiler.phase('build'):
+            list_users = KCUser.create_list_users(csvloader)
         logger.info(f"Finish creating User Object")
-        kc = Keycloak(server_url=kwargs.get(Arguments.KEYCLOAK_SERVER_URL),
-                      client_id=kwargs.get(Arguments.KEYCLOAK_CLIENT_ID),
-                      realm_name=kwargs.get(Arguments.KEYCLOAK_REALM_NAME),
-                      client_secret_key=kwargs.get(Arguments.KEYCLOAK_CLIENT_SECRET))
-        kc.add_users(list_users)
-        click.echo(f'Total update/add users: {len(list_users)}')
-    except (CSVLoader.CSVLoaderError, KCUser.KCUserError, Keycloak.KeycloakError) as error:
+        hash_passwords(kwargs, list_users)
+        failed = add_users(kwargs, list_users, report)
+        failed += apply_delta(kwargs, delta, state_path, report)
+        report.status = RunReport.FINISHED
+        if failed:
+            sys.exit(1)
+    except (CSVLoader.CSVLoaderError, KCUser.KCUserError, Keycloak.KeycloakError, RowDelta.RowDeltaError,
+            PasswordHasher.PasswordHasherError) as error:
+        report.reason = str(error)
         logger.error(error)
         sys.exit(1)
+    finally:
+        write_report(kwargs, report)
 
 
 @kcctl.command()
@@ -86,7 +516,17 @@ def sync(**kwargs):
 @click.option('--kc-clt', Arguments.KEYCLOAK_CLIENT_ID, envvar=Arguments.KEYCLOAK_CLIENT_ID.upper(), required=True, help='keycloak client name')
 @click.option('--kc-clt-sct', Arguments.KEYCLOAK_CLIENT_SECRET, envvar=Arguments.KEYCLOAK_CLIENT_SECRET.upper(), required=True, help='Keycloak client secret')
 @click.option('-t', '--template', Arguments.CSV_FILE_TEMPLATE, envvar=Arguments.CSV_FILE_TEMPLATE.upper(), required=True, help='Custom template file defining export rules')
-@click.option('-o', '--output', Arguments.OUTPUT_FILE_PATH, envvar=Arguments.OUTPUT_FILE_PATH.upper(), required=True, help='Output file path')
+@click.option('-o', '--output', Arguments.OUTPUT_FILE_PATH, envvar=Arguments.OUTPUT_FILE_PATH.upper(), required=True, help='Output file path, gs://bucket/path or s3://bucket/path are streamed to the bucket')
+@click.option('--gzip', Arguments.GZIP, envvar=Arguments.GZIP.upper(), is_flag=True, help='Compress output file with gzip')
+@click.option('--s3-endpoint-url', Arguments.S3_ENDPOINT_URL, envvar=Arguments.S3_ENDPOINT_URL.upper(), help='S3 compatible storage endpoint, AWS S3 by default')
+@click.option('-w', '--workers', Arguments.WORKERS, envvar=Arguments.WORKERS.upper(), type=int, default=Keycloak.DEFAULT_WORKERS, show_default=True, help='Number of concurrent requests with --async, the threaded client uses --prefetch')
+@click.option('--async/--no-async', Arguments.ASYNC, envvar=Arguments.ASYNC.upper(), default=False, help='Use the asyncio keycloak client')
+@click.option('--incremental/--no-incremental', Arguments.INCREMENTAL, envvar=Arguments.INCREMENTAL.upper(), default=False, help='Only export users created since the last export')
+@click.option('--modified', Arguments.MODIFIED, envvar=Arguments.MODIFIED.upper(), is_flag=True, help='With --incremental, also export users modified since the last export, needs realm admin events')
+@click.option('--watermark', Arguments.WATERMARK, envvar=Arguments.WATERMARK.upper(), type=click.Path(dir_okay=False), help='Watermark file, next to the output file by default')
+@click.option('--output-mode', Arguments.OUTPUT_MODE, envvar=Arguments.OUTPUT_MODE.upper(), type=click.Choice(Watermark.OUTPUT_MODES), default=Watermark.PARTS, show_default=True, help='With --incremental, append to output file or write dated part files')
+@click.option('--page-size', Arguments.PAGE_SIZE, envvar=Arguments.PAGE_SIZE.upper(), type=click.IntRange(min=1), default=PageFetcher.DEFAULT_PAGE_SIZE, show_default=True, help='Number of users per listed page')
+@click.option('--prefetch', Arguments.PREFETCH, envvar=Arguments.PREFETCH.upper(), type=click.IntRange(min=1), default=PageFetcher.DEFAULT_PREFETCH, show_default=True, help='Number of pages fetched ahead of processing')
 @click.option('-v', '--verbose', count=True)
 def export(**kwargs):
     """Export users from keycloak"""
@@ -94,18 +534,55 @@ def export(**kwargs):
     try:
         csvloader = CSVLoader(template=Path(kwargs.get(
             Arguments.CSV_FILE_TEMPLATE)), csvfile=None)
-        kc = Keycloak(server_url=kwargs.get(Arguments.KEYCLOAK_SERVER_URL),
-                      client_id=kwargs.get(Arguments.KEYCLOAK_CLIENT_ID),
-                      realm_name=kwargs.get(Arguments.KEYCLOAK_REALM_NAME),
-                      client_secret_key=kwargs.get(Arguments.KEYCLOAK_CLIENT_SECRET))
-        list_users = kc.get_users(csvloader=csvloader, rule='export_rules')
+        output = kwargs.get(Arguments.OUTPUT_FILE_PATH)
+        append = kwargs.get(Arguments.INCREMENTAL) and kwargs.get(
+            Arguments.OUTPUT_MODE) == Watermark.APPEND
+        if append and (is_bucket_url(output) or kwargs.get(Arguments.GZIP)):
+            raise click.BadParameter(
+                'Unable to append to a bucket or gzip output', param_hint='--output-mode')
+        watermark_path = get_watermark_path(kwargs, output)
+        watermark = Watermark.read(watermark_path) if kwargs.get(
+            Arguments.INCREMENTAL) else Watermark()
+        started = Watermark.now()
+        with Profiler.phase('apply'):
+            if kwargs.get(Arguments.ASYNC):
+                list_users = run_async(
+                    kwargs, 'get_users', csvloader=csvloader, rule='export_rules',
+                    since=watermark.timestamp, modified=kwargs.get(Arguments.MODIFIED))
+            else:
+                kc = Keycloak(server_url=kwargs.get(Arguments.KEYCLOAK_SERVER_URL),
+                              client_id=kwargs.get(Arguments.KEYCLOAK_CLIENT_ID),
+                              realm_name=kwargs.get(
+                                  Arguments.KEYCLOAK_REALM_NAME),
+                              client_secret_key=kwargs.get(
+                                  Arguments.KEYCLOAK_CLIENT_SECRET),
+                              page_size=kwargs.get(Arguments.PAGE_SIZE),
+                              prefetch=kwargs.get(Arguments.PREFETCH))
+                list_users = kc.get_users(
+                    csvloader=csvloader, rule='export_rules',
+                    since=watermark.timestamp, modified=kwargs.get(Arguments.MODIFIED))
         logger.info(f"Finishing get all list of Users Object")
-        csvloader.export_users_to_csv(
-            list_users=list_users, export_path=kwargs.get(Arguments.OUTPUT_FILE_PATH))
-        logger.info(f"Export list of Users Object to CSV file")
-        click.echo(
-            f'Export users to file: {kwargs.get(Arguments.OUTPUT_FILE_PATH)}')
-    except (CSVLoader.CSVLoaderError, KCUser.KCUserError, Keycloak.KeycloakError) as error:
+        if not kwargs.get(Arguments.INCREMENTAL):
+            with Profiler.phase('export'), open_output(kwargs, output) as export_path:
+                csvloader.export_users_to_csv(
+                    list_users=list_users, export_path=export_path)
+            logger.info(f"Export list of Users Object to CSV file")
+            click.echo(f'Export users to file: {output}')
+            return
+        list_users = watermark.select(list_users)
+        if not list_users:
+            click.echo(f'No new user since last export')
+            return
+        if not append:
+            output = get_part_output(output)
+        with Profiler.phase('export'), open_output(kwargs, output) as export_path:
+            csvloader.export_users_to_csv(
+                list_users=list_users, export_path=export_path, append=append)
+        watermark.advance(list_users, started)
+        watermark.write(watermark_path)
+        click.echo(f'Export {len(list_users)} users to file: {output}')
+    except (CSVLoader.CSVLoaderError, KCUser.KCUserError, Keycloak.KeycloakError, Watermark.WatermarkError,
+            GoogleStorage.StorageProviderERROR, S3Storage.StorageProviderERROR) as error:
         logger.error(error)
         sys.exit(1)
 
@@ -115,6 +592,9 @@ def export(**kwargs):
 @click.option('--kc-realm', Arguments.KEYCLOAK_REALM_NAME, envvar=Arguments.KEYCLOAK_REALM_NAME.upper(), required=True, help='Keycloak realm name')
 @click.option('--kc-clt', Arguments.KEYCLOAK_CLIENT_ID, envvar=Arguments.KEYCLOAK_CLIENT_ID.upper(), required=True, help='keycloak client name')
 @click.option('--kc-clt-sct', Arguments.KEYCLOAK_CLIENT_SECRET, envvar=Arguments.KEYCLOAK_CLIENT_SECRET.upper(), required=True, help='Keycloak client secret')
+@click.option('-w', '--workers', Arguments.WORKERS, envvar=Arguments.WORKERS.upper(), type=int, default=Keycloak.DEFAULT_WORKERS, show_default=True, help='Number of concurrent requests')
+@click.option('--page-size', Arguments.PAGE_SIZE, envvar=Arguments.PAGE_SIZE.upper(), type=click.IntRange(min=1), default=PageFetcher.DEFAULT_PAGE_SIZE, show_default=True, help='Number of users per listed page')
+@click.option('--prefetch', Arguments.PREFETCH, envvar=Arguments.PREFETCH.upper(), type=click.IntRange(min=1), default=PageFetcher.DEFAULT_PREFETCH, show_default=True, help='Number of pages fetched ahead of processing')
 @click.option('-v', '--verbose', count=True)
 @click.confirmation_option(prompt='Are you sure you want to drop all users on keycloak?')
 def dropall(**kwargs):
@@ -126,10 +606,17 @@ def dropall(**kwargs):
             kc = Keycloak(server_url=kwargs.get(Arguments.KEYCLOAK_SERVER_URL),
                           client_id=kwargs.get(Arguments.KEYCLOAK_CLIENT_ID),
                           realm_name=kwargs.get(Arguments.KEYCLOAK_REALM_NAME),
-                          client_secret_key=kwargs.get(Arguments.KEYCLOAK_CLIENT_SECRET))
-            kc.delete_all_users()
+                          client_secret_key=kwargs.get(
+                              Arguments.KEYCLOAK_CLIENT_SECRET),
+                          page_size=kwargs.get(Arguments.PAGE_SIZE),
+                          prefetch=kwargs.get(Arguments.PREFETCH))
+            with Profiler.phase('apply'):
+                results = kc.delete_all_users(
+                    workers=kwargs.get(Arguments.WORKERS))
             logger.info(
                 f"Droped all user on realm :{kwargs.get(Arguments.KEYCLOAK_REALM_NAME)}")
+            if echo_results(results, 'delete'):
+                sys.exit(1)
             click.echo(
                 f'Droped all user on realm :{kwargs.get(Arguments.KEYCLOAK_REALM_NAME)}')
         except Keycloak.KeycloakError as error:
@@ -146,26 +633,59 @@ def dropall(**kwargs):
 @click.option('--kc-clt', Arguments.KEYCLOAK_CLIENT_ID, envvar=Arguments.KEYCLOAK_CLIENT_ID.upper(), required=True, help='keycloak client name')
 @click.option('--kc-clt-sct', Arguments.KEYCLOAK_CLIENT_SECRET, envvar=Arguments.KEYCLOAK_CLIENT_SECRET.upper(), required=True, help='Keycloak client secret')
 @click.option('-t', '--template', Arguments.CSV_FILE_TEMPLATE, envvar=Arguments.CSV_FILE_TEMPLATE.upper(), required=True, help='Custom template file')
+@click.option('-w', '--workers', Arguments.WORKERS, envvar=Arguments.WORKERS.upper(), type=int, default=Keycloak.DEFAULT_WORKERS, show_default=True, help='Number of concurrent requests')
+@click.option('--async/--no-async', Arguments.ASYNC, envvar=Arguments.ASYNC.upper(), default=False, help='Use the asyncio keycloak client')
+@click.option('--shard', Arguments.SHARD, envvar=Arguments.SHARD.upper(), callback=parse_shard, help='Only process users of shard i/N, i from 0 to N-1')
+@click.option('--report', Arguments.REPORT_FILE, envvar=Arguments.REPORT_FILE.upper(), type=click.Path(dir_okay=False, writable=True), help='Write a json run report')
+@click.option('--page-size', Arguments.PAGE_SIZE, envvar=Arguments.PAGE_SIZE.upper(), type=click.IntRange(min=1), default=PageFetcher.DEFAULT_PAGE_SIZE, show_default=True, help='Number of users per listed page')
+@click.option('--prefetch', Arguments.PREFETCH, envvar=Arguments.PREFETCH.upper(), type=click.IntRange(min=1), default=PageFetcher.DEFAULT_PREFETCH, show_default=True, help='Number of pages fetched ahead of processing')
 @click.option('-v', '--verbose', count=True)
 def delete(**kwargs):
     """Delete users by giving fliter conditions"""
     set_log(int(kwargs.get(Arguments.VERBOSE)))
+    report = RunReport(command='delete', shard=kwargs.get(Arguments.SHARD) and str(
+        kwargs.get(Arguments.SHARD)))
     try:
         csvloader = CSVLoader(template=Path(kwargs.get(
             Arguments.CSV_FILE_TEMPLATE)), csvfile=None)
         kc = Keycloak(server_url=kwargs.get(Arguments.KEYCLOAK_SERVER_URL),
                       client_id=kwargs.get(Arguments.KEYCLOAK_CLIENT_ID),
                       realm_name=kwargs.get(Arguments.KEYCLOAK_REALM_NAME),
-                      client_secret_key=kwargs.get(Arguments.KEYCLOAK_CLIENT_SECRET))
-        list_users = kc.get_users(csvloader=csvloader, rule='delete_rules')
+                      client_secret_key=kwargs.get(
+                          Arguments.KEYCLOAK_CLIENT_SECRET),
+                      page_size=kwargs.get(Arguments.PAGE_SIZE),
+                      prefetch=kwargs.get(Arguments.PREFETCH))
+        with Profiler.phase('apply'):
+            if kwargs.get(Arguments.ASYNC):
+                list_users = run_async(
+                    kwargs, 'get_users', csvloader=csvloader, rule='delete_rules')
+            else:
+                list_users = kc.get_users(
+                    csvloader=csvloader, rule='delete_rules')
+        if kwargs.get(Arguments.SHARD) is not None:
+            list_users = kwargs.get(Arguments.SHARD).filter_users(list_users)
         list(map(lambda user: click.echo(
             f'-->{Fore.RED}{user.username}{Style.RESET_ALL}'), list_users))
         if click.confirm('Are you sure you want to delete these users on keycloak?'):
-            kc.delete_users(list_users=list_users)
-            click.echo(f'Total delete users: {len(list_users)}')
+            with Profiler.phase('apply'):
+                if kwargs.get(Arguments.ASYNC):
+                    results = run_async(
+                        kwargs, 'delete_users', list_users=list_users)
+                else:
+                    results = kc.delete_users(
+                        list_users=list_users, workers=kwargs.get(Arguments.WORKERS))
+            report.add_results(results)
+            report.status = RunReport.FINISHED
+            if echo_results(results, 'delete'):
+                sys.exit(1)
+        else:
+            report.status = RunReport.DECLINED
     except (CSVLoader.CSVLoaderError, KCUser.KCUserError, Keycloak.KeycloakError) as error:
+        report.reason = str(error)
         logger.error(error)
         sys.exit(1)
+    finally:
+        write_report(kwargs, report)
 
 
 @kcctl.command()
@@ -179,12 +699,28 @@ def delete(**kwargs):
 @click.option('--destination-file', Arguments.BUCKET_DESTINATION_FILE, envvar=Arguments.BUCKET_DESTINATION_FILE.upper(), required=True, help='Download csv file path')
 @click.option('--source-template', Arguments.BUCKET_SOURCE_TEMPLATE, envvar=Arguments.BUCKET_SOURCE_TEMPLATE.upper(), required=True, help='Custom template file path in bucket')
 @click.option('--destination--template', Arguments.BUCKET_DESTINATION_TEMPLATE, envvar=Arguments.BUCKET_DESTINATION_TEMPLATE.upper(), required=True, help='Download custom template file path')
+@click.option('-w', '--workers', Arguments.WORKERS, envvar=Arguments.WORKERS.upper(), type=int, default=Keycloak.DEFAULT_WORKERS, show_default=True, help='Number of concurrent requests')
+@click.option('--async/--no-async', Arguments.ASYNC, envvar=Arguments.ASYNC.upper(), default=False, help='Use the asyncio keycloak client')
+@click.option('--shard', Arguments.SHARD, envvar=Arguments.SHARD.upper(), callback=parse_shard, help='Only process users of shard i/N, i from 0 to N-1')
+@click.option('--report', Arguments.REPORT_FILE, envvar=Arguments.REPORT_FILE.upper(), type=click.Path(dir_okay=False, writable=True), help='Write a json run report')
+@click.option('--delta/--no-delta', Arguments.DELTA, envvar=Arguments.DELTA.upper(), default=False, help='Only apply rows added or changed since the last successful run')
+@click.option('--delta-state', Arguments.DELTA_STATE, envvar=Arguments.DELTA_STATE.upper(), type=click.Path(dir_okay=False), help='Row hashes state file, next to the users file by default')
+@click.option('--delete-removed', Arguments.DELETE_REMOVED, envvar=Arguments.DELETE_REMOVED.upper(), is_flag=True, help='With --delta, delete users whose row was removed')
+@click.option('--on-invalid', Arguments.ON_INVALID, envvar=Arguments.ON_INVALID.upper(), type=click.Choice(Arguments.ON_INVALID_VALUES), default=Arguments.ON_INVALID_VALUES[0], show_default=True, help='Abort on the first invalid value or quarantine invalid rows and sync the others')
+@click.option('--reject-file', Arguments.REJECT_FILE, envvar=Arguments.REJECT_FILE.upper(), type=click.Path(dir_okay=False), help='With --on-invalid quarantine, invalid rows file, next to the users file by default')
+@click.option('--max-reject-ratio', Arguments.MAX_REJECT_RATIO, envvar=Arguments.MAX_REJECT_RATIO.upper(), type=click.FloatRange(min=0, max=1), default=0.05, show_default=True, help='With --on-invalid quarantine, abort when more rows are invalid')
+@click.option('--hash-passwords', Arguments.HASH_PASSWORDS, envvar=Arguments.HASH_PASSWORDS.upper(), is_flag=True, help='Hash passwords locally instead of on keycloak')
+@click.option('--hash-iterations', Arguments.HASH_ITERATIONS, envvar=Arguments.HASH_ITERATIONS.upper(), type=click.IntRange(min=1), help='Hash iterations, read from the realm password policy by default')
+@click.option('--hash-algorithm', Arguments.HASH_ALGORITHM, envvar=Arguments.HASH_ALGORITHM.upper(), type=click.Choice(list(PasswordHasher.ALGORITHMS)), help='Hash algorithm, read from the realm password policy by default')
+@click.option('--hash-processes', Arguments.HASH_PROCESSES, envvar=Arguments.HASH_PROCESSES.upper(), type=click.IntRange(min=1), help='Number of hashing processes, cpu count by default')
 @click.option('-v', '--verbose', count=True)
 def bksync(**kwargs):
     """Synchronize users from bucket to keycloak"""
     set_log(int(kwargs.get(Arguments.VERBOSE)))
-    if kwargs.get(Arguments.STORAGE_TYPE) == Arguments.STORAGE_TYPE_VALUES[0]:
-        try:
+    report = RunReport(command='bksync', shard=kwargs.get(Arguments.SHARD) and str(
+        kwargs.get(Arguments.SHARD)))
+    try:
+        if kwargs.get(Arguments.STORAGE_TYPE) == Arguments.STORAGE_TYPE_VALUES[0]:
             googlestorage = GoogleStorage(
                 type=kwargs.get(Arguments.STORAGE_TYPE))
             googlestorage.download(
@@ -200,25 +736,60 @@ def bksync(**kwargs):
                 destination_file=Path(kwargs.get(
                     Arguments.BUCKET_DESTINATION_TEMPLATE))
             )
-        except GoogleStorage.StorageProviderERROR as error:
-            logger.error(error)
-            sys.exit(1)
-    else:
-        click.echo("Only support google storage")
-
-    try:
+        else:
+            click.echo("Only support google storage")
         csvloader = CSVLoader(template=Path(kwargs.get(Arguments.BUCKET_DESTINATION_TEMPLATE)),
                               csvfile=Path(kwargs.get(Arguments.BUCKET_DESTINATION_FILE)))
-        csvloader.validate()
-        logger.info(f"CSV file is valid")
-        list_users = KCUser.create_list_users(csvloader)
+        select_shard(kwargs, csvloader)
+        state_path = get_state_path(
+            kwargs, Path(kwargs.get(Arguments.BUCKET_DESTINATION_FILE)))
+        bucket_state_path = PurePath(kwargs.get(Arguments.BUCKET_SOURCE_FILE)).parent / \
+            state_path.name
+        if kwargs.get(Arguments.DELTA) and GoogleStorage.exists(kwargs.get(Arguments.BUCKET_NAME), bucket_state_path):
+            GoogleStorage.download(bucket_name=kwargs.get(Arguments.BUCKET_NAME),
+                                   source_file=bucket_state_path, destination_file=state_path)
+        delta = select_delta(kwargs, csvloader, state_path)
+        reject_path = get_reject_path(
+            kwargs, csvloader, Path(kwargs.get(Arguments.BUCKET_DESTINATION_FILE)))
+        if validate_rows(kwargs, csvloader, reject_path, report, delta):
+            GoogleStorage.upload(bucket_name=kwargs.get(Arguments.BUCKET_NAME), source_file=reject_path,
+                                 destination_file=PurePath(kwargs.get(Arguments.BUCKET_SOURCE_FILE)).parent / reject_path.name)
+        with Profiler.phase('build'):
+            list_users = KCUser.create_list_users(csvloader)
         logger.info(f"Finish creating User Object")
-        kc = Keycloak(server_url=kwargs.get(Arguments.KEYCLOAK_SERVER_URL),
-                      client_id=kwargs.get(Arguments.KEYCLOAK_CLIENT_ID),
-                      realm_name=kwargs.get(Arguments.KEYCLOAK_REALM_NAME),
-                      client_secret_key=kwargs.get(Arguments.KEYCLOAK_CLIENT_SECRET))
-        kc.add_users(list_users)
-        click.echo(f'Total update/add users: {len(list_users)}')
-    except (CSVLoader.CSVLoaderError, KCUser.KCUserError, Keycloak.KeycloakError) as error:
+        hash_passwords(kwargs, list_users)
+        failed = add_users(kwargs, list_users, report)
+        failed += apply_delta(kwargs, delta, state_path, report)
+        if delta is not None:
+            GoogleStorage.upload(bucket_name=kwargs.get(Arguments.BUCKET_NAME),
+                                 source_file=state_path, destination_file=bucket_state_path)
+        report.status = RunReport.FINISHED
+        if failed:
+            sys.exit(1)
+    except (CSVLoader.CSVLoaderError, KCUser.KCUserError, Keycloak.KeycloakError, RowDelta.RowDeltaError,
+            PasswordHasher.PasswordHasherError, GoogleStorage.StorageProviderERROR) as error:
+        report.reason = str(error)
+        logger.error(error)
+        sys.exit(1)
+    finally:
+        write_report(kwargs, report)
+
+
+@kcctl.command(name='merge-reports')
+@click.argument(Arguments.REPORT_FILES, nargs=-1, required=True, type=click.Path(exists=True, dir_okay=False))
+@click.option('-o', '--output', Arguments.OUTPUT_FILE_PATH, envvar=Arguments.OUTPUT_FILE_PATH.upper(), required=True, help='Merged report path')
+@click.option('-v', '--verbose', count=True)
+def merge_reports(**kwargs):
+    """Merge the run reports of the shards of one run"""
+    set_log(int(kwargs.get(Arguments.VERBOSE)))
+    try:
+        report = RunReport.merge(
+            [RunReport.read(Path(path)) for path in kwargs.get(Arguments.REPORT_FILES)])
+        report.write(Path(kwargs.get(Arguments.OUTPUT_FILE_PATH)))
+    except RunReport.RunReportError as error:
         logger.error(error)
         sys.exit(1)
+    click.echo(
+        f'Total {report.command} users: {report.succeeded}, failed: {len(report.failed)}, shards: {len(report.shards)}, status: {report.status}')
+    if report.failed or not report.complete or report.status != RunReport.FINISHED:
+        sys.exit(1)
@@ -2,9 +2,31 @@ from keycloak_sync.model.csvloader import CSVLoader
 from keycloak_sync.model.kc import Keycloak
 from keycloak_sync.model.kcuser import KCUser
 from keycloak_sync.model.googlestorage import GoogleStorage
+from keycloak_sync.model.s3storage import S3Storage
+from keycloak_sync.model.fileformat import FileFormat
+from keycloak_sync.model.kcquery import KCQuery
+from keycloak_sync.model.kcasync import AsyncKeycloak
+from keycloak_sync.model.profiler import Profiler
+from keycloak_sync.model.shard import Shard
+from keycloak_sync.model.report import RunReport
+from keycloak_sync.model.rowdelta import RowDelta
+from keycloak_sync.model.passwordhasher import PasswordHasher
+from keycloak_sync.model.watermark import Watermark
+from keycloak_sync.model.pagefetcher import PageFetcher
 __all__ = [
     "CSVLoader",
     "Keycloak",
     "KCUser",
-    "GoogleStorage"
+    "GoogleStorage",
+    "S3Storage",
+    "FileFormat",
+    "KCQuery",
+    "AsyncKeycloak",
+    "Profiler",
+    "Shard",
+    "RunReport",
+    "RowDelta",
+    "PasswordHasher",
+    "Watermark",
+    "PageFetcher"
 ]
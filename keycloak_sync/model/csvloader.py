@@ -1,24 +1,36 @@
+import hashlib
+import json
 import logging
 from logging import log
-from typing import Union
+from typing import BinaryIO, Iterator, Tuple, Union
 import cerberus
 import coloredlogs
 import pandas as pd
 import numpy as np
 import yaml
 from keycloak_sync.abstract_model.loader import Loader
+from keycloak_sync.model.fileformat import FileFormat
+from keycloak_sync.model.profiler import Profiler
 from pathlib import Path
 logger = logging.getLogger(__name__)
 
 
 class Template(Loader):
     FORMAT = 'format'
+    ENCODING = 'encoding'
     SEPARATOR = 'separator'
     HEADER = 'header'
+    IGNORE_N_ROWS = 'ignore_n_rows'
     DATA_MODEL = 'data_model'
     DATA_MODEL_NAME = 'name'
+    DATA_MODEL_TYPE = 'type'
+    DATA_MODEL_TYPE_STRING = 'string'
+    DATA_MODEL_REGEX = 'regex'
+    DATA_MODEL_NULLABLE = 'nullable'
     MAPPER = 'mapper'
     MAPPER_USERNAME = "username"
+    MAPPER_EMAIL = 'email'
+    MAPPER_ROLE = 'role'
     MAPPER_ATTRIBUTES = 'attributes'
     MAPPER_ATTRIBUTES_KEY = 'key'
     MAPPER_ATTRIBUTES_VALUE = 'value'
@@ -26,6 +38,8 @@ class Template(Loader):
     RULE_IDENTIFIER = 'identifier'
     RULE_IDENTIFIER_NAME = 'name'
     EXPORT = 'export_rules'
+    EXPORT_FORMAT = 'format'
+    EXPORT_ENCODING = 'encoding'
     EXPORT_SEPARATOR = 'separator'
     EXPORT_HEADER = 'header'
     EXPORT_MAPPER = 'mapper'
@@ -38,7 +52,9 @@ class CSVLoader(Loader):
     Args:
         Loader (object): a basic loader
     """
-    FILE_FORMAT = 'CSV'
+    FILE_FORMATS = FileFormat.READ_FORMATS
+    EXPORT_FORMATS = FileFormat.WRITE_FORMATS
+    REJECT_REASON = 'reject_reason'
 
     class CSVLoaderError(Exception):
         """Exception raised for errors in the CSVLoader.
@@ -51,8 +67,10 @@ class CSVLoader(Loader):
             self.message = message
 
     def __init__(self, template: Path, csvfile: Union[Path, None]):
-        self._load_template(template=template)
-        self._load_csvfile(csvfile=csvfile)
+        with Profiler.phase('template'):
+            self._load_template(template=template)
+        with Profiler.phase('parse'):
+            self._load_csvfile(csvfile=csvfile)
 
     @property
     def data(self):
@@ -87,15 +105,39 @@ class CSVLoader(Loader):
                 f'template file path does not exist')
 
     def _load_csvfile(self, csvfile: Union[Path, None]):
+        """Load users file with the format declared in template
+
+        Args:
+            csvfile (Union[Path, None]): users file path
+
+        Raises:
+            CSVLoader.CSVLoaderError: Exception raised for errors in the CSVLoader
+        """
         if csvfile is not None:
+            file_format = str(self._template.get(
+                Template.FORMAT, FileFormat.CSV)).upper()
+            if file_format == FileFormat.CSV and not self._template.get(Template.SEPARATOR):
+                raise CSVLoader.CSVLoaderError(
+                    f'Template key {Template.SEPARATOR} is required by {FileFormat.CSV} files')
             try:
-                separator = self._template[Template.SEPARATOR]
-                header = self._template[Template.HEADER]
-                self._data = pd.read_csv(filepath_or_buffer=csvfile,
-                                         sep=separator, header=header, skip_blank_lines=True)
-                self._data = self._data.replace({np.nan: None})
+                string_columns = [data_model[Template.DATA_MODEL_NAME]
+                                  for data_model in self._template.get(Template.DATA_MODEL) or []
+                                  if data_model.get(Template.DATA_MODEL_TYPE) == Template.DATA_MODEL_TYPE_STRING]
+                self._data = FileFormat.read(file_format=file_format,
+                                             path=csvfile,
+                                             separator=self._template.get(
+                                                 Template.SEPARATOR),
+                                             header=self._template.get(
+                                                 Template.HEADER, 0),
+                                             encoding=self._template.get(
+                                                 Template.ENCODING),
+                                             ignore_n_rows=self._template.get(
+                                                 Template.IGNORE_N_ROWS, 0),
+                                             string_columns=string_columns)
             except (TypeError, FileNotFoundError):
                 raise CSVLoader.CSVLoaderError(f'CSV File path does not exist')
+            except FileFormat.FileFormatError as error:
+                raise CSVLoader.CSVLoaderError(error.message)
 
     @staticmethod
     def set_log_level(level: str):
@@ -188,6 +230,22 @@ class CSVLoader(Loader):
         else:
             return False
 
+    @staticmethod
+    def _get_user_attribute(user, key: str):
+        """get one attribute of a user, custom attributes shared by compact users override its own
+
+        Args:
+            user (KCUser): a user instance
+            key (str): attribute key
+
+        Returns:
+            attribute value
+        """
+        custom_attributes = getattr(user, 'custom_attributes', None)
+        if custom_attributes and key in custom_attributes:
+            return custom_attributes[key]
+        return user.attributes[key]
+
     @staticmethod
     def _read_users_into_dataframe(key: str, value: Union[list, str], list_users: list, dataframe: dict):
         """read users object into dataframe
@@ -202,7 +260,7 @@ class CSVLoader(Loader):
             for attribute in value:
                 dataframe[attribute[Template.MAPPER_ATTRIBUTES_VALUE]] = []
                 list(map(lambda user: dataframe[attribute[Template.MAPPER_ATTRIBUTES_VALUE]].append(
-                    user.attributes[attribute[Template.MAPPER_ATTRIBUTES_KEY]]), list_users))
+                    CSVLoader._get_user_attribute(user, attribute[Template.MAPPER_ATTRIBUTES_KEY])), list_users))
         else:
             dataframe[value] = []
             for user in list_users:
@@ -214,8 +272,22 @@ class CSVLoader(Loader):
         Raises:
             CSVLoader.CSVLoaderError: Exception raised for errors in the CSVLoader
         """
-        if not self._template[Template.FORMAT].upper() == CSVLoader.FILE_FORMAT:
-            raise CSVLoader.CSVLoaderError('Only support CSV file')
+        for column_name, column_schema in self._column_schemas():
+            CSVLoader._validate_column(
+                column=self._data[column_name], column_schema=column_schema)
+
+    def _column_schemas(self) -> Iterator[Tuple[str, dict]]:
+        """check template and file columns then get the schema of each column
+
+        Raises:
+            CSVLoader.CSVLoaderError: Exception raised for errors in the CSVLoader
+
+        Yields:
+            Iterator[Tuple[str, dict]]: column name, column schema used by cerberus
+        """
+        if not self._template[Template.FORMAT].upper() in CSVLoader.FILE_FORMATS:
+            raise CSVLoader.CSVLoaderError(
+                f'Only support {", ".join(CSVLoader.FILE_FORMATS)} files')
         try:
             data_models = self._template[Template.DATA_MODEL]
             column_names = self._data.columns.tolist()
@@ -224,17 +296,145 @@ class CSVLoader(Loader):
                 'template file should contain label: data_model')
         for data_model in data_models:
             if CSVLoader._check_data_model(data_model=data_model, column_names=column_names):
-                column_schema = CSVLoader._get_column_schema_from_data_model(
-                    data_model)
-                column_name = data_model[Template.DATA_MODEL_NAME]
-                CSVLoader._validate_column(
-                    column=self._data[column_name], column_schema=column_schema)
+                yield data_model[Template.DATA_MODEL_NAME], CSVLoader._get_column_schema_from_data_model(data_model)
             else:
                 raise CSVLoader.CSVLoaderError(
                     f"Column {data_model[Template.DATA_MODEL_NAME]} does not exist in file")
 
+    @staticmethod
+    def _find_column_errors(column: pd.Series, column_schema: dict) -> dict:
+        """validate one column and collect the errors of every row
+
+        Args:
+            column (pd.Series): one column serie
+            column_schema (dict): column schema used by cerberus
+
+        Raises:
+            CSVLoader.CSVLoaderError: Exception raised for errors in the CSVLoader
+
+        Returns:
+            dict: {row position: list of error messages}
+        """
+        try:
+            validator = cerberus.Validator(column_schema)
+        except cerberus.schema.SchemaError as error:
+            raise CSVLoader.CSVLoaderError(f'Unknown rule: {error}')
+        if validator.validate(CSVLoader._change_column_to_dict(column)):
+            return {}
+        rows_errors = {}
+        for error in validator.errors.get(column.name, []):
+            if not isinstance(error, dict):
+                raise CSVLoader.CSVLoaderError(
+                    f'Column :{column.name} is invalid: {error}')
+            rows_errors.update(error)
+        return rows_errors
+
+    def reject_format(self) -> str:
+        """get the format of the reject file
+
+        Returns:
+            str: template format when it can be written, parquet otherwise
+        """
+        file_format = self._template.get(Template.FORMAT, FileFormat.CSV).upper()
+        return file_format if file_format in FileFormat.WRITE_FORMATS else FileFormat.PARQUET
+
+    def quarantine(self, reject_path: Union[str, Path], max_reject_ratio: float,
+                   total_rows: Union[int, None] = None) -> pd.DataFrame:
+        """remove invalid rows from data and write them with their reasons to a reject file,
+        every column is validated once as in validate
+
+        Args:
+            reject_path (Union[str, Path]): reject file, written in reject_format
+            max_reject_ratio (float): maximum ratio of invalid rows
+            total_rows (Union[int, None]): number of rows of the file the ratio is computed on,
+                the loaded rows by default, e.g. more than loaded after a delta selection
+
+        Raises:
+            CSVLoader.CSVLoaderError: too many invalid rows, or template or file is invalid
+
+        Returns:
+            pd.DataFrame: rejected rows with a reject_reason column
+        """
+        reasons = {}
+        for column_name, column_schema in self._column_schemas():
+            for position, messages in CSVLoader._find_column_errors(
+                    column=self._data[column_name], column_schema=column_schema).items():
+                reasons.setdefault(position, []).extend(
+                    f'{column_name}: {message}' for message in messages)
+        rejected = np.zeros(len(self._data), dtype=bool)
+        rejected[list(reasons)] = True
+        rejects = self._data[rejected].copy()
+        rejects[CSVLoader.REJECT_REASON] = [
+            '; '.join(reasons[position]) for position in np.flatnonzero(rejected)]
+        total_rows = len(self._data) if total_rows is None else total_rows
+        ratio = len(rejects) / total_rows if total_rows else 0
+        if len(rejects):
+            try:
+                FileFormat.write(file_format=self.reject_format(),
+                                 dataframe=rejects, path=reject_path,
+                                 separator=self._template.get(
+                                     Template.SEPARATOR),
+                                 encoding=self._template.get(Template.ENCODING))
+            except FileFormat.FileFormatError as error:
+                raise CSVLoader.CSVLoaderError(error.message)
+            logger.warning(
+                f'Reject {len(rejects)} invalid rows ({ratio:.2%}) to {reject_path}')
+        if ratio > max_reject_ratio:
+            raise CSVLoader.CSVLoaderError(
+                f'{len(rejects)} invalid rows ({ratio:.2%}) exceed maximum reject ratio {max_reject_ratio:.2%}')
+        self._data = self._data[~rejected].reset_index(drop=True)
+        return rejects
+
+    def mapped_columns(self) -> list:
+        """list the columns read by the mapper
+
+        Returns:
+            list: sorted column names
+        """
+        columns = set()
+        for parameter, column_name in self._template[Template.MAPPER].items():
+            if parameter == Template.MAPPER_ATTRIBUTES and isinstance(column_name, list):
+                columns.update(attribute[Template.MAPPER_ATTRIBUTES_VALUE]
+                               for attribute in column_name)
+            else:
+                columns.add(column_name)
+        return sorted(columns)
+
+    def usernames(self) -> pd.Series:
+        """get lower-cased usernames of the rows
+
+        Returns:
+            pd.Series: one username per row, empty string when missing
+        """
+        column = self._template[Template.MAPPER][Template.MAPPER_USERNAME]
+        return self._data[column].fillna('').astype(str).str.lower()
+
+    def row_hashes(self) -> pd.Series:
+        """compute a stable 64 bits hash of every row over the mapped columns
+
+        Raises:
+            CSVLoader.CSVLoaderError: Exception raised for errors in the CSVLoader
+
+        Returns:
+            pd.Series: one uint64 hash per row
+        """
+        try:
+            return pd.util.hash_pandas_object(self._data[self.mapped_columns()], index=False)
+        except KeyError as error:
+            raise CSVLoader.CSVLoaderError(
+                f'Column {error} does not exist in file')
+
+    def mapping_fingerprint(self) -> str:
+        """fingerprint of the template parts which change users without changing rows
+
+        Returns:
+            str: sha256 of mapper and custom attributes
+        """
+        return hashlib.sha256(json.dumps([self._template.get(Template.MAPPER), self._template.get(Template.CUSTOM_ATTRIBUTES)],
+                                         sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
     def load_identifier(self, rule: str) -> dict:
-        """loader identifier to fliter users
+        """loader identifier to fliter users, identifier can be one rule or a list of rules
 
         Args:
             rule (str): export or delete
@@ -245,14 +445,21 @@ class CSVLoader(Loader):
         Returns:
             dict: a shema used by cerberus
         """
-        if self._template[rule]:
-            if self._template[rule][Template.RULE_IDENTIFIER]:
-                name = self._template[rule][Template.RULE_IDENTIFIER][Template.RULE_IDENTIFIER_NAME]
-                rules = {}
-                for rule_name, rule in self._template[rule][Template.RULE_IDENTIFIER].items():
-                    if rule_name != Template.RULE_IDENTIFIER_NAME:
-                        rules[rule_name] = rule
-                return {name: rules}
+        if self._template.get(rule):
+            identifiers = self._template[rule].get(Template.RULE_IDENTIFIER)
+            if identifiers:
+                if isinstance(identifiers, dict):
+                    identifiers = [identifiers]
+                schema = {}
+                for identifier in identifiers:
+                    try:
+                        name = identifier[Template.RULE_IDENTIFIER_NAME]
+                    except KeyError:
+                        raise CSVLoader.CSVLoaderError(
+                            f'identifier of {rule} should contains label: name')
+                    schema[name] = {rule_name: value for rule_name, value in identifier.items()
+                                    if rule_name != Template.RULE_IDENTIFIER_NAME}
+                return schema
             else:
                 raise CSVLoader.CSVLoaderError(
                     f'Export_rules file should contains identifier to fliter users')
@@ -260,17 +467,32 @@ class CSVLoader(Loader):
             raise CSVLoader.CSVLoaderError(
                 f'template file should contains {rule}')
 
-    def export_users_to_csv(self, list_users: list, export_path: str):
-        """export users object to csv
+    def export_users_to_csv(self, list_users: list, export_path: Union[str, Path, BinaryIO], append: bool = False):
+        """export users object to csv, parquet or jsonl file following export_rules format
 
         Args:
             list_users (list): list of users
-            export_path (str): path where csv file in
+            export_path (Union[str, Path, BinaryIO]): path where csv file in, or binary stream such as an upload
+            append (bool): append users to an existing csv or jsonl file
+
+        Raises:
+            CSVLoader.CSVLoaderError: Exception raised for errors in the CSVLoader
         """
         dataframe = {}
-        list_mapper = self._template[Template.EXPORT][Template.EXPORT_MAPPER]
+        export_rules = self._template[Template.EXPORT]
+        list_mapper = export_rules[Template.EXPORT_MAPPER]
         for user_parameter, column_name in list_mapper.items():
             CSVLoader._read_users_into_dataframe(
                 user_parameter, column_name, list_users, dataframe)
-        pd.DataFrame(data=dataframe).to_csv(
-            path_or_buf=export_path, sep=self._template[Template.EXPORT][Template.EXPORT_SEPARATOR], header=self._template[Template.EXPORT][Template.EXPORT_HEADER], index=False)
+        try:
+            FileFormat.write(file_format=export_rules.get(Template.EXPORT_FORMAT, FileFormat.CSV),
+                             dataframe=pd.DataFrame(data=dataframe),
+                             path=export_path,
+                             separator=export_rules.get(
+                                 Template.EXPORT_SEPARATOR),
+                             header=export_rules.get(
+                                 Template.EXPORT_HEADER, True),
+                             encoding=export_rules.get(Template.EXPORT_ENCODING),
+                             append=append)
+        except FileFormat.FileFormatError as error:
+            raise CSVLoader.CSVLoaderError(error.message)
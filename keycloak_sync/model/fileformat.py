@@ -0,0 +1,242 @@
+import io
+import logging
+from contextlib import contextmanager
+from pathlib import Path
+from typing import BinaryIO, Iterator, TextIO, Union
+
+import coloredlogs
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pacsv
+import pyarrow.parquet as pq
+
+logger = logging.getLogger(__name__)
+
+
+class FileFormat:
+    """Read and write users files in the formats supported by the templates"""
+    CSV = 'CSV'
+    PARQUET = 'PARQUET'
+    ARROW = 'ARROW'
+    JSONL = 'JSONL'
+    READ_FORMATS = [CSV, PARQUET, ARROW, JSONL]
+    WRITE_FORMATS = [CSV, PARQUET, JSONL]
+    DEFAULT_ENCODING = 'utf-8'
+
+    class FileFormatError(Exception):
+        """Exception raised for errors in the FileFormat.
+
+        Attributes:
+            message -- explanation of the error
+        """
+
+        def __init__(self, message):
+            self.message = message
+
+    @staticmethod
+    def set_log_level(level: str):
+        """Set log level
+
+        Args:
+            level (str): log's level
+        """
+        coloredlogs.install(level=level, logger=logger)
+
+    @staticmethod
+    def read_csv(path: Path, separator: str, header: Union[int, None] = 0, encoding: str = DEFAULT_ENCODING,
+                 ignore_n_rows: int = 0, string_columns: Union[list, None] = None) -> pd.DataFrame:
+        """read csv file with the pyarrow engine
+
+        Args:
+            path (Path): csv file path
+            separator (str): column separator
+            header (Union[int, None]): line number of the header, None when file has no header
+            encoding (str): file encoding
+            ignore_n_rows (int): number of lines to skip at the beginning of the file
+            string_columns (Union[list, None]): columns which are always read as string
+
+        Returns:
+            pd.DataFrame: loaded data, null values are None
+        """
+        skip_rows = int(ignore_n_rows or 0) + int(header or 0)
+        read_options = pacsv.ReadOptions(skip_rows=skip_rows,
+                                         autogenerate_column_names=header is None,
+                                         encoding=encoding or FileFormat.DEFAULT_ENCODING)
+        parse_options = pacsv.ParseOptions(delimiter=separator)
+        convert_options = pacsv.ConvertOptions(
+            column_types={name: pa.string() for name in string_columns or []},
+            strings_can_be_null=True)
+        table = pacsv.read_csv(str(path), read_options=read_options,
+                               parse_options=parse_options, convert_options=convert_options)
+        logger.info(f'Read {table.num_rows} rows from csv file {path}')
+        return FileFormat._table_to_dataframe(table)
+
+    @staticmethod
+    def read_parquet(path: Path) -> pd.DataFrame:
+        """read parquet file through a memory map
+
+        Args:
+            path (Path): parquet file path
+
+        Returns:
+            pd.DataFrame: loaded data, null values are None
+        """
+        table = pq.read_table(str(path), memory_map=True)
+        logger.info(f'Read {table.num_rows} rows from parquet file {path}')
+        return FileFormat._table_to_dataframe(table)
+
+    @staticmethod
+    def read_arrow(path: Path) -> pd.DataFrame:
+        """read arrow IPC file, buffers are zero-copy views on the memory map
+
+        Args:
+            path (Path): arrow IPC file path
+
+        Returns:
+            pd.DataFrame: loaded data, null values are None
+        """
+        with pa.memory_map(str(path), 'r') as source:
+            table = pa.ipc.open_file(source).read_all()
+            logger.info(f'Read {table.num_rows} rows from arrow file {path}')
+            return FileFormat._table_to_dataframe(table)
+
+    @staticmethod
+    def read_jsonl(path: Path, encoding: str = DEFAULT_ENCODING) -> pd.DataFrame:
+        """read JSON lines file, one user per line
+
+        Args:
+            path (Path): jsonl file path
+            encoding (str): file encoding
+
+        Returns:
+            pd.DataFrame: loaded data, null values are None
+        """
+        dataframe = pd.read_json(path, orient='records', lines=True, dtype=False,
+                                 encoding=encoding or FileFormat.DEFAULT_ENCODING)
+        logger.info(f'Read {len(dataframe)} rows from jsonl file {path}')
+        return dataframe.replace({np.nan: None})
+
+    @staticmethod
+    def _table_to_dataframe(table: pa.Table) -> pd.DataFrame:
+        """convert an arrow table into a dataframe
+
+        Args:
+            table (pa.Table): arrow table
+
+        Returns:
+            pd.DataFrame: dataframe whose null values are None
+        """
+        return table.to_pandas().replace({np.nan: None})
+
+    @staticmethod
+    def read(file_format: str, path: Path, separator: str = None, header: Union[int, None] = 0,
+             encoding: str = DEFAULT_ENCODING, ignore_n_rows: int = 0,
+             string_columns: Union[list, None] = None) -> pd.DataFrame:
+        """read a users file
+
+        Args:
+            file_format (str): one of READ_FORMATS
+            path (Path): file path
+            separator (str): column separator, only used by csv
+            header (Union[int, None]): line number of the header, only used by csv
+            encoding (str): file encoding, used by csv and jsonl
+            ignore_n_rows (int): number of lines to skip, only used by csv
+            string_columns (Union[list, None]): columns read as string, only used by csv
+
+        Raises:
+            FileFormat.FileFormatError: Exception raised for errors in the FileFormat
+
+        Returns:
+            pd.DataFrame: loaded data, null values are None
+        """
+        file_format = file_format.upper()
+        try:
+            if file_format == FileFormat.CSV:
+                return FileFormat.read_csv(path=path, separator=separator, header=header, encoding=encoding,
+                                           ignore_n_rows=ignore_n_rows, string_columns=string_columns)
+            if file_format == FileFormat.PARQUET:
+                return FileFormat.read_parquet(path=path)
+            if file_format == FileFormat.ARROW:
+                return FileFormat.read_arrow(path=path)
+            if file_format == FileFormat.JSONL:
+                return FileFormat.read_jsonl(path=path, encoding=encoding)
+        except (pa.ArrowInvalid, ValueError, UnicodeDecodeError) as error:
+            raise FileFormat.FileFormatError(
+                f'Unable to read {file_format} file {path}: {error}')
+        raise FileFormat.FileFormatError(
+            f'Only support {", ".join(FileFormat.READ_FORMATS)} files')
+
+    @staticmethod
+    @contextmanager
+    def _text_stream(stream: BinaryIO, encoding: str) -> Iterator[TextIO]:
+        """write text into a binary stream, the stream is left open
+
+        Args:
+            stream (BinaryIO): binary stream
+            encoding (str): text encoding
+
+        Yields:
+            Iterator[TextIO]: text stream
+        """
+        text = io.TextIOWrapper(stream, encoding=encoding or FileFormat.DEFAULT_ENCODING,
+                                newline='', write_through=True)
+        try:
+            yield text
+            text.flush()
+        finally:
+            text.detach()
+
+    @staticmethod
+    def write(file_format: str, dataframe: pd.DataFrame, path: Union[str, Path, BinaryIO], separator: str = ';',
+              header: bool = True, encoding: str = DEFAULT_ENCODING, append: bool = False):
+        """write a dataframe into a users file
+
+        Args:
+            file_format (str): one of WRITE_FORMATS
+            dataframe (pd.DataFrame): data to write
+            path (Union[str, Path, BinaryIO]): destination path, or binary stream such as an upload
+            separator (str): column separator, only used by csv
+            header (bool): write column names, only used by csv
+            encoding (str): file encoding, used by csv and jsonl
+            append (bool): append rows to an existing csv or jsonl file, csv header is only written once
+
+        Raises:
+            FileFormat.FileFormatError: Exception raised for errors in the FileFormat
+        """
+        file_format = file_format.upper()
+        stream = hasattr(path, 'write')
+        if stream and append:
+            raise FileFormat.FileFormatError(
+                'Unable to append to a stream')
+        exists = append and Path(path).exists() and Path(path).stat().st_size > 0
+        if file_format == FileFormat.CSV:
+            if stream:
+                with FileFormat._text_stream(path, encoding) as text:
+                    dataframe.to_csv(path_or_buf=text, sep=separator,
+                                     header=header, index=False)
+            else:
+                dataframe.to_csv(path_or_buf=path, sep=separator, header=header and not exists, index=False,
+                                 encoding=encoding or FileFormat.DEFAULT_ENCODING, mode='a' if append else 'w')
+        elif file_format == FileFormat.PARQUET:
+            if append:
+                raise FileFormat.FileFormatError(
+                    f'Unable to append to {FileFormat.PARQUET} file {path}')
+            pq.write_table(pa.Table.from_pandas(
+                dataframe, preserve_index=False), path if stream else str(path))
+        elif file_format == FileFormat.JSONL:
+            lines = dataframe.to_json(
+                orient='records', lines=True, force_ascii=False) if len(dataframe) else ''
+            # older pandas do not end the last line, appended rows would be joined to it
+            lines = lines if not lines or lines.endswith('\n') else lines + '\n'
+            if stream:
+                with FileFormat._text_stream(path, encoding) as text:
+                    text.write(lines)
+            else:
+                with open(path, 'a' if append else 'w', encoding=encoding or FileFormat.DEFAULT_ENCODING) as text:
+                    text.write(lines)
+        else:
+            raise FileFormat.FileFormatError(
+                f'Only support {", ".join(FileFormat.WRITE_FORMATS)} export files')
+        logger.info(
+            f'{"Append" if append else "Write"} {len(dataframe)} rows to {file_format} file {path}')
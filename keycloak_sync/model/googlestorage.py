@@ -1,8 +1,10 @@
 import logging
+from contextlib import contextmanager
 from pathlib import Path, PurePath
+from typing import BinaryIO, Iterator
 
 import coloredlogs
-from google.api_core.exceptions import NotFound
+from google.api_core.exceptions import GoogleAPIError
 from google.auth.exceptions import DefaultCredentialsError
 from google.cloud import storage
 from keycloak_sync.abstract_model.storageprovider import StorageProvider
@@ -11,6 +13,9 @@ logger = logging.getLogger(__name__)
 
 
 class GoogleStorage(StorageProvider):
+    # resumable upload chunk, a multiple of 256 KiB
+    CHUNK_SIZE = 8 * 2 ** 20
+
     @staticmethod
     def set_log_level(level: str):
         """Set log level
@@ -38,5 +43,82 @@ class GoogleStorage(StorageProvider):
             blob = bucket.blob(str(source_file))
             blob.download_to_filename(str(destination_file))
             logger.info(f"Download {str(destination_file)}")
-        except (DefaultCredentialsError, NotFound) as error:
+        except (DefaultCredentialsError, GoogleAPIError) as error:
+            raise GoogleStorage.StorageProviderERROR(error)
+
+    @staticmethod
+    def upload(bucket_name: str, source_file: Path, destination_file: PurePath):
+        """Upload file to bucket
+
+        Args:
+            bucket_name (str): bucket name
+            source_file (Path): local file path
+            destination_file (PurePath): destination path in bucket
+
+        Raises:
+            GoogleStorage.StorageProviderERROR: Exception raised for errors in the StorageProvider
+        """
+        try:
+            storage_client = storage.Client()
+            bucket = storage_client.bucket(bucket_name)
+            blob = bucket.blob(str(destination_file))
+            blob.upload_from_filename(str(source_file))
+            logger.info(f"Upload {str(destination_file)}")
+        except (DefaultCredentialsError, GoogleAPIError) as error:
+            raise GoogleStorage.StorageProviderERROR(error)
+
+    @staticmethod
+    def exists(bucket_name: str, source_file: PurePath) -> bool:
+        """Check a file exists in bucket
+
+        Args:
+            bucket_name (str): bucket name
+            source_file (PurePath): file path in bucket
+
+        Raises:
+            GoogleStorage.StorageProviderERROR: Exception raised for errors in the StorageProvider
+
+        Returns:
+            bool: true when file exists
+        """
+        try:
+            storage_client = storage.Client()
+            return storage_client.bucket(bucket_name).blob(str(source_file)).exists()
+        except (DefaultCredentialsError, GoogleAPIError) as error:
+            raise GoogleStorage.StorageProviderERROR(error)
+
+    @staticmethod
+    @contextmanager
+    def open_writer(bucket_name: str, destination_file: PurePath, chunk_size: int = CHUNK_SIZE) -> Iterator[BinaryIO]:
+        """Stream a file to bucket with a resumable upload, the file is only created
+        when the block exits without error
+
+        Args:
+            bucket_name (str): bucket name
+            destination_file (PurePath): destination path in bucket
+            chunk_size (int): size of uploaded chunks
+
+        Raises:
+            GoogleStorage.StorageProviderERROR: Exception raised for errors in the StorageProvider
+
+        Yields:
+            Iterator[BinaryIO]: binary writer
+        """
+        try:
+            storage_client = storage.Client()
+            blob = storage_client.bucket(bucket_name).blob(
+                str(destination_file), chunk_size=chunk_size)
+            writer = blob.open('wb', ignore_flush=True)
+        except (DefaultCredentialsError, GoogleAPIError) as error:
+            raise GoogleStorage.StorageProviderERROR(error)
+        try:
+            yield writer
+            writer.close()
+            logger.info(f"Upload {str(destination_file)}")
+        except (DefaultCredentialsError, GoogleAPIError) as error:
+            # closing would finalize the partial upload, an unfinished session is discarded
+            writer.terminate()
             raise GoogleStorage.StorageProviderERROR(error)
+        except BaseException:
+            writer.terminate()
+            raise
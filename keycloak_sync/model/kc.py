@@ -1,13 +1,18 @@
 import logging
-from datetime import datetime
-from typing import Union
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Iterable, Iterator, Union
 
-import cerberus
 import coloredlogs
 import pandas as pd
+from dateutil import tz
 from keycloak import KeycloakAdmin, exceptions
 from keycloak_sync.model.csvloader import CSVLoader, Template
+from keycloak_sync.model.kcquery import KCQuery
 from keycloak_sync.model.kcuser import KCUser
+from keycloak_sync.model.pagefetcher import PageFetcher
 
 logger = logging.getLogger(__name__)
 
@@ -16,14 +21,8 @@ def connect(func):
     """a wrapper for connecting"""
 
     def wrapper(self, *args, **kwargs):
-        try:
-            self.kc_admin = KeycloakAdmin(server_url=self.server_url,
-                                          client_id=self.client_id,
-                                          realm_name=self.realm_name,
-                                          client_secret_key=self.client_secret_key,
-                                          verify=True)
-        except (exceptions.KeycloakConnectionError, exceptions.KeycloakGetError):
-            raise Keycloak.KeycloakError(f'Unable to connect server')
+        self.kc_admin = self._connect()
+        self._local = threading.local()
         return func(self, *args, **kwargs)
     return wrapper
 
@@ -44,6 +43,29 @@ class Keycloak:
         CREDENTIALS_VALUE = 'value'
         CREDENTIALS_TYPE = 'type'
         CREDENTIALS_TYPE_VALUE = 'password'
+        BRIEF_REPRESENTATION = 'briefRepresentation'
+        REALM = 'realm'
+        PASSWORD_POLICY = 'passwordPolicy'
+        ADMIN_EVENTS = 'admin/realms/{realm}/admin-events'
+        USERS = 'admin/realms/{realm}/users'
+        USERS_COUNT = 'admin/realms/{realm}/users/count'
+        EVENT_TIME = 'time'
+        EVENT_RESOURCE_PATH = 'resourcePath'
+        EVENT_RESOURCE_TYPES = 'resourceTypes'
+        EVENT_RESOURCE_TYPE_USER = 'USER'
+        EVENT_DATE_FROM = 'dateFrom'
+        EVENT_USERS_PATH = 'users/'
+        FIRST = 'first'
+        MAX = 'max'
+        NOT_FOUND = 404
+
+    Result = namedtuple('Result', ['user_id', 'username', 'error'])
+    """Result of one user operation, error is None on success"""
+
+    DEFAULT_WORKERS = 8
+    DELETE_ALL_PASSES = 3
+    EVENTS_PAGE_SIZE = 500
+    CREATEDTIME_FORMAT = '%d/%m/%y'
 
     class KeycloakError(Exception):
         """Exception raised for errors in the Keycloak.
@@ -55,12 +77,16 @@ class Keycloak:
         def __init__(self, message):
             self.message = message
 
-    def __init__(self, server_url: str, client_id: str, realm_name: str, client_secret_key: str):
+    def __init__(self, server_url: str, client_id: str, realm_name: str, client_secret_key: str,
+                 page_size: int = PageFetcher.DEFAULT_PAGE_SIZE, prefetch: int = PageFetcher.DEFAULT_PREFETCH):
         self.kc_admin = None
         self.server_url = server_url
         self.client_id = client_id
         self.realm_name = realm_name
         self.client_secret_key = client_secret_key
+        self.page_size = page_size
+        self.prefetch = prefetch
+        self._local = threading.local()
 
     @staticmethod
     def set_log_level(level: str):
@@ -71,207 +97,581 @@ class Keycloak:
         """
         coloredlogs.install(level=level, logger=logger)
 
-    def _assign_role_to_user(self, user: KCUser):
+    def _connect(self) -> KeycloakAdmin:
+        """open a keycloak admin connection
+
+        Raises:
+            KeycloakError: unable to connect
+
+        Returns:
+            KeycloakAdmin: an authenticated admin client
+        """
+        try:
+            return KeycloakAdmin(server_url=self.server_url,
+                                 client_id=self.client_id,
+                                 realm_name=self.realm_name,
+                                 client_secret_key=self.client_secret_key,
+                                 verify=True)
+        except (exceptions.KeycloakConnectionError, exceptions.KeycloakGetError):
+            raise Keycloak.KeycloakError(f'Unable to connect server')
+
+    def _thread_admin(self) -> KeycloakAdmin:
+        """get the admin client of the current worker thread
+
+        Returns:
+            KeycloakAdmin: an admin client which is not shared between threads
+        """
+        kc_admin = getattr(self._local, 'kc_admin', None)
+        if kc_admin is None:
+            kc_admin = self._connect()
+            self._local.kc_admin = kc_admin
+        return kc_admin
+
+    def _assign_role_to_user(self, user: KCUser, user_id: str, role_id: str):
         """assgin user's role with its parameter
 
         Args:
             user (KCUser): user to assign
+            user_id (str): user id on keycloak
+            role_id (str): id of the user's role
 
         Raises:
             KeycloakError: unable to assign role
         """
-        try:
-            user_id = self.kc_admin.get_user_id(username=user.username.lower())
-            role_id = self.kc_admin.get_realm_role(
-                user.role)[Keycloak.Keycloak_API.ID]
-        except exceptions.KeycloakGetError:
-            raise Keycloak.KeycloakError(f'Unable to find role: {user.role}')
         roles_info = [{
             Keycloak.Keycloak_API.ID: role_id,
             Keycloak.Keycloak_API.ROLE_NAME: user.role
         }]
+        kc_admin = self._thread_admin()
         try:
-            self.kc_admin.assign_realm_roles(user_id=user_id,
-                                             client_id=self.kc_admin.client_id,
-                                             roles=roles_info)
+            kc_admin.assign_realm_roles(user_id=user_id,
+                                        client_id=kc_admin.client_id,
+                                        roles=roles_info)
         except exceptions.KeycloakGetError:
             raise Keycloak.KeycloakError(
                 f'Unable to assign user {user.username} with role {user.role}')
 
-    def _add_user(self, user: KCUser):
-        """Add user to keycloak
+    @staticmethod
+    def _user_payload(user: KCUser) -> dict:
+        """build the user representation sent to keycloak
 
         Args:
-            user (KCser): A keycloak user instance
+            user (KCUser): A keycloak user instance
 
-        Raises:
-            error: exceptions.KeycloakGetError
+        Returns:
+            dict: keycloak user representation
         """
-        user_id = self.kc_admin.get_user_id(username=user.username.lower())
-        if user_id:
-            self.kc_admin.delete_user(user_id=user_id)
-            logger.warning(f'update existed user: {user.username}')
         payload = {Keycloak.Keycloak_API.EMAIL: user.email,
                    Keycloak.Keycloak_API.USERNAME: user.username,
                    Keycloak.Keycloak_API.USER_ENABLE: True,
                    Keycloak.Keycloak_API.EMAIL_VERIFICATION: True,
                    Keycloak.Keycloak_API.FIRSTNAME: user.firstname,
                    Keycloak.Keycloak_API.LASTNAME: user.lastname,
-                   Keycloak.Keycloak_API.ATTRIBUTES: user.attributes
+                   Keycloak.Keycloak_API.ATTRIBUTES: KCUser.get_attributes(user)
                    }
-        if not pd.isnull(user.password):
+        credential = getattr(user, 'credential', None)
+        if credential is not None:
+            payload[Keycloak.Keycloak_API.CREDENTIALS] = [credential]
+        elif not pd.isnull(user.password):
             payload[Keycloak.Keycloak_API.CREDENTIALS] = [
                 {Keycloak.Keycloak_API.CREDENTIALS_VALUE: user.password, Keycloak.Keycloak_API.CREDENTIALS_TYPE: Keycloak.Keycloak_API.CREDENTIALS_TYPE_VALUE}]
+        return payload
+
+    def _add_user(self, user: KCUser, roles: dict) -> 'Keycloak.Result':
+        """Add or replace one user and assign its role with the admin client of the current worker thread
 
+        Args:
+            user (KCser): A keycloak user instance
+            roles (dict): {role name: role id}
+
+        Returns:
+            Keycloak.Result: result of the creation
+        """
+        user_id = None
         try:
-            self.kc_admin.create_user(payload)
-            logger.info(f'Add user: {user.username} successfully')
+            # an unknown role must not delete the existing user
+            if user.role not in roles:
+                raise Keycloak.KeycloakError(
+                    f'Unable to find role: {user.role}')
+            kc_admin = self._thread_admin()
+            existing_id = kc_admin.get_user_id(username=user.username.lower())
+            if existing_id:
+                kc_admin.delete_user(user_id=existing_id)
+                logger.warning(f'update existed user: {user.username}')
+            try:
+                kc_admin.create_user(Keycloak._user_payload(user))
+                user_id = kc_admin.get_user_id(username=user.username.lower())
+                logger.info(f'Add user: {user.username} successfully')
+            except exceptions.KeycloakGetError as error:
+                raise Keycloak.KeycloakError(
+                    f'Unable to create user {user.username}: {error}')
+            self._assign_role_to_user(user, user_id, roles[user.role])
         except exceptions.KeycloakGetError as error:
-            raise Keycloak.KeycloakError(
-                f'Unable to create user {user.username}: {error}')
-        self._assign_role_to_user(user)
+            logger.error(f'Unable to add user {user.username}: {error}')
+            return Keycloak.Result(user_id, user.username, str(error))
+        except Keycloak.KeycloakError as error:
+            logger.error(f'Unable to add user {user.username}: {error.message}')
+            return Keycloak.Result(user_id, user.username, error.message)
+        return Keycloak.Result(user_id, user.username, None)
 
-    def _delete_user(self, username: str):
-        """Delete a user from keycloak
+    def _delete_user(self, user_id: str, username: str) -> 'Keycloak.Result':
+        """Delete a user from keycloak by its id, a user which is already gone counts as deleted
 
         Args:
-            username (str): user index
+            user_id (str): user id on keycloak
+            username (str): user index, used for reporting
 
         Returns:
-            bool: Success is True, otherwise is False
+            Keycloak.Result: result of the deletion
         """
         try:
-            user_id = self.kc_admin.get_user_id(username=username)
-            self.kc_admin.delete_user(user_id=user_id)
+            self._thread_admin().delete_user(user_id=user_id)
             logger.info(f'Delete user: {username}')
-        except exceptions.KeycloakGetError:
-            raise Keycloak.KeycloakError(f'User: {username} does not exist')
+        except exceptions.KeycloakGetError as error:
+            if getattr(error, 'response_code', None) != Keycloak.Keycloak_API.NOT_FOUND:
+                logger.error(f'Unable to delete user: {username}: {error}')
+                return Keycloak.Result(user_id, username, str(error))
+            logger.warning(f'User: {username} does not exist anymore')
+        except Keycloak.KeycloakError as error:
+            return Keycloak.Result(user_id, username, error.message)
+        return Keycloak.Result(user_id, username, None)
 
-    def _get_user_realm_role(self, csvloader: CSVLoader, user_id: str) -> Union[str, None]:
-        """get user's realm role
+    def _delete_user_ids(self, users: list, workers: int) -> list:
+        """delete users in parallel with a bounded number of workers
 
         Args:
-            csvloader (CSVLoader): csvloder object
-            user_id (str): user id
+            users (list): list of (user id, username)
+            workers (int): maximum number of concurrent deletions
+
+        Returns:
+            list: list of Keycloak.Result
+        """
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            return list(executor.map(lambda user: self._delete_user(*user), users))
+
+    def _raw_get(self, path: str, params: dict):
+        """GET an admin endpoint of the realm with the admin client of the current thread
+
+        Args:
+            path (str): one of Keycloak_API paths
+            params (dict): query parameters
 
         Raises:
-            Keycloak.KeycloakError: Exception raised for errors in the Keycloak
+            exceptions.KeycloakGetError: request failed
 
         Returns:
-            Union[str, None]: role name or none if no found
+            decoded json response
         """
-        for role in csvloader.template[Template.EXPORT][Template.EXPORT_ROLES]:
-            try:
-                for user in self.kc_admin.get_realm_role_members(role):
-                    if user[Keycloak.Keycloak_API.ID] == user_id:
-                        return role
-            except exceptions.KeycloakGetError as error:
-                raise Keycloak.KeycloakError(
-                    f'Role: {role} does not exist in realm')
-        return None
+        return exceptions.raise_error_from_response(
+            self._thread_admin().connection.raw_get(
+                path.format(realm=self.realm_name), **params),
+            exceptions.KeycloakGetError)
+
+    def _iter_users(self, params: dict) -> Iterator[dict]:
+        """list users matching search parameters, pages are fetched concurrently
+        and users are yielded as their page arrives
+
+        Args:
+            params (dict): keycloak search parameters
+
+        Raises:
+            KeycloakError: unable to list users
+
+        Yields:
+            Iterator[dict]: keycloak user representations
+        """
+        fetcher = PageFetcher(count=lambda: int(self._raw_get(Keycloak.Keycloak_API.USERS_COUNT, params)),
+                              fetch_page=lambda first, size: self._raw_get(Keycloak.Keycloak_API.USERS, {
+                                  **params, Keycloak.Keycloak_API.FIRST: first, Keycloak.Keycloak_API.MAX: size}),
+                              page_size=self.page_size, prefetch=self.prefetch)
+        try:
+            for page in fetcher.pages():
+                yield from page
+        except (exceptions.KeycloakGetError, ValueError) as error:
+            raise Keycloak.KeycloakError(
+                f'Unable to search users with {params}: {error}')
+
+    def _snapshot_user_ids(self) -> list:
+        """list every user id of the realm before any deletion starts
+
+        Raises:
+            KeycloakError: unable to list users
+
+        Returns:
+            list: list of (user id, username)
+        """
+        return [(user[Keycloak.Keycloak_API.ID], user[Keycloak.Keycloak_API.USERNAME])
+                for user in self._iter_users({Keycloak.Keycloak_API.BRIEF_REPRESENTATION: 'true'})]
 
     @staticmethod
-    def _filter_user(csvloader: CSVLoader, user: dict, rule: str) -> bool:
-        """fliter users
+    def _export_roles(csvloader: CSVLoader) -> list:
+        """get the roles which can be exported
 
         Args:
-            csvloader (CSVLoader): a Csvloder instance to provide values file
-            user (dict): user's parameter name and vlaue
-            rule (str): schema used by cerberus
+            csvloader (CSVLoader): csvloder object
+
+        Returns:
+            list: role names in priority order
+        """
+        return (csvloader.template.get(Template.EXPORT) or {}).get(Template.EXPORT_ROLES) or []
+
+    @staticmethod
+    def _first_role(user_roles: list, roles: list) -> Union[str, None]:
+        """get the first available role a user has
+
+        Args:
+            user_roles (list): keycloak role representations of the user
+            roles (list): available role names in priority order
+
+        Returns:
+            Union[str, None]: role name, None when the user has no available role
+        """
+        names = {role[Keycloak.Keycloak_API.ROLE_NAME] for role in user_roles}
+        return next((role for role in roles if role in names), None)
+
+    def _get_user_realm_role(self, user_id: str, roles: list) -> Union[str, None]:
+        """get the realm role of a user
+
+        Args:
+            user_id (str): user id on keycloak
+            roles (list): available role names in priority order
 
         Raises:
-            KeycloakError: unknwon rule
+            Keycloak.KeycloakError: Exception raised for errors in the Keycloak
 
         Returns:
-            bool: return true when user is satisfied by rule
+            Union[str, None]: role name, None when the user has no available role
         """
         try:
-            validator = cerberus.Validator(
-                csvloader.load_identifier(rule))
-            name = csvloader.template[rule][Template.RULE_IDENTIFIER][Template.RULE_IDENTIFIER_NAME]
-            return validator.validate({name: user[name]})
-        except cerberus.schema.SchemaError as error:
-            raise Keycloak.KeycloakError(f'Unknown rule: {error}')
+            return Keycloak._first_role(self._thread_admin().get_realm_roles_of_user(user_id), roles)
+        except exceptions.KeycloakGetError as error:
+            raise Keycloak.KeycloakError(
+                f'Unable to read realm roles of user id: {user_id}: {error}')
 
-    def _get_user(self, csvloader: CSVLoader, user_id: str, rule: str) -> Union[KCUser, None]:
-        """get user after flitering
+    def _set_users_realm_roles(self, list_users: list, csvloader: CSVLoader):
+        """set the realm role of the exported users only, one request per user
+
+        Args:
+            list_users (list): users built by _build_users
+            csvloader (CSVLoader): csvloder object
+
+        Raises:
+            Keycloak.KeycloakError: Exception raised for errors in the Keycloak
+        """
+        roles = Keycloak._export_roles(csvloader)
+        if not roles or not list_users:
+            return
+        with ThreadPoolExecutor(max_workers=Keycloak.DEFAULT_WORKERS) as executor:
+            for user, role in zip(list_users, executor.map(
+                    lambda user: self._get_user_realm_role(user.id, roles), list_users)):
+                user.role = role
+
+    def _get_candidate_users(self, query: KCQuery) -> Iterator[dict]:
+        """get users matching the server side part of a query
+
+        Args:
+            query (KCQuery): query built from identifier
+
+        Raises:
+            Keycloak.KeycloakError: Exception raised for errors in the Keycloak
+
+        Returns:
+            Iterator[dict]: keycloak user representations, realm users are yielded as their page arrives
+        """
+        if query.role_rules is None:
+            return self._iter_users(query.params)
+        try:
+            roles = [role[Keycloak.Keycloak_API.ROLE_NAME] for role in self.kc_admin.get_realm_roles()
+                     if query.match_role(role[Keycloak.Keycloak_API.ROLE_NAME])]
+            candidates = {}
+            for role in roles:
+                for user in self.kc_admin.get_realm_role_members(role):
+                    candidates.setdefault(user[Keycloak.Keycloak_API.ID], user)
+        except exceptions.KeycloakGetError as error:
+            raise Keycloak.KeycloakError(
+                f'Unable to read realm role members: {error}')
+        except KCQuery.KCQueryError as error:
+            raise Keycloak.KeycloakError(error.message)
+        logger.info(f'Found {len(candidates)} members of roles {roles}')
+        users = []
+        for user_id, user in candidates.items():
+            if Keycloak.Keycloak_API.ATTRIBUTES not in user:
+                user = self._get_user_representation(user_id)
+            users.append(user)
+        return users
+
+    def _get_user_representation(self, user_id: str) -> dict:
+        """get a keycloak user representation
 
         Args:
-            csvloader (CSVLoader): a Csvloder instance to provide values file
             user_id (str): user id on keycloak
-            rule (str): schema used by cerberus
 
         Raises:
             KeycloakError: invalide user id
 
         Returns:
-            Union[KCUser, None]: if user exist then return user otherwise return none
+            dict: keycloak user representation
         """
         try:
-            user = self.kc_admin.get_user(user_id=user_id)
+            return self.kc_admin.get_user(user_id=user_id)
         except exceptions.KeycloakGetError as error:
             raise Keycloak.KeycloakError(
                 f'Unable to find user id: f{user_id}: {error}')
-        if Keycloak._filter_user(csvloader=csvloader, user=user, rule=rule):
-            role = self._get_user_realm_role(
-                csvloader=csvloader, user_id=user_id)
-            attributes = dict(
-                map(lambda attri: (attri[0], ''.join(attri[1])), user[Keycloak.Keycloak_API.ATTRIBUTES].items()))
-            kcuser = KCUser(email=user[Keycloak.Keycloak_API.EMAIL], username=user[Keycloak.Keycloak_API.USERNAME],
-                            firstname=user[Keycloak.Keycloak_API.FIRSTNAME], lastname=user[Keycloak.Keycloak_API.LASTNAME],
-                            role=role, attributes=attributes)
-            kcuser.createdtime = datetime.fromtimestamp(
-                int(str(user[Keycloak.Keycloak_API.CREATEDTIME])[:10])).strftime('%d/%m/%y')
-            return kcuser
-        else:
-            return None
 
-    @connect
-    def get_users(self, csvloader: CSVLoader, rule: str) -> list:
-        """get list of users after flitering bt rules
+    @staticmethod
+    def _get_user(user: dict, role: Union[str, None]) -> KCUser:
+        """convert a keycloak user representation into a user
 
         Args:
-            csvloader (CSVLoader): a Csvloder instance to provide values file
-            rule (str): schema used by cerberus
+            user (dict): keycloak user representation
+            role (Union[str, None]): user's realm role
+
+        Returns:
+            KCUser: user instance
+        """
+        attributes = dict(
+            map(lambda attri: (attri[0], ''.join(attri[1])), (user.get(Keycloak.Keycloak_API.ATTRIBUTES) or {}).items()))
+        kcuser = KCUser(email=user.get(Keycloak.Keycloak_API.EMAIL), username=user[Keycloak.Keycloak_API.USERNAME],
+                        firstname=user.get(Keycloak.Keycloak_API.FIRSTNAME), lastname=user.get(Keycloak.Keycloak_API.LASTNAME),
+                        role=role, attributes=attributes)
+        kcuser.id = user[Keycloak.Keycloak_API.ID]
+        kcuser.createdtimestamp = user.get(Keycloak.Keycloak_API.CREATEDTIME)
+        kcuser.modifiedtimestamp = None
+        return kcuser
+
+    @staticmethod
+    def _set_createdtime(list_users: list):
+        """convert createdTimestamp of users into local dates at once
+
+        Args:
+            list_users (list): users built by _get_user
+        """
+        createdtime = pd.to_datetime(pd.Series([user.createdtimestamp for user in list_users], dtype='float64'),
+                                     unit='ms', utc=True).dt.tz_convert(tz.tzlocal()).dt.strftime(Keycloak.CREATEDTIME_FORMAT)
+        for user, value in zip(list_users, createdtime):
+            user.createdtime = None if pd.isnull(value) else value
+
+    @staticmethod
+    def _parse_admin_events(events: list, since: int) -> dict:
+        """get the users modified by admin events
+
+        Args:
+            events (list): keycloak admin event representations
+            since (int): only events after this timestamp in ms are kept
+
+        Returns:
+            dict: {user id: time of its last event in ms}
+        """
+        modified = {}
+        for event in events:
+            path = event.get(Keycloak.Keycloak_API.EVENT_RESOURCE_PATH) or ''
+            event_time = event.get(Keycloak.Keycloak_API.EVENT_TIME) or 0
+            if event_time > since and path.startswith(Keycloak.Keycloak_API.EVENT_USERS_PATH):
+                user_id = path[len(Keycloak.Keycloak_API.EVENT_USERS_PATH):].split('/')[0]
+                modified[user_id] = max(modified.get(user_id, 0), event_time)
+        return modified
+
+    @staticmethod
+    def _events_params(since: int) -> dict:
+        """admin events search parameters, dateFrom only has a day precision
+
+        Args:
+            since (int): timestamp in ms
+
+        Returns:
+            dict: keycloak admin events search parameters
+        """
+        return {Keycloak.Keycloak_API.EVENT_RESOURCE_TYPES: Keycloak.Keycloak_API.EVENT_RESOURCE_TYPE_USER,
+                Keycloak.Keycloak_API.EVENT_DATE_FROM: datetime.fromtimestamp(since // 1000, tz=timezone.utc).strftime('%Y-%m-%d')}
+
+    def _get_modified_users(self, since: int) -> dict:
+        """get the users modified since a timestamp from the realm admin events,
+        admin events should be enabled on the realm
+
+        Args:
+            since (int): timestamp in ms
+
+        Raises:
+            KeycloakError: unable to read admin events
+
+        Returns:
+            dict: {user id: time of its last event in ms}
+        """
+        events = []
+        params = Keycloak._events_params(since)
+        while True:
+            try:
+                page = exceptions.raise_error_from_response(
+                    self.kc_admin.connection.raw_get(Keycloak.Keycloak_API.ADMIN_EVENTS.format(realm=self.realm_name),
+                                                     **params, **{Keycloak.Keycloak_API.FIRST: len(events),
+                                                                  Keycloak.Keycloak_API.MAX: Keycloak.EVENTS_PAGE_SIZE}),
+                    exceptions.KeycloakGetError)
+            except exceptions.KeycloakGetError as error:
+                raise Keycloak.KeycloakError(
+                    f'Unable to read admin events: {error}')
+            events.extend(page)
+            if len(page) < Keycloak.EVENTS_PAGE_SIZE:
+                break
+        modified = Keycloak._parse_admin_events(events, since)
+        logger.info(f'Found {len(modified)} users modified by admin events')
+        return modified
+
+    @staticmethod
+    def _select_since(candidates: Iterable[dict], since: Union[int, None], modified: Union[dict, None]) -> Iterable[dict]:
+        """keep users created, or modified when modified is given, after since
+
+        Args:
+            candidates (Iterable[dict]): keycloak user representations
+            since (Union[int, None]): timestamp in ms, None keeps every user
+            modified (Union[dict, None]): {user id: time of its last event in ms}
+
+        Returns:
+            Iterable[dict]: keycloak user representations
+        """
+        if since is None:
+            return candidates
+        modified = modified or {}
+        return (user for user in candidates
+                if (user.get(Keycloak.Keycloak_API.CREATEDTIME) or 0) > since
+                or user[Keycloak.Keycloak_API.ID] in modified)
+
+    @staticmethod
+    def _build_users(candidates: Iterable[dict], query: KCQuery, modified: Union[dict, None] = None) -> list:
+        """convert the candidates matching the local part of a query into users, without their role
+
+        Args:
+            candidates (Iterable[dict]): keycloak user representations
+            query (KCQuery): query built from identifier
+            modified (Union[dict, None]): {user id: time of its last event in ms}
 
         Returns:
             list: list of users
         """
-        logger.info(
-            f"Use schema: {csvloader.load_identifier(rule)}")
         list_users = []
-        for user in self.kc_admin.get_users():
-            user_flitered = self._get_user(csvloader=csvloader,
-                                           user_id=user[Keycloak.Keycloak_API.ID], rule=rule)
-            if user_flitered:
+        for user in candidates:
+            if query.match(user):
+                user_flitered = Keycloak._get_user(user=user, role=None)
+                user_flitered.modifiedtimestamp = (
+                    modified or {}).get(user_flitered.id)
                 logger.info(f'Get user {user_flitered.username}')
                 list_users.append(user_flitered)
+        Keycloak._set_createdtime(list_users)
+        return list_users
+
+    @connect
+    def get_users(self, csvloader: CSVLoader, rule: str, since: Union[int, None] = None, modified: bool = False) -> list:
+        """get list of users after flitering bt rules, identifier rules are sent to keycloak
+        as search parameters when possible and the residual rules are evaluated locally
+
+        Args:
+            csvloader (CSVLoader): a Csvloder instance to provide values file
+            rule (str): schema used by cerberus, realm roles are only read for export_rules
+            since (Union[int, None]): only users created after this timestamp in ms, None for every user
+            modified (bool): also users modified after since according to admin events
+
+        Raises:
+            Keycloak.KeycloakError: Exception raised for errors in the Keycloak
+
+        Returns:
+            list: list of users
+        """
+        try:
+            query = KCQuery(csvloader.load_identifier(rule))
+        except KCQuery.KCQueryError as error:
+            raise Keycloak.KeycloakError(error.message)
+        logger.info(
+            f"Use schema: {csvloader.load_identifier(rule)}, keycloak query: {query.params}, local schema: {query.residual}")
+        modified_users = self._get_modified_users(
+            since) if since is not None and modified else None
+        candidates = Keycloak._select_since(
+            self._get_candidate_users(query), since, modified_users)
+        list_users = Keycloak._build_users(candidates, query, modified_users)
+        if rule == Template.EXPORT:
+            self._set_users_realm_roles(list_users, csvloader)
         return list_users
 
     @connect
-    def delete_users(self, list_users: list):
+    def get_password_policy(self) -> str:
+        """get the password policy of the realm
+
+        Raises:
+            KeycloakError: unable to read realm
+
+        Returns:
+            str: password policy, empty when the realm has none
+        """
+        try:
+            realms = self.kc_admin.get_realms()
+        except exceptions.KeycloakGetError as error:
+            raise Keycloak.KeycloakError(
+                f'Unable to read realm {self.realm_name}: {error}')
+        for realm in realms:
+            if realm.get(Keycloak.Keycloak_API.REALM) == self.realm_name:
+                return realm.get(Keycloak.Keycloak_API.PASSWORD_POLICY) or ''
+        raise Keycloak.KeycloakError(f'Unable to read realm {self.realm_name}')
+
+    @connect
+    def delete_users(self, list_users: list, workers: int = DEFAULT_WORKERS) -> list:
         """delete users by giving list of users
 
         Args:
             list_users (list): list of users to be deleted
-        """
+            workers (int): maximum number of concurrent deletions
 
+        Returns:
+            list: list of Keycloak.Result
+        """
+        users = []
         for user in list_users:
-            self._delete_user(username=user.username)
+            user_id = getattr(user, 'id', None) or self.kc_admin.get_user_id(
+                username=user.username.lower())
+            if user_id is None:
+                logger.warning(f'User: {user.username} does not exist')
+                continue
+            users.append((user_id, user.username))
+        return self._delete_user_ids(users=users, workers=workers)
 
     @connect
-    def delete_all_users(self):
-        """Delete all users from keycloak
+    def delete_all_users(self, workers: int = DEFAULT_WORKERS) -> list:
+        """Delete all users from keycloak, ids are listed before deleting so that pages never drift,
+        users created meanwhile are deleted by the next passes
+
+        Args:
+            workers (int): maximum number of concurrent deletions
+
+        Returns:
+            list: list of Keycloak.Result
         """
-        for user in self.kc_admin.get_users():
-            self._delete_user(username=user[Keycloak.Keycloak_API.USERNAME])
+        results = []
+        for _ in range(Keycloak.DELETE_ALL_PASSES):
+            failed = {result.user_id for result in results if result.error}
+            users = [user for user in self._snapshot_user_ids()
+                     if user[0] not in failed]
+            if not users:
+                break
+            logger.info(f'Delete {len(users)} users')
+            results.extend(self._delete_user_ids(
+                users=users, workers=workers))
+        return results
 
     @connect
-    def add_users(self, users: list):
-        """Add list of users to keycloak
+    def add_users(self, users: list, workers: int = DEFAULT_WORKERS) -> list:
+        """Add list of users to keycloak in parallel with a bounded number of workers
 
         Args:
             users (list): A list of BM user instances
+            workers (int): maximum number of concurrent creations
+
+        Raises:
+            KeycloakError: unable to list realm roles
+
+        Returns:
+            list: list of Keycloak.Result
         """
-        for user in users:
-            self._add_user(user=user)
+        try:
+            roles = {role[Keycloak.Keycloak_API.ROLE_NAME]: role[Keycloak.Keycloak_API.ID]
+                     for role in self.kc_admin.get_realm_roles()}
+        except exceptions.KeycloakGetError as error:
+            raise Keycloak.KeycloakError(f'Unable to list realm roles: {error}')
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            return list(executor.map(lambda user: self._add_user(user, roles), users))
@@ -0,0 +1,500 @@
+import asyncio
+import logging
+import time
+from typing import Union
+
+import coloredlogs
+import httpx
+from keycloak_sync.model.csvloader import CSVLoader, Template
+from keycloak_sync.model.kc import Keycloak
+from keycloak_sync.model.kcquery import KCQuery
+from keycloak_sync.model.kcuser import KCUser
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncKeycloak:
+    """asyncio keycloak admin client for the bulk operations, requests share keep-alive
+    HTTP/2 connections and at most concurrency requests are in flight
+
+    Usage:
+        async with AsyncKeycloak(...) as kc:
+            results = await kc.add_users(list_users)
+    """
+    class Keycloak_API:
+        TOKEN = 'realms/{realm}/protocol/openid-connect/token'
+        USERS = 'admin/realms/{realm}/users'
+        USERS_COUNT = 'admin/realms/{realm}/users/count'
+        USER = 'admin/realms/{realm}/users/{id}'
+        USER_REALM_ROLES = 'admin/realms/{realm}/users/{id}/role-mappings/realm'
+        ROLES = 'admin/realms/{realm}/roles'
+        ROLE_MEMBERS = 'admin/realms/{realm}/roles/{role}/users'
+        ADMIN_EVENTS = 'admin/realms/{realm}/admin-events'
+        GRANT_TYPE = 'grant_type'
+        GRANT_TYPE_VALUE = 'client_credentials'
+        CLIENT_ID = 'client_id'
+        CLIENT_SECRET = 'client_secret'
+        ACCESS_TOKEN = 'access_token'
+        EXPIRES_IN = 'expires_in'
+        AUTHORIZATION = 'Authorization'
+        LOCATION = 'Location'
+        FIRST = 'first'
+        MAX = 'max'
+        EXACT = 'exact'
+        UNAUTHORIZED = 401
+        NOT_FOUND = 404
+
+    DEFAULT_CONCURRENCY = 64
+    PAGE_SIZE = 500
+    TIMEOUT = 60
+    TOKEN_MARGIN = 30
+
+    class AsyncKeycloakError(Keycloak.KeycloakError):
+        """Exception raised for errors in the AsyncKeycloak.
+
+        Attributes:
+            message -- explanation of the error
+            response_code -- http status code, None when server is unreachable
+        """
+
+        def __init__(self, message, response_code=None):
+            self.message = message
+            self.response_code = response_code
+
+    def __init__(self, server_url: str, client_id: str, realm_name: str, client_secret_key: str,
+                 concurrency: int = DEFAULT_CONCURRENCY, transport: Union[httpx.AsyncBaseTransport, None] = None,
+                 page_size: int = PAGE_SIZE):
+        self.server_url = server_url.rstrip('/') + '/'
+        self.client_id = client_id
+        self.realm_name = realm_name
+        self.client_secret_key = client_secret_key
+        self.concurrency = max(1, concurrency)
+        self.page_size = max(1, page_size)
+        self._transport = transport
+        self._client = None
+        self._semaphore = None
+        self._token_lock = None
+        self._token = None
+        self._token_expiry = 0
+
+    async def __aenter__(self) -> 'AsyncKeycloak':
+        limits = httpx.Limits(max_connections=self.concurrency,
+                              max_keepalive_connections=self.concurrency)
+        self._client = httpx.AsyncClient(base_url=self.server_url, http2=True, limits=limits,
+                                         timeout=AsyncKeycloak.TIMEOUT, transport=self._transport)
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        self._token_lock = asyncio.Lock()
+        await self._refresh_token()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self._client.aclose()
+
+    @staticmethod
+    def set_log_level(level: str):
+        """set keycloak log level
+
+        Args:
+            level (str): log level
+        """
+        coloredlogs.install(level=level, logger=logger)
+
+    def _path(self, path: str, **params) -> str:
+        """format an endpoint path of the realm
+
+        Args:
+            path (str): one of Keycloak_API paths
+
+        Returns:
+            str: path relative to server url
+        """
+        return path.format(realm=self.realm_name, **params)
+
+    async def _refresh_token(self, expired: Union[str, None] = None):
+        """get a new access token with client credentials
+
+        Args:
+            expired (Union[str, None]): token rejected by keycloak, token is only renewed once
+                when several requests find it expired
+
+        Raises:
+            AsyncKeycloak.AsyncKeycloakError: unable to connect
+        """
+        async with self._token_lock:
+            if self._token is not None and self._token != expired and time.monotonic() < self._token_expiry:
+                return
+            try:
+                response = await self._client.post(self._path(AsyncKeycloak.Keycloak_API.TOKEN), data={
+                    AsyncKeycloak.Keycloak_API.GRANT_TYPE: AsyncKeycloak.Keycloak_API.GRANT_TYPE_VALUE,
+                    AsyncKeycloak.Keycloak_API.CLIENT_ID: self.client_id,
+                    AsyncKeycloak.Keycloak_API.CLIENT_SECRET: self.client_secret_key})
+            except httpx.HTTPError as error:
+                raise AsyncKeycloak.AsyncKeycloakError(
+                    f'Unable to connect server: {error}')
+            if response.is_error:
+                raise AsyncKeycloak.AsyncKeycloakError(
+                    f'Unable to connect server', response.status_code)
+            token = response.json()
+            self._token = token[AsyncKeycloak.Keycloak_API.ACCESS_TOKEN]
+            self._token_expiry = time.monotonic() + \
+                token[AsyncKeycloak.Keycloak_API.EXPIRES_IN] - \
+                AsyncKeycloak.TOKEN_MARGIN
+
+    async def _request(self, method: str, path: str, **kwargs) -> httpx.Response:
+        """send an authenticated request, the token is renewed once when it expired
+
+        Args:
+            method (str): http method
+            path (str): path relative to server url
+
+        Raises:
+            AsyncKeycloak.AsyncKeycloakError: request failed
+
+        Returns:
+            httpx.Response: successful response
+        """
+        async with self._semaphore:
+            for _ in range(2):
+                if time.monotonic() >= self._token_expiry:
+                    await self._refresh_token(self._token)
+                token = self._token
+                try:
+                    response = await self._client.request(method, path, headers={
+                        AsyncKeycloak.Keycloak_API.AUTHORIZATION: f'Bearer {token}'}, **kwargs)
+                except httpx.HTTPError as error:
+                    raise AsyncKeycloak.AsyncKeycloakError(
+                        f'{method} {path} failed: {error}')
+                if response.status_code != AsyncKeycloak.Keycloak_API.UNAUTHORIZED:
+                    break
+                await self._refresh_token(token)
+        if response.is_error:
+            raise AsyncKeycloak.AsyncKeycloakError(
+                f'{method} {path} failed: {response.status_code} {response.text}', response.status_code)
+        return response
+
+    async def _run_bounded(self, func, items: list) -> list:
+        """await func on every item with at most concurrency coroutines alive
+
+        Args:
+            func (coroutine function): called with one item
+            items (list): items to process
+
+        Returns:
+            list: results in the order of items
+        """
+        results = [None] * len(items)
+        iter_items = iter(enumerate(items))
+
+        async def worker():
+            for index, item in iter_items:
+                results[index] = await func(item)
+        await asyncio.gather(*(worker() for _ in range(min(self.concurrency, len(items)))))
+        return results
+
+    async def _fetch_all(self, path: str, params: Union[dict, None] = None) -> list:
+        """read every page of a paginated endpoint
+
+        Args:
+            path (str): path relative to server url
+            params (Union[dict, None]): query parameters, first is the offset of the first page
+
+        Returns:
+            list: concatenated pages
+        """
+        params = params or {}
+        first = params.get(AsyncKeycloak.Keycloak_API.FIRST, 0)
+        items = []
+        while True:
+            page = (await self._request('GET', path, params={**params,
+                                                             AsyncKeycloak.Keycloak_API.FIRST: first + len(items),
+                                                             AsyncKeycloak.Keycloak_API.MAX: self.page_size})).json()
+            items.extend(page)
+            if len(page) < self.page_size:
+                return items
+
+    async def users_count(self, params: Union[dict, None] = None) -> int:
+        """count users matching search parameters
+
+        Args:
+            params (Union[dict, None]): keycloak search parameters
+
+        Returns:
+            int: number of users
+        """
+        return int((await self._request('GET', self._path(AsyncKeycloak.Keycloak_API.USERS_COUNT), params=params or {})).text)
+
+    async def list_users(self, params: Union[dict, None] = None) -> list:
+        """list users matching search parameters, the pages counted by users/count are fetched concurrently
+
+        Args:
+            params (Union[dict, None]): keycloak search parameters
+
+        Returns:
+            list: keycloak user representations
+        """
+        params = params or {}
+        path = self._path(AsyncKeycloak.Keycloak_API.USERS)
+
+        async def fetch_page(first: int) -> list:
+            return (await self._request('GET', path, params={**params,
+                                                             AsyncKeycloak.Keycloak_API.FIRST: first,
+                                                             AsyncKeycloak.Keycloak_API.MAX: self.page_size})).json()
+        count = await self.users_count(params)
+        pages = await self._run_bounded(fetch_page, list(range(0, max(count, 1), self.page_size)))
+        users = [user for page in pages for user in page]
+        if len(pages[-1]) >= self.page_size:
+            # users created while listing are past the counted pages
+            users.extend(await self._fetch_all(path, {**params, AsyncKeycloak.Keycloak_API.FIRST: len(pages) * self.page_size}))
+        return users
+
+    async def get_user(self, user_id: str) -> dict:
+        """get a keycloak user representation
+
+        Args:
+            user_id (str): user id on keycloak
+
+        Returns:
+            dict: keycloak user representation
+        """
+        return (await self._request('GET', self._path(AsyncKeycloak.Keycloak_API.USER, id=user_id))).json()
+
+    async def get_user_id(self, username: str) -> Union[str, None]:
+        """get user id by its exact username
+
+        Args:
+            username (str): username
+
+        Returns:
+            Union[str, None]: user id, None when user does not exist
+        """
+        users = (await self._request('GET', self._path(AsyncKeycloak.Keycloak_API.USERS), params={
+            Keycloak.Keycloak_API.USERNAME: username, AsyncKeycloak.Keycloak_API.EXACT: 'true'})).json()
+        return next((user[Keycloak.Keycloak_API.ID] for user in users
+                     if user[Keycloak.Keycloak_API.USERNAME] == username), None)
+
+    async def create_user(self, payload: dict) -> str:
+        """create a user
+
+        Args:
+            payload (dict): keycloak user representation
+
+        Returns:
+            str: id of the created user
+        """
+        response = await self._request('POST', self._path(AsyncKeycloak.Keycloak_API.USERS), json=payload)
+        return response.headers[AsyncKeycloak.Keycloak_API.LOCATION].rstrip('/').split('/')[-1]
+
+    async def delete_user(self, user_id: str):
+        """delete a user
+
+        Args:
+            user_id (str): user id on keycloak
+        """
+        await self._request('DELETE', self._path(AsyncKeycloak.Keycloak_API.USER, id=user_id))
+
+    async def get_realm_roles(self) -> list:
+        """list realm roles
+
+        Returns:
+            list: keycloak role representations
+        """
+        return (await self._request('GET', self._path(AsyncKeycloak.Keycloak_API.ROLES))).json()
+
+    async def get_realm_role_members(self, role: str) -> list:
+        """list users having a realm role
+
+        Args:
+            role (str): realm role name
+
+        Returns:
+            list: keycloak user representations
+        """
+        return await self._fetch_all(self._path(AsyncKeycloak.Keycloak_API.ROLE_MEMBERS, role=role))
+
+    async def get_user_realm_roles(self, user_id: str) -> list:
+        """list realm role mappings of a user
+
+        Args:
+            user_id (str): user id on keycloak
+
+        Returns:
+            list: keycloak role representations
+        """
+        return (await self._request('GET', self._path(AsyncKeycloak.Keycloak_API.USER_REALM_ROLES, id=user_id))).json()
+
+    async def assign_realm_roles(self, user_id: str, roles: list):
+        """add realm role mappings to a user
+
+        Args:
+            user_id (str): user id on keycloak
+            roles (list): keycloak role representations with id and name
+        """
+        await self._request('POST', self._path(AsyncKeycloak.Keycloak_API.USER_REALM_ROLES, id=user_id), json=roles)
+
+    async def _add_user(self, user: KCUser, roles: dict) -> Keycloak.Result:
+        """Add or replace one user and assign its role
+
+        Args:
+            user (KCUser): A keycloak user instance
+            roles (dict): {role name: role id}
+
+        Returns:
+            Keycloak.Result: result of the creation
+        """
+        user_id = None
+        try:
+            # an unknown role must not delete the existing user
+            if user.role not in roles:
+                raise AsyncKeycloak.AsyncKeycloakError(
+                    f'Unable to find role: {user.role}')
+            existing_id = await self.get_user_id(user.username.lower())
+            if existing_id:
+                await self.delete_user(existing_id)
+                logger.warning(f'update existed user: {user.username}')
+            user_id = await self.create_user(Keycloak._user_payload(user))
+            logger.info(f'Add user: {user.username} successfully')
+            await self.assign_realm_roles(user_id, [{
+                Keycloak.Keycloak_API.ID: roles[user.role],
+                Keycloak.Keycloak_API.ROLE_NAME: user.role}])
+        except AsyncKeycloak.AsyncKeycloakError as error:
+            logger.error(f'Unable to add user {user.username}: {error.message}')
+            return Keycloak.Result(user_id, user.username, error.message)
+        return Keycloak.Result(user_id, user.username, None)
+
+    async def add_users(self, users: list) -> list:
+        """Add list of users to keycloak
+
+        Args:
+            users (list): A list of BM user instances
+
+        Returns:
+            list: list of Keycloak.Result
+        """
+        roles = {role[Keycloak.Keycloak_API.ROLE_NAME]: role[Keycloak.Keycloak_API.ID]
+                 for role in await self.get_realm_roles()}
+        return await self._run_bounded(lambda user: self._add_user(user, roles), users)
+
+    async def _delete_user(self, user: KCUser) -> Keycloak.Result:
+        """Delete a user, a user which is already gone counts as deleted
+
+        Args:
+            user (KCUser): user to delete, its id is looked up when unknown
+
+        Returns:
+            Keycloak.Result: result of the deletion
+        """
+        user_id = getattr(user, 'id', None)
+        try:
+            user_id = user_id or await self.get_user_id(user.username.lower())
+            if user_id is not None:
+                await self.delete_user(user_id)
+                logger.info(f'Delete user: {user.username}')
+        except AsyncKeycloak.AsyncKeycloakError as error:
+            if error.response_code != AsyncKeycloak.Keycloak_API.NOT_FOUND:
+                logger.error(
+                    f'Unable to delete user: {user.username}: {error.message}')
+                return Keycloak.Result(user_id, user.username, error.message)
+        return Keycloak.Result(user_id, user.username, None)
+
+    async def delete_users(self, list_users: list) -> list:
+        """delete users by giving list of users
+
+        Args:
+            list_users (list): list of users to be deleted
+
+        Returns:
+            list: list of Keycloak.Result
+        """
+        return await self._run_bounded(self._delete_user, list_users)
+
+    async def _set_users_realm_roles(self, list_users: list, csvloader: CSVLoader):
+        """set the realm role of the exported users only, one request per user
+
+        Args:
+            list_users (list): users built by Keycloak._build_users
+            csvloader (CSVLoader): csvloder object
+        """
+        roles = Keycloak._export_roles(csvloader)
+        if not roles:
+            return
+
+        async def user_role(user: KCUser) -> Union[str, None]:
+            return Keycloak._first_role(await self.get_user_realm_roles(user.id), roles)
+        for user, role in zip(list_users, await self._run_bounded(user_role, list_users)):
+            user.role = role
+
+    async def _get_candidate_users(self, query: KCQuery) -> list:
+        """get users matching the server side part of a query
+
+        Args:
+            query (KCQuery): query built from identifier
+
+        Returns:
+            list: keycloak user representations
+        """
+        if query.role_rules is None:
+            return await self.list_users(query.params)
+        try:
+            roles = [role[Keycloak.Keycloak_API.ROLE_NAME] for role in await self.get_realm_roles()
+                     if query.match_role(role[Keycloak.Keycloak_API.ROLE_NAME])]
+        except KCQuery.KCQueryError as error:
+            raise AsyncKeycloak.AsyncKeycloakError(error.message)
+        candidates = {}
+        for members in await asyncio.gather(*map(self.get_realm_role_members, roles)):
+            for user in members:
+                candidates.setdefault(user[Keycloak.Keycloak_API.ID], user)
+        logger.info(f'Found {len(candidates)} members of roles {roles}')
+
+        async def representation(user: dict) -> dict:
+            if Keycloak.Keycloak_API.ATTRIBUTES in user:
+                return user
+            return await self.get_user(user[Keycloak.Keycloak_API.ID])
+        return await self._run_bounded(representation, list(candidates.values()))
+
+    async def get_modified_users(self, since: int) -> dict:
+        """get the users modified since a timestamp from the realm admin events
+
+        Args:
+            since (int): timestamp in ms
+
+        Returns:
+            dict: {user id: time of its last event in ms}
+        """
+        events = await self._fetch_all(self._path(AsyncKeycloak.Keycloak_API.ADMIN_EVENTS),
+                                       Keycloak._events_params(since))
+        modified = Keycloak._parse_admin_events(events, since)
+        logger.info(f'Found {len(modified)} users modified by admin events')
+        return modified
+
+    async def get_users(self, csvloader: CSVLoader, rule: str, since: Union[int, None] = None, modified: bool = False) -> list:
+        """get list of users after flitering bt rules
+
+        Args:
+            csvloader (CSVLoader): a Csvloder instance to provide values file
+            rule (str): schema used by cerberus, realm roles are only read for export_rules
+            since (Union[int, None]): only users created after this timestamp in ms, None for every user
+            modified (bool): also users modified after since according to admin events
+
+        Raises:
+            AsyncKeycloak.AsyncKeycloakError: Exception raised for errors in the AsyncKeycloak
+
+        Returns:
+            list: list of users
+        """
+        try:
+            query = KCQuery(csvloader.load_identifier(rule))
+        except KCQuery.KCQueryError as error:
+            raise AsyncKeycloak.AsyncKeycloakError(error.message)
+        logger.info(
+            f"Use keycloak query: {query.params}, local schema: {query.residual}")
+
+        async def no_modified_users():
+            return None
+        candidates, modified_users = await asyncio.gather(
+            self._get_candidate_users(query),
+            self.get_modified_users(since) if since is not None and modified else no_modified_users())
+        list_users = Keycloak._build_users(Keycloak._select_since(candidates, since, modified_users),
+                                           query, modified_users)
+        if rule == Template.EXPORT:
+            await self._set_users_realm_roles(list_users, csvloader)
+        return list_users
@@ -0,0 +1,244 @@
+import logging
+import re
+from typing import Union
+
+import cerberus
+import coloredlogs
+
+logger = logging.getLogger(__name__)
+
+
+class KCQuery:
+    """Split an identifier schema into a keycloak search query and a residual local schema,
+    when users are filtered by role the role members are the candidates and every other rule is local
+
+    Args:
+        schema (dict): cerberus schema {field name: rules} loaded from an identifier
+    """
+    FIELDS = ['username', 'email', 'firstName', 'lastName']
+    ENABLED = 'enabled'
+    ROLE = 'role'
+    ATTRIBUTES = 'attributes'
+    ATTRIBUTES_PREFIX = 'attributes.'
+    RULE_ALLOWED = 'allowed'
+    RULE_REGEX = 'regex'
+    PARAM_EXACT = 'exact'
+    PARAM_Q = 'q'
+    REGEX_METACHARS = '.^$*+?{}[]()|\\'
+    REGEX_QUANTIFIERS = '*?{'
+    REGEX_BOUNDS = re.compile(r'\d+(,\d*)?')
+
+    class KCQueryError(Exception):
+        """Exception raised for errors in the KCQuery.
+
+        Attributes:
+            message -- explanation of the error
+        """
+
+        def __init__(self, message):
+            self.message = message
+
+    def __init__(self, schema: dict):
+        self._params = {}
+        self._role_rules = schema.get(KCQuery.ROLE)
+        self._residual = {}
+        inexact = {}
+        exact = {}
+        attributes = []
+        for name, rules in schema.items():
+            if name == KCQuery.ROLE:
+                continue
+            if self._role_rules is not None:
+                self._residual[name] = rules
+                continue
+            value = KCQuery._literal_value(rules)
+            if name in KCQuery.FIELDS:
+                if value is not None:
+                    exact[name] = value
+                else:
+                    fragment = KCQuery._literal_fragment(
+                        rules.get(KCQuery.RULE_REGEX))
+                    if fragment:
+                        inexact[name] = fragment
+                    self._residual[name] = rules
+            elif name == KCQuery.ENABLED and isinstance(value, bool):
+                self._params[KCQuery.ENABLED] = str(value).lower()
+            elif name.startswith(KCQuery.ATTRIBUTES_PREFIX) and KCQuery._is_q_safe(name, value):
+                attributes.append(
+                    f'{name[len(KCQuery.ATTRIBUTES_PREFIX):]}:{value}')
+            else:
+                self._residual[name] = rules
+        if exact and not inexact:
+            self._params.update(exact)
+            self._params[KCQuery.PARAM_EXACT] = 'true'
+        else:
+            self._params.update(inexact)
+            self._params.update(exact)
+            self._residual.update(
+                {name: schema[name] for name in exact})
+        if attributes:
+            self._params[KCQuery.PARAM_Q] = ' '.join(attributes)
+        try:
+            self._validator = cerberus.Validator(
+                self._residual) if self._residual else None
+        except cerberus.schema.SchemaError as error:
+            raise KCQuery.KCQueryError(f'Unknown rule: {error}')
+
+    @property
+    def params(self) -> dict:
+        """query parameters sent to keycloak users endpoints"""
+        return self._params
+
+    @property
+    def residual(self) -> dict:
+        """schema which has to be evaluated locally"""
+        return self._residual
+
+    @property
+    def role_rules(self) -> Union[dict, None]:
+        """rules on realm role name, None when users are not filtered by role"""
+        return self._role_rules
+
+    @staticmethod
+    def set_log_level(level: str):
+        """Set log level
+
+        Args:
+            level (str): log's level
+        """
+        coloredlogs.install(level=level, logger=logger)
+
+    @staticmethod
+    def _literal_value(rules: dict):
+        """get the only value accepted by rules
+
+        Args:
+            rules (dict): cerberus rules of one field
+
+        Returns:
+            the accepted value, None when rules accept several values
+        """
+        allowed = rules.get(KCQuery.RULE_ALLOWED)
+        if isinstance(allowed, list) and len(allowed) == 1:
+            return allowed[0]
+        regex = rules.get(KCQuery.RULE_REGEX)
+        if isinstance(regex, str) and len(regex) > 2 and regex[0] == '^' and regex[-1] == '$' \
+                and not any(char in KCQuery.REGEX_METACHARS for char in regex[1:-1]):
+            return regex[1:-1]
+        return None
+
+    @staticmethod
+    def _literal_fragment(regex: Union[str, None]) -> Union[str, None]:
+        """get the longest literal text which must appear in every value matching regex
+
+        Args:
+            regex (Union[str, None]): regular expression
+
+        Returns:
+            Union[str, None]: longest literal fragment, None when there is no safe fragment
+        """
+        if not isinstance(regex, str) or '|' in regex or '(' in regex:
+            return None
+        fragments = ['']
+        index = 0
+        while index < len(regex):
+            char = regex[index]
+            if char == '\\' and index + 1 < len(regex) and not regex[index + 1].isalnum():
+                literal = regex[index + 1]
+                index += 2
+            elif char in KCQuery.REGEX_METACHARS:
+                if char == '[':
+                    closing = regex.find(']', index + 2)
+                    index = len(regex) if closing < 0 else closing + 1
+                elif char == '{':
+                    # {n} and {m,n} quantify the previous atom, which is already dropped
+                    closing = regex.find('}', index + 1)
+                    if closing < 0 or not KCQuery.REGEX_BOUNDS.fullmatch(regex[index + 1:closing]):
+                        return None
+                    index = closing + 1
+                elif char == '\\':
+                    index += 2
+                else:
+                    index += 1
+                fragments.append('')
+                continue
+            else:
+                literal = char
+                index += 1
+            if index < len(regex) and regex[index] in KCQuery.REGEX_QUANTIFIERS:
+                fragments.append('')
+                continue
+            fragments[-1] += literal
+        longest = max(fragments, key=len)
+        return longest or None
+
+    @staticmethod
+    def _is_q_safe(name: str, value) -> bool:
+        """check attribute key and value can be sent in a q=key:value query
+
+        Args:
+            name (str): attributes.<key>
+            value: accepted value
+
+        Returns:
+            bool: true when keycloak can parse the q query
+        """
+        if not isinstance(value, str):
+            return False
+        key = name[len(KCQuery.ATTRIBUTES_PREFIX):]
+        return bool(key and value) and all(char not in text for text in (key, value) for char in ' :')
+
+    @staticmethod
+    def _get_field(user: dict, name: str):
+        """get a field value from a keycloak user representation
+
+        Args:
+            user (dict): keycloak user representation
+            name (str): field name, attributes.<key> for attributes
+
+        Returns:
+            field value, attribute values are joined into one string
+        """
+        if name.startswith(KCQuery.ATTRIBUTES_PREFIX):
+            values = (user.get(KCQuery.ATTRIBUTES) or {}).get(
+                name[len(KCQuery.ATTRIBUTES_PREFIX):])
+            return None if values is None else ''.join(values)
+        return user.get(name)
+
+    def needs_attributes(self) -> bool:
+        """check residual schema reads user attributes
+
+        Returns:
+            bool: true when attributes are needed locally
+        """
+        return any(name.startswith(KCQuery.ATTRIBUTES_PREFIX) for name in self._residual)
+
+    def match_role(self, role: str) -> bool:
+        """check a realm role name satisfies role rules
+
+        Args:
+            role (str): realm role name
+
+        Raises:
+            KCQuery.KCQueryError: Exception raised for errors in the KCQuery
+
+        Returns:
+            bool: true when role is selected
+        """
+        try:
+            return cerberus.Validator({KCQuery.ROLE: self._role_rules}).validate({KCQuery.ROLE: role})
+        except cerberus.schema.SchemaError as error:
+            raise KCQuery.KCQueryError(f'Unknown rule: {error}')
+
+    def match(self, user: dict) -> bool:
+        """evaluate residual schema on a keycloak user representation
+
+        Args:
+            user (dict): keycloak user representation
+
+        Returns:
+            bool: true when user is satisfied by the residual rules
+        """
+        if self._validator is None:
+            return True
+        return self._validator.validate({name: KCQuery._get_field(user, name) for name in self._residual})
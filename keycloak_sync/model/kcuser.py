@@ -1,15 +1,21 @@
 import logging
-from typing import Iterator
+import sys
+from types import MappingProxyType
+from typing import Iterator, Union
 
 import coloredlogs
+import numpy as np
 from keycloak_sync.abstract_model.user import User
 from keycloak_sync.model.csvloader import CSVLoader, Template
-from pandas import Series
+from pandas import Series, factorize
 
 logger = logging.getLogger(__name__)
 
 
 class KCUser(User):
+    # template custom attributes shared read-only by every user of a compact list,
+    # replace the mapping to change them for one user
+    custom_attributes = None
 
     class KCUserError(Exception):
         """Exception raised for errors in the KCUser.
@@ -62,32 +68,61 @@ class KCUser(User):
             setattr(user, parameter, value)
 
     @ staticmethod
-    def _assign_parameter_to_user(parameter: str, series: Series, list_users: list, key=None):
+    def _assign_parameter_to_user(parameter: str, series: Union[Series, list], list_users: list, key=None):
         """call _set_parameter to assign parameter for a list of users
 
         Args:
             parameter (str): parameter's name
-            series (Series): one column in csv file
+            series (Union[Series, list]): one column in csv file, or its shared values
             list_users (list): list of users
             key ([type], optional): key used when parameter is 'attributes' 
         """
         iter_users = iter(list_users)
-        series.map(lambda value: KCUser._set_parameter(
-            parameter, iter_users, key, value))
+        for value in series:
+            KCUser._set_parameter(parameter, iter_users, key, value)
         logger.info(f'Assign {parameter}  to users')
 
     @staticmethod
-    def _assign_parameters_to_list_users(csvloader: CSVLoader, list_users: list):
+    def _shared_values(series: Series) -> list:
+        """get the values of a column where equal strings are one interned object,
+        role names or attribute values repeated on every row are only stored once
+
+        Args:
+            series (Series): one column in csv file
+
+        Returns:
+            list: column values, null values are None
+        """
+        codes, uniques = factorize(series)
+        if len(uniques) == len(series):
+            return series.tolist()
+        uniques = [sys.intern(value) if isinstance(value, str) else value
+                   for value in uniques] + [None]
+        # null values have code -1, the trailing None
+        return np.array(uniques, dtype=object)[codes].tolist()
+
+    @staticmethod
+    def _assign_parameters_to_list_users(csvloader: CSVLoader, list_users: list, compact: bool = False):
         """assign parameters for each user
 
         Args:
             csvloader (CSVLoader): a Csvloader instance providing files
             list_users (list): list of empty users
+            compact (bool): share equal values between users and parameters of the same column
 
         Raises:
             KCUserError: Exception raised for errors in the KCUser
         """
         list_parameters = list(csvloader.template[Template.MAPPER].keys())
+        columns = {}
+
+        def get_column(column_name: str) -> Union[Series, list]:
+            if not compact:
+                return csvloader.data[column_name]
+            if column_name not in columns:
+                columns[column_name] = KCUser._shared_values(
+                    csvloader.data[column_name])
+            return columns[column_name]
         for parameter in list_parameters:
             if not hasattr(KCUser, parameter):
                 raise KCUser.KCUserError(
@@ -96,24 +131,38 @@ class KCUser(User):
             if parameter == Template.MAPPER_ATTRIBUTES and isinstance(column_name, list):
                 for column_name_ in column_name:
                     KCUser._assign_parameter_to_user(
-                        parameter=parameter, series=csvloader.data[column_name_.get(Template.MAPPER_ATTRIBUTES_VALUE)], list_users=list_users, key=column_name_.get(Template.MAPPER_ATTRIBUTES_KEY))
+                        parameter=parameter, series=get_column(column_name_.get(Template.MAPPER_ATTRIBUTES_VALUE)), list_users=list_users, key=column_name_.get(Template.MAPPER_ATTRIBUTES_KEY))
             else:
                 KCUser._assign_parameter_to_user(
-                    parameter, csvloader.data[column_name], list_users)
+                    parameter, get_column(column_name), list_users)
 
     @ staticmethod
-    def _add_custom_attributes(csvloader: CSVLoader, list_users: list):
+    def _add_custom_attributes(csvloader: CSVLoader, list_users: list, compact: bool = False):
         """add custom attributes when is set in valeus file
 
         Args:
             csvloader (CSVLoader): a Csvloader instance providing files
             list_users (list): list of users
+            compact (bool): share one read-only mapping of custom attributes instead of
+                copying them into the attributes of every user
 
         Raises:
             KCUserError: Exception raised for errors in the KCUser
         """
         list_attributes = csvloader.template[Template.CUSTOM_ATTRIBUTES]
         if list_attributes:
+            if compact:
+                try:
+                    custom_attributes = MappingProxyType(
+                        {attribute['key']: attribute['value'] for attribute in list_attributes})
+                except KeyError:
+                    raise KCUser.KCUserError(
+                        f'custom_attributes only have attribute key and value.')
+                for user in list_users:
+                    user.custom_attributes = custom_attributes
+                logger.info(f'Share {list_attributes}  with users')
+                return
+
             def assign_one_attribute(user: KCUser):
                 """sub function used by map
 
@@ -132,18 +181,34 @@ class KCUser(User):
             list(map(assign_one_attribute, list_users))
             logger.info(f'Assign {list_attributes}  to users')
 
+    @staticmethod
+    def get_attributes(user: 'KCUser') -> Union[dict, None]:
+        """materialise the attributes of a user, custom attributes override mapped attributes
+
+        Args:
+            user (KCUser): a user instance
+
+        Returns:
+            Union[dict, None]: user attributes
+        """
+        if not user.custom_attributes:
+            return user.attributes
+        return {**(user.attributes or {}), **user.custom_attributes}
+
     @ staticmethod
-    def create_list_users(csvloader: CSVLoader) -> list:
+    def create_list_users(csvloader: CSVLoader, compact: bool = True) -> list:
         """create list of users by loading csv file
 
         Args:
             csvloader (CSVLoader): a Csvloader instance providing files
+            compact (bool): intern repeated values and share custom attributes between users,
+                attributes sent to keycloak are built by get_attributes
 
         Returns:
             list: list of users
         """
         list_users = KCUser._create_list_empty_users(csvloader)
         KCUser._assign_parameters_to_list_users(
-            csvloader=csvloader, list_users=list_users)
-        KCUser._add_custom_attributes(csvloader, list_users)
+            csvloader=csvloader, list_users=list_users, compact=compact)
+        KCUser._add_custom_attributes(csvloader, list_users, compact=compact)
         return list_users
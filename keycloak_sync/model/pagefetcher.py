@@ -0,0 +1,125 @@
+import logging
+import threading
+from queue import Queue
+from typing import Callable, Iterator
+
+import coloredlogs
+
+logger = logging.getLogger(__name__)
+
+
+class PageFetcher:
+    """Fetch the pages of a first/max paginated endpoint in worker threads, pages are handed
+    out as they arrive through a bounded queue so that fetching overlaps processing
+
+    Args:
+        count (Callable[[], int]): returns the number of items
+        fetch_page (Callable[[int, int], list]): returns the page of max items starting at first
+        page_size (int): number of items per page
+        prefetch (int): number of pages fetched concurrently and waiting to be processed
+    """
+    DEFAULT_PAGE_SIZE = 500
+    DEFAULT_PREFETCH = 4
+    _DONE = object()
+
+    class PageFetcherError(Exception):
+        """Exception raised for errors in the PageFetcher.
+
+        Attributes:
+            message -- explanation of the error
+        """
+
+        def __init__(self, message):
+            self.message = message
+
+    def __init__(self, count: Callable[[], int], fetch_page: Callable[[int, int], list],
+                 page_size: int = DEFAULT_PAGE_SIZE, prefetch: int = DEFAULT_PREFETCH):
+        if page_size < 1 or prefetch < 1:
+            raise PageFetcher.PageFetcherError(
+                f'Page size and prefetch should be positive, got: {page_size}, {prefetch}')
+        self.count = count
+        self.fetch_page = fetch_page
+        self.page_size = page_size
+        self.prefetch = prefetch
+
+    @staticmethod
+    def set_log_level(level: str):
+        """Set log level
+
+        Args:
+            level (str): log's level
+        """
+        coloredlogs.install(level=level, logger=logger)
+
+    def _worker(self, firsts: Iterator, lock: threading.Lock, pages: Queue, stop: threading.Event):
+        """fetch pages until every first is taken, put errors in the queue
+
+        Args:
+            firsts (Iterator): shared iterator of page offsets
+            lock (threading.Lock): protects firsts
+            pages (Queue): fetched pages
+            stop (threading.Event): set when the consumer stopped
+        """
+        try:
+            while not stop.is_set():
+                with lock:
+                    first = next(firsts, None)
+                if first is None:
+                    break
+                pages.put((first, self.fetch_page(first, self.page_size)))
+        except Exception as error:
+            pages.put((None, error))
+        finally:
+            pages.put(PageFetcher._DONE)
+
+    def pages(self) -> Iterator[list]:
+        """fetch every page, in arrival order
+
+        Raises:
+            Exception: the first error raised by fetch_page
+
+        Yields:
+            Iterator[list]: pages of items
+        """
+        total = self.count()
+        last_first = max(0, total - 1) // self.page_size * self.page_size
+        firsts = iter(range(0, last_first + 1, self.page_size))
+        pages = Queue(maxsize=self.prefetch)
+        lock = threading.Lock()
+        stop = threading.Event()
+        workers = [threading.Thread(target=self._worker, args=(firsts, lock, pages, stop),
+                                    name=f'page-fetcher-{index}', daemon=True)
+                   for index in range(min(self.prefetch, last_first // self.page_size + 1))]
+        for worker in workers:
+            worker.start()
+        logger.info(
+            f'Fetch {total} items in pages of {self.page_size} with {len(workers)} workers')
+        last_page_full = False
+        try:
+            running = len(workers)
+            while running:
+                item = pages.get()
+                if item is PageFetcher._DONE:
+                    running -= 1
+                    continue
+                first, page = item
+                if first is None:
+                    raise page
+                if first == last_first:
+                    last_page_full = len(page) >= self.page_size
+                yield page
+        finally:
+            stop.set()
+            while any(worker.is_alive() for worker in workers):
+                while not pages.empty():
+                    pages.get_nowait()
+                for worker in workers:
+                    worker.join(timeout=0.01)
+        # items created while listing are past the counted pages
+        first = last_first + self.page_size
+        while last_page_full:
+            page = self.fetch_page(first, self.page_size)
+            if page:
+                yield page
+            last_page_full = len(page) >= self.page_size
+            first += self.page_size
@@ -0,0 +1,170 @@
+import base64
+import hashlib
+import json
+import logging
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from typing import Union
+
+import coloredlogs
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+
+class PasswordHasher:
+    """Hash passwords locally into keycloak stored credentials, so keycloak does not run pbkdf2 for each created user
+
+    Args:
+        algorithm (str): keycloak hash algorithm, one of ALGORITHMS
+        iterations (int): hash iterations, should match the realm password policy
+    """
+    PBKDF2 = 'pbkdf2'
+    PBKDF2_SHA256 = 'pbkdf2-sha256'
+    PBKDF2_SHA512 = 'pbkdf2-sha512'
+    ALGORITHMS = {PBKDF2: 'sha1',
+                  PBKDF2_SHA256: 'sha256',
+                  PBKDF2_SHA512: 'sha512'}
+    DEFAULT_ALGORITHM = PBKDF2_SHA256
+    DEFAULT_ITERATIONS = 27500
+    DERIVED_KEY_SIZE = 64
+    SALT_SIZE = 16
+    CHUNK_SIZE = 64
+    POLICY_ITERATIONS = re.compile(r'hashIterations\((\d+)\)')
+    POLICY_ALGORITHM = re.compile(r'hashAlgorithm\(([\w-]+)\)')
+
+    class Credential:
+        """keycloak credential representation"""
+        TYPE = 'type'
+        TYPE_VALUE = 'password'
+        SECRET_DATA = 'secretData'
+        CREDENTIAL_DATA = 'credentialData'
+        VALUE = 'value'
+        SALT = 'salt'
+        ITERATIONS = 'hashIterations'
+        ALGORITHM = 'algorithm'
+        ADDITIONAL_PARAMETERS = 'additionalParameters'
+
+    class PasswordHasherError(Exception):
+        """Exception raised for errors in the PasswordHasher.
+
+        Attributes:
+            message -- explanation of the error
+        """
+
+        def __init__(self, message):
+            self.message = message
+
+    def __init__(self, algorithm: str = DEFAULT_ALGORITHM, iterations: int = DEFAULT_ITERATIONS):
+        if algorithm not in PasswordHasher.ALGORITHMS:
+            raise PasswordHasher.PasswordHasherError(
+                f'Hash algorithm should be one of {list(PasswordHasher.ALGORITHMS)}, got: {algorithm}')
+        if iterations < 1:
+            raise PasswordHasher.PasswordHasherError(
+                f'Hash iterations should be positive, got: {iterations}')
+        self.algorithm = algorithm
+        self.iterations = iterations
+
+    @staticmethod
+    def set_log_level(level: str):
+        """Set log level
+
+        Args:
+            level (str): log's level
+        """
+        coloredlogs.install(level=level, logger=logger)
+
+    @staticmethod
+    def from_policy(policy: Union[str, None], algorithm: Union[str, None] = None,
+                    iterations: Union[int, None] = None) -> 'PasswordHasher':
+        """create a hasher matching a realm password policy, explicit settings take precedence
+
+        Args:
+            policy (Union[str, None]): realm password policy, e.g. hashIterations(27500) and length(8)
+            algorithm (Union[str, None]): hash algorithm, read from policy when None
+            iterations (Union[int, None]): hash iterations, read from policy when None
+
+        Returns:
+            PasswordHasher: password hasher
+        """
+        policy = policy or ''
+        if algorithm is None:
+            match = PasswordHasher.POLICY_ALGORITHM.search(policy)
+            algorithm = match.group(
+                1) if match else PasswordHasher.DEFAULT_ALGORITHM
+        if iterations is None:
+            match = PasswordHasher.POLICY_ITERATIONS.search(policy)
+            iterations = int(match.group(
+                1)) if match else PasswordHasher.DEFAULT_ITERATIONS
+        logger.info(f'Hash passwords with {algorithm}, {iterations} iterations')
+        return PasswordHasher(algorithm=algorithm, iterations=iterations)
+
+    @staticmethod
+    def _derive(digest: str, password: str, salt: bytes, iterations: int) -> bytes:
+        """derive one password, runs in a worker process
+
+        Args:
+            digest (str): hmac digest name
+            password (str): plaintext password
+            salt (bytes): salt
+            iterations (int): hash iterations
+
+        Returns:
+            bytes: derived key
+        """
+        return hashlib.pbkdf2_hmac(digest, password.encode('utf-8'), salt, iterations,
+                                   PasswordHasher.DERIVED_KEY_SIZE)
+
+    def credential(self, derived_key: bytes, salt: bytes) -> dict:
+        """build the stored credential sent in the user representation
+
+        Args:
+            derived_key (bytes): hashed password
+            salt (bytes): salt
+
+        Returns:
+            dict: keycloak credential representation
+        """
+        secret_data = {PasswordHasher.Credential.VALUE: base64.b64encode(derived_key).decode('ascii'),
+                       PasswordHasher.Credential.SALT: base64.b64encode(salt).decode('ascii'),
+                       PasswordHasher.Credential.ADDITIONAL_PARAMETERS: {}}
+        credential_data = {PasswordHasher.Credential.ITERATIONS: self.iterations,
+                           PasswordHasher.Credential.ALGORITHM: self.algorithm,
+                           PasswordHasher.Credential.ADDITIONAL_PARAMETERS: {}}
+        return {PasswordHasher.Credential.TYPE: PasswordHasher.Credential.TYPE_VALUE,
+                PasswordHasher.Credential.SECRET_DATA: json.dumps(secret_data),
+                PasswordHasher.Credential.CREDENTIAL_DATA: json.dumps(credential_data)}
+
+    def hash_password(self, password: str, salt: Union[bytes, None] = None) -> dict:
+        """hash one password in the current process
+
+        Args:
+            password (str): plaintext password
+            salt (Union[bytes, None]): salt, random when None
+
+        Returns:
+            dict: keycloak credential representation
+        """
+        salt = os.urandom(PasswordHasher.SALT_SIZE) if salt is None else salt
+        return self.credential(PasswordHasher._derive(PasswordHasher.ALGORITHMS[self.algorithm],
+                                                      password, salt, self.iterations), salt)
+
+    def hash_users(self, list_users: list, workers: Union[int, None] = None):
+        """hash the passwords of users in a process pool and set their credential, users without password are left unchanged
+
+        Args:
+            list_users (list): list of users
+            workers (Union[int, None]): number of processes, cpu count when None
+        """
+        users = [user for user in list_users if not pd.isnull(user.password)]
+        salts = [os.urandom(PasswordHasher.SALT_SIZE) for _ in users]
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            derived_keys = executor.map(PasswordHasher._derive,
+                                        repeat(PasswordHasher.ALGORITHMS[self.algorithm]),
+                                        [user.password for user in users], salts,
+                                        repeat(self.iterations), chunksize=PasswordHasher.CHUNK_SIZE)
+            for user, derived_key, salt in zip(users, derived_keys, salts):
+                user.credential = self.credential(derived_key, salt)
+        logger.info(f'Hash {len(users)} passwords')
@@ -0,0 +1,172 @@
+import cProfile
+import logging
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Union
+
+import coloredlogs
+
+logger = logging.getLogger(__name__)
+
+
+class Profiler:
+    """Profile a whole run with cProfile or a stack sampler and measure memory per phase with tracemalloc
+
+    Args:
+        profile_path (Union[Path, None]): pstats file (cprofile) or collapsed stacks file (sample)
+        mode (str): cprofile or sample
+        trace_malloc (bool): measure memory of each phase with tracemalloc
+        top_allocators (int): number of top allocators of each phase, found by comparing
+            tracemalloc snapshots, 0 only measures memory which is much faster
+    """
+    CPROFILE = 'cprofile'
+    SAMPLE = 'sample'
+    MODES = [CPROFILE, SAMPLE]
+    SAMPLE_INTERVAL = 0.005
+    TOP_ALLOCATORS = 5
+    SNAPSHOT_FILTERS = [tracemalloc.Filter(False, tracemalloc.__file__),
+                        tracemalloc.Filter(False, __file__),
+                        tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+                        tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'),
+                        tracemalloc.Filter(False, '<unknown>')]
+    _active = None
+
+    class Phase:
+        """Measures of one phase"""
+
+        def __init__(self, name: str):
+            self.name = name
+            self.elapsed = 0.0
+            self.memory = None
+            self.peak = None
+            self.top_allocators = []
+
+    def __init__(self, profile_path: Union[Path, None] = None, mode: str = CPROFILE, trace_malloc: bool = False,
+                 top_allocators: int = TOP_ALLOCATORS):
+        self.profile_path = profile_path
+        self.mode = mode
+        self.trace_malloc = trace_malloc
+        self.top_allocators = top_allocators
+        self.phases = []
+        self._profile = None
+        self._sampler = None
+        self._stop_sampling = threading.Event()
+        self._stacks = Counter()
+        self._snapshot = None
+
+    @staticmethod
+    def set_log_level(level: str):
+        """Set log level
+
+        Args:
+            level (str): log's level
+        """
+        coloredlogs.install(level=level, logger=logger)
+
+    def start(self):
+        """start profiling, phases are measured until stop"""
+        if self.trace_malloc:
+            tracemalloc.start()
+            if self.top_allocators:
+                self._snapshot = self._take_snapshot()
+        if self.profile_path is not None:
+            if self.mode == Profiler.SAMPLE:
+                self._sampler = threading.Thread(
+                    target=self._sample, name='profiler-sampler', daemon=True)
+                self._sampler.start()
+            else:
+                self._profile = cProfile.Profile()
+                self._profile.enable()
+        Profiler._active = self
+
+    def stop(self):
+        """stop profiling and write profile file"""
+        Profiler._active = None
+        if self._profile is not None:
+            self._profile.disable()
+            self._profile.dump_stats(str(self.profile_path))
+            logger.info(f'Write cProfile stats to {self.profile_path}')
+        if self._sampler is not None:
+            self._stop_sampling.set()
+            self._sampler.join()
+            with open(self.profile_path, 'w') as stream:
+                for stack, count in self._stacks.most_common():
+                    stream.write(f'{stack} {count}\n')
+            logger.info(f'Write collapsed stacks to {self.profile_path}')
+        if self.trace_malloc:
+            tracemalloc.stop()
+
+    def _sample(self):
+        """sample the stacks of every other thread until stop"""
+        while not self._stop_sampling.wait(Profiler.SAMPLE_INTERVAL):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == threading.get_ident():
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(
+                        f'{frame.f_code.co_name} ({Path(frame.f_code.co_filename).name}:{frame.f_code.co_firstlineno})')
+                    frame = frame.f_back
+                self._stacks[';'.join(reversed(stack))] += 1
+
+    @staticmethod
+    def _take_snapshot() -> tracemalloc.Snapshot:
+        """take a tracemalloc snapshot without tracemalloc own allocations
+
+        Returns:
+            tracemalloc.Snapshot: filtered snapshot
+        """
+        return tracemalloc.take_snapshot().filter_traces(Profiler.SNAPSHOT_FILTERS)
+
+    @staticmethod
+    @contextmanager
+    def phase(name: str):
+        """measure one phase of the run, does nothing when no profiler is active
+
+        Args:
+            name (str): phase name
+        """
+        profiler = Profiler._active
+        if profiler is None:
+            yield
+            return
+        phase = Profiler.Phase(name)
+        if profiler.trace_malloc and hasattr(tracemalloc, 'reset_peak'):
+            tracemalloc.reset_peak()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            phase.elapsed = time.perf_counter() - start
+            if profiler.trace_malloc:
+                phase.memory, phase.peak = tracemalloc.get_traced_memory()
+                if profiler.top_allocators:
+                    snapshot = Profiler._take_snapshot()
+                    phase.top_allocators = snapshot.compare_to(
+                        profiler._snapshot, 'lineno')[:profiler.top_allocators]
+                    profiler._snapshot = snapshot
+            profiler.phases.append(phase)
+            logger.info(f'Phase {name} took {phase.elapsed:.3f}s')
+
+    def summary(self) -> list:
+        """describe time, memory and top allocators of each phase
+
+        Returns:
+            list: summary lines
+        """
+        lines = []
+        for phase in self.phases:
+            line = f'{phase.name:<10} {phase.elapsed:>10.3f}s'
+            if phase.peak is not None:
+                line += f'  current {phase.memory / 2 ** 20:>9.1f}MiB  peak {phase.peak / 2 ** 20:>9.1f}MiB'
+            lines.append(line)
+            for stat in phase.top_allocators:
+                frame = stat.traceback[0]
+                lines.append(
+                    f'    {stat.size_diff / 2 ** 20:+9.2f}MiB {stat.count_diff:+9d} blocks  {frame.filename}:{frame.lineno}')
+        return lines
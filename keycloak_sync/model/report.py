@@ -0,0 +1,187 @@
+import json
+import logging
+from datetime import datetime
+from pathlib import Path
+from typing import Union
+
+import coloredlogs
+from keycloak_sync.model.shard import Shard
+
+logger = logging.getLogger(__name__)
+
+
+class RunReport:
+    """Summary of one run written as json, reports of the shards of a run can be merged.
+    A run is aborted until it is marked finished, or declined when the user did not confirm it
+
+    Args:
+        command (str): kcctl command
+        shard (Union[str, None]): shard written as i/N, None when the run is not sharded
+    """
+    COMMAND = 'command'
+    SHARDS = 'shards'
+    TOTAL = 'total'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+    FAILED_USERNAME = 'username'
+    FAILED_ERROR = 'error'
+    STARTED_AT = 'started_at'
+    FINISHED_AT = 'finished_at'
+    COMPLETE = 'complete'
+    STATUS = 'status'
+    REASON = 'reason'
+    FINISHED = 'finished'
+    DECLINED = 'declined'
+    ABORTED = 'aborted'
+    STATUSES = [FINISHED, DECLINED, ABORTED]
+
+    class RunReportError(Exception):
+        """Exception raised for errors in the RunReport.
+
+        Attributes:
+            message -- explanation of the error
+        """
+
+        def __init__(self, message):
+            self.message = message
+
+    def __init__(self, command: str, shard: Union[str, None] = None):
+        self.command = command
+        self.shards = [shard] if shard else []
+        self.total = 0
+        self.succeeded = 0
+        self.failed = []
+        self.started_at = datetime.now().isoformat()
+        self.finished_at = None
+        self.complete = True
+        self.status = RunReport.ABORTED
+        self.reason = None
+
+    @staticmethod
+    def set_log_level(level: str):
+        """Set log level
+
+        Args:
+            level (str): log's level
+        """
+        coloredlogs.install(level=level, logger=logger)
+
+    def add_results(self, results: list):
+        """count results of users operations
+
+        Args:
+            results (list): list of Keycloak.Result
+        """
+        for result in results:
+            self.total += 1
+            if result.error:
+                self.failed.append({RunReport.FAILED_USERNAME: result.username,
+                                    RunReport.FAILED_ERROR: result.error})
+            else:
+                self.succeeded += 1
+
+    def to_dict(self) -> dict:
+        """get report content
+
+        Returns:
+            dict: report content
+        """
+        return {RunReport.COMMAND: self.command,
+                RunReport.SHARDS: self.shards,
+                RunReport.TOTAL: self.total,
+                RunReport.SUCCEEDED: self.succeeded,
+                RunReport.FAILED: self.failed,
+                RunReport.STARTED_AT: self.started_at,
+                RunReport.FINISHED_AT: self.finished_at,
+                RunReport.COMPLETE: self.complete,
+                RunReport.STATUS: self.status,
+                RunReport.REASON: self.reason}
+
+    def write(self, path: Path):
+        """write report into a json file
+
+        Args:
+            path (Path): report path
+        """
+        if self.finished_at is None:
+            self.finished_at = datetime.now().isoformat()
+        with open(path, 'w') as stream:
+            json.dump(self.to_dict(), stream, indent=2)
+        logger.info(f'Write run report to {path}')
+
+    @staticmethod
+    def read(path: Path) -> 'RunReport':
+        """read a report from a json file
+
+        Args:
+            path (Path): report path
+
+        Raises:
+            RunReport.RunReportError: Exception raised for errors in the RunReport
+
+        Returns:
+            RunReport: report
+        """
+        try:
+            with open(path, 'r') as stream:
+                content = json.load(stream)
+            report = RunReport(command=content[RunReport.COMMAND])
+            report.shards = content[RunReport.SHARDS]
+            report.total = content[RunReport.TOTAL]
+            report.succeeded = content[RunReport.SUCCEEDED]
+            report.failed = content[RunReport.FAILED]
+            report.started_at = content[RunReport.STARTED_AT]
+            report.finished_at = content[RunReport.FINISHED_AT]
+            report.complete = content.get(RunReport.COMPLETE, True)
+            report.status = content.get(RunReport.STATUS, RunReport.FINISHED)
+            report.reason = content.get(RunReport.REASON)
+            if report.status not in RunReport.STATUSES:
+                raise ValueError(f'unknown status {report.status}')
+            return report
+        except (FileNotFoundError, ValueError, KeyError) as error:
+            raise RunReport.RunReportError(
+                f'Unable to read run report {path}: {error}')
+
+    @staticmethod
+    def merge(reports: list) -> 'RunReport':
+        """aggregate the reports of the shards of one run
+
+        Args:
+            reports (list): list of RunReport
+
+        Raises:
+            RunReport.RunReportError: Exception raised for errors in the RunReport
+
+        Returns:
+            RunReport: merged report, complete when every shard i/N of the run is present,
+                with the status of its least finished shard
+        """
+        if not reports:
+            raise RunReport.RunReportError('No report to merge')
+        commands = {report.command for report in reports}
+        if len(commands) > 1:
+            raise RunReport.RunReportError(
+                f'Unable to merge reports of different commands: {sorted(commands)}')
+        merged = RunReport(command=reports[0].command)
+        for report in reports:
+            merged.shards.extend(report.shards)
+            merged.total += report.total
+            merged.succeeded += report.succeeded
+            merged.failed.extend(report.failed)
+            merged.complete = merged.complete and report.complete
+        worst = max(reports, key=lambda report: RunReport.STATUSES.index(report.status))
+        merged.status = worst.status
+        merged.reason = worst.reason
+        merged.started_at = min(report.started_at for report in reports)
+        merged.finished_at = max(
+            report.finished_at or report.started_at for report in reports)
+        counts = {shard.split(Shard.SEPARATOR)[1]
+                  for shard in merged.shards}
+        if merged.shards:
+            expected = {str(Shard(index, int(count))) for count in counts
+                        for index in range(int(count))}
+            if len(counts) > 1 or set(merged.shards) != expected or len(merged.shards) != len(expected):
+                logger.warning(
+                    f'Shards {sorted(expected - set(merged.shards))} are missing or duplicated')
+                merged.complete = False
+        return merged
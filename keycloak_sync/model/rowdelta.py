@@ -0,0 +1,158 @@
+import logging
+from pathlib import Path
+from typing import Union
+
+import coloredlogs
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from keycloak_sync.model.csvloader import CSVLoader
+
+logger = logging.getLogger(__name__)
+
+
+class RowDelta:
+    """Rows added, changed and removed since the last successfully applied file
+
+    Args:
+        csvloader (CSVLoader): loaded users file
+        previous (Union[pd.DataFrame, None]): state of the last run, None on first run
+        previous_fingerprint (Union[str, None]): mapping fingerprint of the last run
+    """
+    KEY = 'username'
+    HASH = 'hash'
+    FINGERPRINT = b'keycloak_sync.mapping_fingerprint'
+    STATE_SUFFIX = '.rowhash.parquet'
+
+    class RowDeltaError(Exception):
+        """Exception raised for errors in the RowDelta.
+
+        Attributes:
+            message -- explanation of the error
+        """
+
+        def __init__(self, message):
+            self.message = message
+
+    def __init__(self, csvloader: CSVLoader, previous: Union[pd.DataFrame, None] = None,
+                 previous_fingerprint: Union[str, None] = None):
+        self.fingerprint = csvloader.mapping_fingerprint()
+        self.state = pd.DataFrame({RowDelta.KEY: csvloader.usernames().to_numpy(),
+                                   RowDelta.HASH: csvloader.row_hashes().to_numpy()})
+        if previous is None or previous_fingerprint != self.fingerprint:
+            if previous is not None:
+                logger.warning(
+                    'Template mapping changed since last run, every row is applied')
+            self.added = np.ones(len(self.state), dtype=bool)
+            self.changed = np.zeros(len(self.state), dtype=bool)
+            self.removed = [] if previous is None else sorted(
+                set(previous[RowDelta.KEY]) - set(self.state[RowDelta.KEY]))
+        else:
+            # a row hash covers the username, so only rows whose hash is new or gone
+            # need their username looked up, which keeps string work to the delta size
+            new_rows = np.flatnonzero(~self.state[RowDelta.HASH].isin(
+                previous[RowDelta.HASH]).to_numpy())
+            new_keys = self.state[RowDelta.KEY].iloc[new_rows].tolist()
+            gone_keys = previous.loc[~previous[RowDelta.HASH].isin(
+                self.state[RowDelta.HASH]), RowDelta.KEY].tolist()
+            gone = set(gone_keys)
+            known = np.fromiter((key in gone for key in new_keys),
+                                dtype=bool, count=len(new_keys))
+            self.added = np.zeros(len(self.state), dtype=bool)
+            self.changed = np.zeros(len(self.state), dtype=bool)
+            self.added[new_rows[~known]] = True
+            self.changed[new_rows[known]] = True
+            new = set(new_keys)
+            self.removed = sorted({key for key in gone_keys if key not in new})
+        logger.info(
+            f'Rows added: {int(self.added.sum())}, changed: {int(self.changed.sum())}, removed: {len(self.removed)}')
+
+    @staticmethod
+    def set_log_level(level: str):
+        """Set log level
+
+        Args:
+            level (str): log's level
+        """
+        coloredlogs.install(level=level, logger=logger)
+
+    @staticmethod
+    def default_state_path(csvfile: Path, suffix: str = '') -> Path:
+        """state file stored next to the users file
+
+        Args:
+            csvfile (Path): users file path
+            suffix (str): distinguishes the states of shards
+
+        Returns:
+            Path: state file path
+        """
+        return Path(f'{csvfile}{suffix}{RowDelta.STATE_SUFFIX}')
+
+    @staticmethod
+    def load(csvloader: CSVLoader, state_path: Path) -> 'RowDelta':
+        """compare loaded rows with the state file of the last run
+
+        Args:
+            csvloader (CSVLoader): loaded users file
+            state_path (Path): state file, missing on first run
+
+        Raises:
+            RowDelta.RowDeltaError: Exception raised for errors in the RowDelta
+
+        Returns:
+            RowDelta: delta of the loaded rows
+        """
+        if not Path(state_path).exists():
+            logger.info(f'No state file {state_path}, every row is applied')
+            return RowDelta(csvloader)
+        try:
+            table = pq.read_table(str(state_path), memory_map=True)
+        except (pa.ArrowInvalid, OSError) as error:
+            raise RowDelta.RowDeltaError(
+                f'Unable to read state file {state_path}: {error}')
+        fingerprint = (table.schema.metadata or {}).get(RowDelta.FINGERPRINT)
+        return RowDelta(csvloader, table.to_pandas(), fingerprint and fingerprint.decode('utf-8'))
+
+    @property
+    def selected(self) -> np.ndarray:
+        """mask of the rows to apply
+
+        Returns:
+            np.ndarray: true for added and changed rows
+        """
+        return self.added | self.changed
+
+    def select_rows(self, csvloader: CSVLoader):
+        """keep the added and changed rows in csvloader
+
+        Args:
+            csvloader (CSVLoader): loaded users file
+        """
+        csvloader.data = csvloader.data[self.selected].reset_index(drop=True)
+
+    def write_state(self, state_path: Path, failed_usernames: Union[list, None] = None,
+                    pending_removed: Union[list, None] = None):
+        """save row hashes of the applied file, failed users are left out so that they are applied again
+
+        Args:
+            state_path (Path): state file
+            failed_usernames (Union[list, None]): usernames which were not applied, None for rows
+                without username, e.g. quarantined rows, which are then all applied again
+            pending_removed (Union[list, None]): removed usernames which are not deleted yet,
+                they are kept in state so that they are removed again next run
+        """
+        state = self.state
+        if failed_usernames:
+            state = state[~state[RowDelta.KEY].isin(
+                [(username or '').lower() for username in failed_usernames])]
+        if pending_removed:
+            state = pd.concat([state, pd.DataFrame({RowDelta.KEY: pending_removed,
+                                                    RowDelta.HASH: np.zeros(len(pending_removed), dtype=np.uint64)})],
+                              ignore_index=True)
+        table = pa.Table.from_pandas(state, preserve_index=False)
+        table = table.replace_schema_metadata({**(table.schema.metadata or {}),
+                                               RowDelta.FINGERPRINT: self.fingerprint.encode('utf-8')})
+        pq.write_table(table, str(state_path))
+        logger.info(f'Write {len(state)} row hashes to {state_path}')
@@ -0,0 +1,222 @@
+import io
+import logging
+from contextlib import contextmanager
+from pathlib import Path, PurePath
+from typing import BinaryIO, Iterator, Union
+
+import boto3
+import coloredlogs
+from botocore.exceptions import BotoCoreError, ClientError
+from keycloak_sync.abstract_model.storageprovider import StorageProvider
+
+logger = logging.getLogger(__name__)
+
+
+class S3Storage(StorageProvider):
+    """S3 compatible storage, e.g. AWS S3, Scaleway or MinIO through endpoint_url
+
+    Args:
+        endpoint_url (Union[str, None]): storage endpoint, AWS S3 when None
+        client (Union[object, None]): boto3 s3 client, created from endpoint_url when None
+        part_size (int): size of multipart upload parts
+    """
+    # S3 parts are at least 5 MiB except the last one
+    MIN_PART_SIZE = 5 * 2 ** 20
+    PART_SIZE = 8 * 2 ** 20
+    NOT_FOUND = ['404', 'NoSuchKey', 'NoSuchBucket']
+
+    class MultipartWriter(io.BufferedIOBase):
+        """Binary writer uploading a part each time part_size bytes are written,
+        small files are uploaded with a single put
+
+        Args:
+            client (object): boto3 s3 client
+            bucket_name (str): bucket name
+            key (str): destination key
+            part_size (int): size of uploaded parts
+        """
+
+        def __init__(self, client, bucket_name: str, key: str, part_size: int):
+            super().__init__()
+            self.client = client
+            self.bucket_name = bucket_name
+            self.key = key
+            self.part_size = part_size
+            self.upload_id = None
+            self.parts = []
+            self._buffer = bytearray()
+            self._position = 0
+
+        def writable(self) -> bool:
+            return True
+
+        def tell(self) -> int:
+            return self._position
+
+        def write(self, data) -> int:
+            if self.closed:
+                raise ValueError('write to closed file')
+            self._buffer += data
+            self._position += len(data)
+            while len(self._buffer) >= self.part_size:
+                self._upload_part(bytes(self._buffer[:self.part_size]))
+                del self._buffer[:self.part_size]
+            return len(data)
+
+        def _upload_part(self, body: bytes):
+            """upload the next part, the multipart upload is started by the first part
+
+            Args:
+                body (bytes): part content
+            """
+            if self.upload_id is None:
+                self.upload_id = self.client.create_multipart_upload(
+                    Bucket=self.bucket_name, Key=self.key)['UploadId']
+            part_number = len(self.parts) + 1
+            response = self.client.upload_part(Bucket=self.bucket_name, Key=self.key, UploadId=self.upload_id,
+                                               PartNumber=part_number, Body=body)
+            self.parts.append(
+                {'ETag': response['ETag'], 'PartNumber': part_number})
+            logger.debug(
+                f'Upload part {part_number} of {self.key}, {len(body)} bytes')
+
+        def close(self):
+            """upload the remaining bytes and complete the upload"""
+            if self.closed:
+                return
+            try:
+                if self.upload_id is None:
+                    self.client.put_object(
+                        Bucket=self.bucket_name, Key=self.key, Body=bytes(self._buffer))
+                else:
+                    if self._buffer:
+                        self._upload_part(bytes(self._buffer))
+                    self.client.complete_multipart_upload(Bucket=self.bucket_name, Key=self.key,
+                                                          UploadId=self.upload_id,
+                                                          MultipartUpload={'Parts': self.parts})
+            except BaseException:
+                self._abort_upload()
+                raise
+            finally:
+                self._buffer = bytearray()
+                super().close()
+
+        def _abort_upload(self):
+            """discard the uploaded parts"""
+            if self.upload_id is not None:
+                self.client.abort_multipart_upload(
+                    Bucket=self.bucket_name, Key=self.key, UploadId=self.upload_id)
+                self.upload_id = None
+
+        def abort(self):
+            """discard the written bytes, no file is created"""
+            if self.closed:
+                return
+            try:
+                self._abort_upload()
+            finally:
+                self._buffer = bytearray()
+                super().close()
+
+    def __init__(self, endpoint_url: Union[str, None] = None, client=None, part_size: int = PART_SIZE):
+        if part_size < S3Storage.MIN_PART_SIZE:
+            raise S3Storage.StorageProviderERROR(
+                f'Part size should be at least {S3Storage.MIN_PART_SIZE} bytes, got: {part_size}')
+        self.client = client or boto3.client('s3', endpoint_url=endpoint_url)
+        self.part_size = part_size
+
+    @staticmethod
+    def set_log_level(level: str):
+        """Set log level
+
+        Args:
+            level (str): log's level
+        """
+        coloredlogs.install(level=level, logger=logger)
+
+    def download(self, bucket_name: str, source_file: PurePath, destination_file: Path):
+        """Download file from bucket
+
+        Args:
+            bucket_name (str): bucket name
+            source_file (PurePath): source file path
+            destination_file (Path): destination path
+
+        Raises:
+            S3Storage.StorageProviderERROR: Exception raised for errors in the StorageProvider
+        """
+        try:
+            self.client.download_file(
+                bucket_name, str(source_file), str(destination_file))
+            logger.info(f"Download {str(destination_file)}")
+        except (BotoCoreError, ClientError) as error:
+            raise S3Storage.StorageProviderERROR(error)
+
+    def upload(self, bucket_name: str, source_file: Path, destination_file: PurePath):
+        """Upload file to bucket, large files are uploaded in parts
+
+        Args:
+            bucket_name (str): bucket name
+            source_file (Path): local file path
+            destination_file (PurePath): destination path in bucket
+
+        Raises:
+            S3Storage.StorageProviderERROR: Exception raised for errors in the StorageProvider
+        """
+        try:
+            self.client.upload_file(
+                str(source_file), bucket_name, str(destination_file))
+            logger.info(f"Upload {str(destination_file)}")
+        except (BotoCoreError, ClientError) as error:
+            raise S3Storage.StorageProviderERROR(error)
+
+    def exists(self, bucket_name: str, source_file: PurePath) -> bool:
+        """Check a file exists in bucket
+
+        Args:
+            bucket_name (str): bucket name
+            source_file (PurePath): file path in bucket
+
+        Raises:
+            S3Storage.StorageProviderERROR: Exception raised for errors in the StorageProvider
+
+        Returns:
+            bool: true when file exists
+        """
+        try:
+            self.client.head_object(Bucket=bucket_name, Key=str(source_file))
+            return True
+        except ClientError as error:
+            if error.response.get('Error', {}).get('Code') in S3Storage.NOT_FOUND:
+                return False
+            raise S3Storage.StorageProviderERROR(error)
+        except BotoCoreError as error:
+            raise S3Storage.StorageProviderERROR(error)
+
+    @contextmanager
+    def open_writer(self, bucket_name: str, destination_file: PurePath) -> Iterator[BinaryIO]:
+        """Stream a file to bucket with a multipart upload, the file is only created
+        when the block exits without error
+
+        Args:
+            bucket_name (str): bucket name
+            destination_file (PurePath): destination path in bucket
+
+        Raises:
+            S3Storage.StorageProviderERROR: Exception raised for errors in the StorageProvider
+
+        Yields:
+            Iterator[BinaryIO]: binary writer
+        """
+        writer = S3Storage.MultipartWriter(client=self.client, bucket_name=bucket_name,
+                                           key=str(destination_file), part_size=self.part_size)
+        try:
+            yield writer
+            writer.close()
+            logger.info(f"Upload {str(destination_file)}")
+        except (BotoCoreError, ClientError) as error:
+            writer.abort()
+            raise S3Storage.StorageProviderERROR(error)
+        except BaseException:
+            writer.abort()
+            raise
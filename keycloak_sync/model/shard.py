@@ -0,0 +1,119 @@
+import hashlib
+import logging
+
+import coloredlogs
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+
+class Shard:
+    """One shard out of count, a user always belongs to the shard selected by
+    the hash of its lower-cased username
+
+    Args:
+        index (int): shard index, from 0 to count - 1
+        count (int): number of shards
+    """
+    SEPARATOR = '/'
+
+    class ShardError(Exception):
+        """Exception raised for errors in the Shard.
+
+        Attributes:
+            message -- explanation of the error
+        """
+
+        def __init__(self, message):
+            self.message = message
+
+    def __init__(self, index: int, count: int):
+        if count < 1 or not 0 <= index < count:
+            raise Shard.ShardError(
+                f'Shard index should be between 0 and {count - 1}')
+        self.index = index
+        self.count = count
+
+    def __str__(self) -> str:
+        return f'{self.index}{Shard.SEPARATOR}{self.count}'
+
+    @staticmethod
+    def set_log_level(level: str):
+        """Set log level
+
+        Args:
+            level (str): log's level
+        """
+        coloredlogs.install(level=level, logger=logger)
+
+    @staticmethod
+    def parse(value: str) -> 'Shard':
+        """parse a shard written as i/N
+
+        Args:
+            value (str): shard description
+
+        Raises:
+            Shard.ShardError: Exception raised for errors in the Shard
+
+        Returns:
+            Shard: parsed shard
+        """
+        try:
+            index, count = value.split(Shard.SEPARATOR)
+            return Shard(index=int(index), count=int(count))
+        except ValueError:
+            raise Shard.ShardError(
+                f'Shard should be written as i/N, got: {value}')
+
+    @staticmethod
+    def index_of(username: str, count: int) -> int:
+        """get the shard of a username, stable across processes and python versions
+
+        Args:
+            username (str): username
+            count (int): number of shards
+
+        Returns:
+            int: shard index
+        """
+        digest = hashlib.md5(
+            str(username or '').lower().encode('utf-8')).digest()
+        return int.from_bytes(digest[:8], 'big') % count
+
+    def contains(self, username: str) -> bool:
+        """check a username belongs to this shard
+
+        Args:
+            username (str): username
+
+        Returns:
+            bool: true when user is processed by this shard
+        """
+        return Shard.index_of(username, self.count) == self.index
+
+    def filter_dataframe(self, dataframe: pd.DataFrame, column: str) -> pd.DataFrame:
+        """keep the rows of this shard
+
+        Args:
+            dataframe (pd.DataFrame): users rows
+            column (str): username column
+
+        Returns:
+            pd.DataFrame: rows of this shard
+        """
+        mask = dataframe[column].map(self.contains).astype(bool)
+        logger.info(
+            f'Shard {self} keeps {int(mask.sum())} of {len(dataframe)} rows')
+        return dataframe[mask].reset_index(drop=True)
+
+    def filter_users(self, list_users: list) -> list:
+        """keep the users of this shard
+
+        Args:
+            list_users (list): list of users
+
+        Returns:
+            list: users of this shard
+        """
+        return [user for user in list_users if self.contains(user.username)]
@@ -0,0 +1,172 @@
+import json
+import logging
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Union
+
+import coloredlogs
+
+logger = logging.getLogger(__name__)
+
+
+class Watermark:
+    """High-water mark of an incremental export, the latest user creation or modification exported.
+    It never goes past the start of the listing minus an overlap window, users exported after it
+    are kept by id so that the next export skips them
+
+    Args:
+        timestamp (Union[int, None]): timestamp in ms, None before the first export
+        exported (Union[dict, None]): {user id: latest timestamp in ms} of users exported after timestamp
+    """
+    TIMESTAMP = 'timestamp'
+    EXPORTED = 'exported'
+    UPDATED_AT = 'updated_at'
+    OVERLAP = 5 * 60 * 1000
+    SUFFIX = '.watermark.json'
+    APPEND = 'append'
+    PARTS = 'parts'
+    OUTPUT_MODES = [APPEND, PARTS]
+    PART_FORMAT = '%Y%m%dT%H%M%S'
+
+    class WatermarkError(Exception):
+        """Exception raised for errors in the Watermark.
+
+        Attributes:
+            message -- explanation of the error
+        """
+
+        def __init__(self, message):
+            self.message = message
+
+    def __init__(self, timestamp: Union[int, None] = None, exported: Union[dict, None] = None):
+        self.timestamp = timestamp
+        self.exported = exported or {}
+
+    @staticmethod
+    def set_log_level(level: str):
+        """Set log level
+
+        Args:
+            level (str): log's level
+        """
+        coloredlogs.install(level=level, logger=logger)
+
+    @staticmethod
+    def default_path(output: Path) -> Path:
+        """watermark stored next to the export file
+
+        Args:
+            output (Path): export file path
+
+        Returns:
+            Path: watermark file path
+        """
+        return Path(f'{output}{Watermark.SUFFIX}')
+
+    @staticmethod
+    def part_path(output: Path, now: Union[datetime, None] = None) -> Path:
+        """dated part file of an export, e.g. users.20210301T020000.csv
+
+        Args:
+            output (Path): export file path
+            now (Union[datetime, None]): date of the part, now when None
+
+        Returns:
+            Path: part file path
+        """
+        output = Path(output)
+        now = now or datetime.now()
+        return output.with_name(f'{output.stem}.{now.strftime(Watermark.PART_FORMAT)}{output.suffix}')
+
+    @staticmethod
+    def now() -> int:
+        """current time, taken before listing users
+
+        Returns:
+            int: timestamp in ms
+        """
+        return int(time.time() * 1000)
+
+    @staticmethod
+    def _latest(user) -> Union[int, None]:
+        """latest creation or modification of a user
+
+        Args:
+            user (KCUser): exported user
+
+        Returns:
+            Union[int, None]: timestamp in ms, None when unknown
+        """
+        return max(filter(None, (user.createdtimestamp, user.modifiedtimestamp)), default=None)
+
+    @staticmethod
+    def read(path: Path) -> 'Watermark':
+        """read the watermark of the last export
+
+        Args:
+            path (Path): watermark file, missing before the first export
+
+        Raises:
+            Watermark.WatermarkError: Exception raised for errors in the Watermark
+
+        Returns:
+            Watermark: watermark of the last export
+        """
+        if not Path(path).exists():
+            logger.info(f'No watermark {path}, every user is exported')
+            return Watermark()
+        try:
+            with open(path, 'r') as stream:
+                content = json.load(stream)
+            return Watermark(int(content[Watermark.TIMESTAMP]),
+                             {user_id: int(timestamp) for user_id, timestamp in (content.get(Watermark.EXPORTED) or {}).items()})
+        except (ValueError, KeyError, TypeError, AttributeError) as error:
+            raise Watermark.WatermarkError(
+                f'Unable to read watermark {path}: {error}')
+
+    def select(self, list_users: list) -> list:
+        """drop the users already exported by the last export within the overlap window
+
+        Args:
+            list_users (list): users created or modified since the watermark
+
+        Returns:
+            list: users which were not exported yet
+        """
+        return [user for user in list_users
+                if user.id not in self.exported or (Watermark._latest(user) or 0) > self.exported[user.id]]
+
+    def advance(self, list_users: list, started: int):
+        """move the watermark to the latest creation or modification of exported users,
+        at most to the start of the listing minus the overlap window: a user created while
+        pages were read may be missing from the listing although a later one was exported
+
+        Args:
+            list_users (list): exported users
+            started (int): time in ms taken before listing users
+        """
+        exported = dict(self.exported)
+        for user in list_users:
+            latest = Watermark._latest(user)
+            if latest:
+                exported[user.id] = max(exported.get(user.id, 0), latest)
+        if not exported:
+            return
+        timestamp = min(max(exported.values()), started - Watermark.OVERLAP)
+        if self.timestamp is None or timestamp > self.timestamp:
+            self.timestamp = timestamp
+        self.exported = {user_id: timestamp for user_id, timestamp in exported.items()
+                         if timestamp > self.timestamp}
+
+    def write(self, path: Path):
+        """save the watermark
+
+        Args:
+            path (Path): watermark file
+        """
+        with open(path, 'w') as stream:
+            json.dump({Watermark.TIMESTAMP: self.timestamp,
+                       Watermark.EXPORTED: self.exported,
+                       Watermark.UPDATED_AT: datetime.now().isoformat()}, stream, indent=2)
+        logger.info(f'Write watermark {self.timestamp} to {path}')
@@ -0,0 +1,15 @@
+import pytest
+
+from keycloak_sync.model.csvloader import CSVLoader
+from tests.users import HEADER, write_template
+
+
+@pytest.fixture
+def make_loader(tmp_path):
+    """write rows into a users file of the client template and load it"""
+    def make_loader(rows: list, name: str = 'users.csv', **changes) -> CSVLoader:
+        csvfile = tmp_path / name
+        csvfile.write_text('ignored line\n' + HEADER + '\n' + '\n'.join(rows) + '\n',
+                           encoding='latin1')
+        return CSVLoader(template=write_template(tmp_path, **changes), csvfile=csvfile)
+    return make_loader
@@ -0,0 +1,73 @@
+import pandas as pd
+import pyarrow as pa
+import pytest
+
+from keycloak_sync.model.csvloader import CSVLoader
+from keycloak_sync.model.fileformat import FileFormat
+from tests.users import HEADER, user_row, write_template
+
+
+def test_quarantine_rejects_invalid_rows(make_loader, tmp_path):
+    rows = [user_row(index) for index in range(10)]
+    rows[2] = user_row(2, custom='bad')
+    csvloader = make_loader(rows)
+    rejects = csvloader.quarantine(
+        reject_path=tmp_path / 'rejected.csv', max_reject_ratio=0.1)
+    assert rejects['Mail'].tolist() == ['user2@test.com']
+    assert len(csvloader.data) == 9
+    written = pd.read_csv(tmp_path / 'rejected.csv', sep=';', encoding='latin1')
+    assert written[CSVLoader.REJECT_REASON].tolist() == [
+        "Custom col: value does not match regex '^[0-9A-Z]{6}(_[0-9A-Z]{6})*$'"]
+
+
+def test_quarantine_aborts_above_ratio(make_loader, tmp_path):
+    rows = [user_row(index) for index in range(10)]
+    rows[2] = user_row(2, custom='bad')
+    rows[5] = user_row(5, custom='bad')
+    csvloader = make_loader(rows)
+    with pytest.raises(CSVLoader.CSVLoaderError):
+        csvloader.quarantine(reject_path=tmp_path /
+                             'rejected.csv', max_reject_ratio=0.1)
+    csvloader.quarantine(reject_path=tmp_path / 'rejected.csv',
+                         max_reject_ratio=0.1, total_rows=100)
+    assert len(csvloader.data) == 8
+
+
+def test_quarantine_arrow_rejects_as_parquet(tmp_path):
+    rows = [HEADER, user_row(0), user_row(1, custom='bad')]
+    dataframe = pd.DataFrame([row.split(';') for row in rows[1:]],
+                             columns=rows[0].split(';'))
+    with pa.OSFile(str(tmp_path / 'users.arrow'), 'wb') as sink:
+        table = pa.Table.from_pandas(dataframe, preserve_index=False)
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    csvloader = CSVLoader(template=write_template(tmp_path, format=FileFormat.ARROW),
+                          csvfile=tmp_path / 'users.arrow')
+    assert csvloader.reject_format() == FileFormat.PARQUET
+    csvloader.quarantine(reject_path=tmp_path / 'rejected.parquet', max_reject_ratio=1)
+    assert pd.read_parquet(tmp_path / 'rejected.parquet')['Mail'].tolist() == ['user1@test.com']
+
+
+def test_quarantine_ratio_limits(make_loader, tmp_path):
+    rows = [user_row(index) for index in range(10)]
+    rows[2] = user_row(2, custom='bad', mail='bad mail')
+    csvloader = make_loader(rows)
+    rejects = csvloader.quarantine(reject_path=tmp_path / 'rejected.csv', max_reject_ratio=0.1)
+    assert rejects[CSVLoader.REJECT_REASON].str.count('; ').tolist() == [1]
+    csvloader = make_loader([user_row(index) for index in range(10)], name='valid.csv')
+    assert csvloader.quarantine(reject_path=tmp_path / 'none.csv', max_reject_ratio=0).empty
+    assert not (tmp_path / 'none.csv').exists()
+    assert len(csvloader.data) == 10
+
+
+def test_quarantine_abort_keeps_rows(make_loader, tmp_path):
+    csvloader = make_loader([user_row(0), user_row(1, custom='bad')])
+    with pytest.raises(CSVLoader.CSVLoaderError):
+        csvloader.quarantine(reject_path=tmp_path / 'rejected.csv', max_reject_ratio=0.49)
+    assert len(csvloader.data) == 2
+    assert (tmp_path / 'rejected.csv').exists()
+
+
+def test_csv_template_without_separator(make_loader):
+    with pytest.raises(CSVLoader.CSVLoaderError, match='separator'):
+        make_loader([user_row(0)], separator=None)
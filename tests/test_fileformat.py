@@ -0,0 +1,80 @@
+import io
+
+import pandas as pd
+import pyarrow as pa
+import pytest
+
+from keycloak_sync.model.fileformat import FileFormat
+
+RECORDS = [{'username': 'user1', 'role': 'Admin', 'phone': '0601'},
+           {'username': 'usér2', 'role': None, 'phone': '0602'},
+           {'username': 'user3', 'role': 'User', 'phone': None}]
+USERS = pd.DataFrame(RECORDS, dtype=object)
+
+
+@pytest.mark.parametrize('file_format', FileFormat.WRITE_FORMATS)
+def test_write_read(file_format, tmp_path):
+    path = tmp_path / f'users.{file_format.lower()}'
+    FileFormat.write(file_format=file_format, dataframe=USERS, path=path)
+    dataframe = FileFormat.read(file_format=file_format.lower(), path=path, separator=';',
+                                string_columns=list(USERS.columns))
+    assert dataframe.to_dict('records') == RECORDS
+
+
+def test_read_arrow(tmp_path):
+    path = tmp_path / 'users.arrow'
+    table = pa.Table.from_pandas(USERS, preserve_index=False)
+    with pa.OSFile(str(path), 'wb') as sink, pa.ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)
+    assert FileFormat.read(file_format=FileFormat.ARROW, path=path).to_dict(
+        'records') == RECORDS
+
+
+def test_read_csv_options(tmp_path):
+    path = tmp_path / 'users.csv'
+    path.write_bytes('comment\nuser;phone\nusér1;0601\n'.encode('latin1'))
+    dataframe = FileFormat.read(file_format=FileFormat.CSV, path=path, separator=';', encoding='latin1',
+                                ignore_n_rows=1, string_columns=['phone'])
+    assert dataframe.to_dict('records') == [{'user': 'usér1', 'phone': '0601'}]
+    dataframe = FileFormat.read(file_format=FileFormat.CSV, path=path, separator=';', encoding='latin1',
+                                header=None, ignore_n_rows=2)
+    assert dataframe.shape == (1, 2)
+
+
+@pytest.mark.parametrize('file_format', [FileFormat.CSV, FileFormat.JSONL])
+def test_append(file_format, tmp_path):
+    path = tmp_path / f'users.{file_format.lower()}'
+    FileFormat.write(file_format=file_format, dataframe=USERS.iloc[:1], path=path, append=True)
+    FileFormat.write(file_format=file_format, dataframe=USERS.iloc[1:], path=path, append=True)
+    dataframe = FileFormat.read(file_format=file_format, path=path, separator=';',
+                                string_columns=list(USERS.columns))
+    assert dataframe.to_dict('records') == RECORDS
+
+
+def test_append_errors(tmp_path):
+    with pytest.raises(FileFormat.FileFormatError):
+        FileFormat.write(file_format=FileFormat.PARQUET, dataframe=USERS,
+                         path=tmp_path / 'users.parquet', append=True)
+    with pytest.raises(FileFormat.FileFormatError):
+        FileFormat.write(file_format=FileFormat.CSV, dataframe=USERS,
+                         path=io.BytesIO(), append=True)
+
+
+def test_write_stream():
+    stream = io.BytesIO()
+    FileFormat.write(file_format=FileFormat.CSV, dataframe=USERS.iloc[:2], path=stream,
+                     separator=',', encoding='latin1')
+    assert stream.getvalue() == 'username,role,phone\nuser1,Admin,0601\nusér2,,0602\n'.encode('latin1')
+    assert not stream.closed
+
+
+def test_unsupported_formats(tmp_path):
+    with pytest.raises(FileFormat.FileFormatError):
+        FileFormat.write(file_format=FileFormat.ARROW, dataframe=USERS,
+                         path=tmp_path / 'users.arrow')
+    with pytest.raises(FileFormat.FileFormatError):
+        FileFormat.read(file_format='xml', path=tmp_path / 'users.xml')
+    (tmp_path / 'users.parquet').write_text('not parquet')
+    with pytest.raises(FileFormat.FileFormatError):
+        FileFormat.read(file_format=FileFormat.PARQUET,
+                        path=tmp_path / 'users.parquet')
@@ -0,0 +1,79 @@
+from pathlib import PurePath
+from types import SimpleNamespace
+
+import pytest
+from google.api_core.exceptions import NotFound
+
+from keycloak_sync.model import googlestorage
+from keycloak_sync.model.googlestorage import GoogleStorage
+
+
+class StubBlobWriter:
+    """in memory stand-in of google.cloud.storage.fileio.BlobWriter"""
+
+    def __init__(self, bucket, name, fail_on_close=False):
+        self.bucket = bucket
+        self.name = name
+        self.fail_on_close = fail_on_close
+        self.buffer = bytearray()
+        self.terminated = False
+
+    def write(self, data):
+        self.buffer += data
+        return len(data)
+
+    def close(self):
+        if self.fail_on_close:
+            raise NotFound('bucket not found')
+        self.bucket.objects[self.name] = bytes(self.buffer)
+
+    def terminate(self):
+        self.terminated = True
+
+
+class StubBucket:
+    def __init__(self, fail_on_close=False):
+        self.objects = {}
+        self.writers = []
+        self.fail_on_close = fail_on_close
+
+    def blob(self, name, chunk_size=None):
+        def open(mode, ignore_flush=False):
+            assert mode == 'wb' and ignore_flush
+            writer = StubBlobWriter(self, name, self.fail_on_close)
+            self.writers.append(writer)
+            return writer
+        return SimpleNamespace(open=open)
+
+
+@pytest.fixture
+def bucket(monkeypatch):
+    bucket = StubBucket()
+    client = SimpleNamespace(bucket=lambda name: bucket)
+    monkeypatch.setattr(googlestorage, 'storage',
+                        SimpleNamespace(Client=lambda: client))
+    return bucket
+
+
+def test_upload_is_finalized(bucket):
+    with GoogleStorage.open_writer('bucket', PurePath('users.csv')) as writer:
+        writer.write(b'username\n')
+    assert bucket.objects == {'users.csv': b'username\n'}
+    assert not bucket.writers[0].terminated
+
+
+def test_failed_export_is_terminated(bucket):
+    with pytest.raises(RuntimeError):
+        with GoogleStorage.open_writer('bucket', PurePath('users.csv')) as writer:
+            writer.write(b'username\n')
+            raise RuntimeError('export failed')
+    assert bucket.objects == {}
+    assert bucket.writers[0].terminated
+
+
+def test_api_error_is_storage_error(bucket):
+    bucket.fail_on_close = True
+    with pytest.raises(GoogleStorage.StorageProviderERROR):
+        with GoogleStorage.open_writer('bucket', PurePath('users.csv')) as writer:
+            writer.write(b'username\n')
+    assert bucket.writers[0].terminated
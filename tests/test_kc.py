@@ -0,0 +1,87 @@
+import threading
+from types import SimpleNamespace
+
+from keycloak_sync.model.csvloader import Template
+from keycloak_sync.model.kc import Keycloak
+from keycloak_sync.model.kcquery import KCQuery
+from keycloak_sync.model.kcuser import KCUser
+
+
+class StubAdmin:
+    """in memory stand-in of the KeycloakAdmin calls used to add users"""
+    client_id = 'client'
+
+    def __init__(self, realm):
+        self.realm = realm
+
+    def get_realm_roles(self):
+        return [{'name': 'Admin', 'id': 'admin-id'}, {'name': 'User', 'id': 'user-id'}]
+
+    def get_user_id(self, username):
+        return self.realm.users.get(username)
+
+    def delete_user(self, user_id):
+        with self.realm.lock:
+            self.realm.deleted.append(user_id)
+
+    def create_user(self, payload):
+        with self.realm.lock:
+            self.realm.users[payload['username']] = f'id-{payload["username"]}'
+
+    def get_realm_roles_of_user(self, user_id):
+        with self.realm.lock:
+            self.realm.role_lookups.append(user_id)
+        return [{'name': name} for name in self.realm.user_roles.get(user_id, [])]
+
+    def assign_realm_roles(self, user_id, client_id, roles):
+        with self.realm.lock:
+            self.realm.roles[user_id] = roles[0]['name']
+
+
+class StubRealm:
+    def __init__(self, users):
+        self.users = dict(users)
+        self.deleted = []
+        self.roles = {}
+        self.user_roles = {}
+        self.role_lookups = []
+        self.lock = threading.Lock()
+
+
+class StubKeycloak(Keycloak):
+    def __init__(self, realm):
+        super().__init__(server_url='url', client_id='client',
+                         realm_name='realm', client_secret_key='secret')
+        self.realm = realm
+
+    def _connect(self):
+        return StubAdmin(self.realm)
+
+
+def test_add_users_with_workers():
+    realm = StubRealm({'user0': 'old-id'})
+    users = [KCUser(username=f'user{index}', email=f'user{index}', role='User', attributes={})
+             for index in range(20)]
+    users.append(KCUser(username='user0', role='Unknown'))
+    results = StubKeycloak(realm).add_users(users, workers=4)
+    assert [result.username for result in results] == [
+        user.username for user in users]
+    assert [result.error for result in results[:-1]] == [None] * 20
+    assert results[-1].error == 'Unable to find role: Unknown'
+    assert realm.deleted == ['old-id']
+    assert realm.roles == {f'id-user{index}': 'User' for index in range(20)}
+
+
+def test_roles_are_read_for_matched_users_only():
+    realm = StubRealm({})
+    realm.user_roles = {'1': ['User', 'Admin'], '2': ['offline_access']}
+    candidates = [{'id': str(index), 'username': f'user{index}', 'email': f'user{index}@testonly.com'}
+                  for index in range(1, 4)]
+    candidates.append({'id': '4', 'username': 'user4', 'email': 'user4@other.com'})
+    list_users = Keycloak._build_users(
+        candidates, KCQuery({'email': {'regex': '^.*@testonly.com$'}}))
+    assert [user.role for user in list_users] == [None] * 3
+    csvloader = SimpleNamespace(template={Template.EXPORT: {Template.EXPORT_ROLES: ['Admin', 'User']}})
+    StubKeycloak(realm)._set_users_realm_roles(list_users, csvloader)
+    assert [user.role for user in list_users] == ['Admin', None, None]
+    assert sorted(realm.role_lookups) == ['1', '2', '3']
@@ -0,0 +1,43 @@
+import asyncio
+
+from keycloak_sync.model.kc import Keycloak
+from keycloak_sync.model.kcasync import AsyncKeycloak
+from keycloak_sync.model.kcuser import KCUser
+
+
+class StubAsyncKeycloak(AsyncKeycloak):
+    """records the admin calls of _add_user without a server"""
+
+    def __init__(self):
+        self.calls = []
+
+    async def get_user_id(self, username):
+        self.calls.append('get_user_id')
+        return 'existing-id'
+
+    async def delete_user(self, user_id):
+        self.calls.append('delete_user')
+
+    async def create_user(self, payload):
+        self.calls.append('create_user')
+        return 'new-id'
+
+    async def assign_realm_roles(self, user_id, roles):
+        self.calls.append('assign_realm_roles')
+
+
+def test_unknown_role_keeps_existing_user():
+    kc = StubAsyncKeycloak()
+    result = asyncio.run(kc._add_user(
+        KCUser(username='user1', role='Unknown'), roles={'Admin': 'admin-id'}))
+    assert result.error == 'Unable to find role: Unknown'
+    assert kc.calls == []
+
+
+def test_existing_user_is_replaced():
+    kc = StubAsyncKeycloak()
+    result = asyncio.run(kc._add_user(
+        KCUser(username='user1', email='user1', role='Admin', attributes={}), roles={'Admin': 'admin-id'}))
+    assert result == Keycloak.Result('new-id', 'user1', None)
+    assert kc.calls == ['get_user_id', 'delete_user',
+                        'create_user', 'assign_realm_roles']
@@ -0,0 +1,69 @@
+import pytest
+
+from keycloak_sync.model.kcquery import KCQuery
+
+
+def test_exact_search():
+    query = KCQuery({'username': {'allowed': ['user1']},
+                     'firstName': {'type': 'string', 'regex': '^First$'}})
+    assert query.params == {'username': 'user1', 'firstName': 'First', 'exact': 'true'}
+    assert query.residual == {}
+    assert query.match({'username': 'anything'})
+
+
+def test_regex_is_searched_by_its_literal_part():
+    rules = {'type': 'string', 'regex': '^.*@testonly\\.com$'}
+    query = KCQuery({'email': rules, 'username': {'allowed': ['user1']}})
+    assert query.params == {'email': '@testonly.com', 'username': 'user1'}
+    assert query.residual == {'email': rules, 'username': {'allowed': ['user1']}}
+    assert query.match({'email': 'user1@testonly.com', 'username': 'user1'})
+    assert not query.match({'email': 'user1@testonly.community', 'username': 'user1'})
+
+
+@pytest.mark.parametrize('regex, fragment', [
+    ('^.*@testonly\\.com$', '@testonly.com'),
+    ('^admin[0-9]+-teams$', '-teams'),
+    ('^ab*cdef$', 'cdef'),
+    ('^a|b$', None),
+    ('^.*$', None),
+    ('^[a-z]{3}$', None),
+    ('^a{2,3}$', None),
+    ('^user[0-9]{2,}-teams$', '-teams'),
+    ('^team{2}mate$', 'mate'),
+    ('^a{x}bc$', None),
+])
+def test_literal_fragment(regex, fragment):
+    assert KCQuery._literal_fragment(regex) == fragment
+
+
+def test_bounded_quantifier_is_not_searched():
+    query = KCQuery({'username': {'regex': '^[a-z]{3}$'}})
+    assert query.params == {}
+    assert query.residual == {'username': {'regex': '^[a-z]{3}$'}}
+
+
+def test_enabled_and_attributes():
+    query = KCQuery({'enabled': {'allowed': [False]},
+                     'attributes.Custom attribute1': {'allowed': ['ABCDEF']},
+                     'attributes.team': {'allowed': ['blue']},
+                     'attributes.site': {'allowed': ['a:b']}})
+    assert query.params == {'enabled': 'false', 'q': 'team:blue'}
+    assert set(query.residual) == {'attributes.Custom attribute1', 'attributes.site'}
+    assert query.needs_attributes()
+    assert query.match({'attributes': {'Custom attribute1': ['ABCDEF'], 'site': ['a:b']}})
+    assert not query.match({'attributes': {'site': ['a:b']}})
+
+
+def test_role_rules_keep_other_rules_local():
+    query = KCQuery({'role': {'allowed': ['User']},
+                     'username': {'allowed': ['user1']}})
+    assert query.params == {}
+    assert query.residual == {'username': {'allowed': ['user1']}}
+    assert query.role_rules == {'allowed': ['User']}
+    assert query.match_role('User')
+    assert not query.match_role('Admin')
+
+
+def test_unknown_rule():
+    with pytest.raises(KCQuery.KCQueryError):
+        KCQuery({'lastName': {'unknown': True}})
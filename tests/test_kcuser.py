@@ -0,0 +1,19 @@
+from keycloak_sync.model.kc import Keycloak
+from keycloak_sync.model.kcuser import KCUser
+
+from tests.users import user_row
+
+
+def test_compact_users_are_equivalent(make_loader, tmp_path):
+    rows = [user_row(index, role='Admin' if index % 3 else 'User',
+                     custom='ABCDEF' if index % 2 else 'GHIJKL') for index in range(12)]
+    rows[4] = user_row(4, mail='')
+    csvloader = make_loader(rows)
+    default = KCUser.create_list_users(csvloader, compact=False)
+    compact = KCUser.create_list_users(csvloader, compact=True)
+    assert [Keycloak._user_payload(user) for user in compact] == [
+        Keycloak._user_payload(user) for user in default]
+    assert [user.role for user in compact] == [user.role for user in default]
+    csvloader.export_users_to_csv(list_users=default, export_path=tmp_path / 'default.csv')
+    csvloader.export_users_to_csv(list_users=compact, export_path=tmp_path / 'compact.csv')
+    assert (tmp_path / 'compact.csv').read_bytes() == (tmp_path / 'default.csv').read_bytes()
@@ -0,0 +1,81 @@
+import threading
+import time
+
+import pytest
+
+from keycloak_sync.model.pagefetcher import PageFetcher
+
+
+class StubEndpoint:
+    """first/max paginated list, later pages answer faster"""
+
+    def __init__(self, total):
+        self.items = list(range(total))
+        self.firsts = []
+        self.lock = threading.Lock()
+
+    def count(self):
+        return len(self.items)
+
+    def fetch_page(self, first, size):
+        with self.lock:
+            self.firsts.append(first)
+        time.sleep(0.01 / (1 + first // size))
+        return self.items[first:first + size]
+
+
+def test_every_item_once():
+    endpoint = StubEndpoint(95)
+    pages = list(PageFetcher(endpoint.count, endpoint.fetch_page,
+                             page_size=10, prefetch=3).pages())
+    assert sorted(item for page in pages for item in page) == endpoint.items
+    assert sorted(endpoint.firsts) == list(range(0, 100, 10))
+
+
+@pytest.mark.parametrize('total', [0, 10])
+def test_single_page(total):
+    endpoint = StubEndpoint(total)
+    pages = list(PageFetcher(endpoint.count, endpoint.fetch_page,
+                             page_size=10, prefetch=4).pages())
+    assert [item for page in pages for item in page] == endpoint.items
+    assert endpoint.firsts == [0] + ([10] if total else [])
+
+
+def test_items_created_while_listing():
+    endpoint = StubEndpoint(20)
+    fetcher = PageFetcher(endpoint.count, endpoint.fetch_page, page_size=10, prefetch=2)
+    pages = fetcher.pages()
+    first = next(pages)
+    endpoint.items.extend(range(20, 25))
+    items = first + [item for page in pages for item in page]
+    assert sorted(items) == list(range(25))
+
+
+def test_error_is_raised_to_the_consumer():
+    endpoint = StubEndpoint(50)
+
+    def fetch_page(first, size):
+        if first == 30:
+            raise RuntimeError('page 30 failed')
+        return endpoint.fetch_page(first, size)
+    with pytest.raises(RuntimeError, match='page 30 failed'):
+        list(PageFetcher(endpoint.count, fetch_page, page_size=10, prefetch=2).pages())
+    assert not [thread for thread in threading.enumerate()
+                if thread.name.startswith('page-fetcher-')]
+
+
+def test_consumer_stops_early():
+    endpoint = StubEndpoint(1000)
+    pages = PageFetcher(endpoint.count, endpoint.fetch_page, page_size=10, prefetch=2).pages()
+    next(pages)
+    pages.close()
+    assert len(endpoint.firsts) < 10
+    assert not [thread for thread in threading.enumerate()
+                if thread.name.startswith('page-fetcher-')]
+
+
+def test_invalid_arguments():
+    with pytest.raises(PageFetcher.PageFetcherError):
+        PageFetcher(lambda: 0, lambda first, size: [], page_size=0)
+    with pytest.raises(PageFetcher.PageFetcherError):
+        PageFetcher(lambda: 0, lambda first, size: [], prefetch=0)
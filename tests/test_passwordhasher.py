@@ -0,0 +1,48 @@
+import base64
+import hashlib
+import json
+from types import SimpleNamespace
+
+from keycloak_sync.model.passwordhasher import PasswordHasher
+
+# PBKDF2-HMAC-SHA256 test vector of RFC 7914 section 11
+REFERENCE_HASH = ('55ac046e56e3089fec1691c22544b605f94185216dde0465e68b9d57c20dacbc'
+                  '49ca9cccf179b645991664b39d77ef317c71b845b1e30bd509112041d3a19783')
+
+
+def test_reference_hash():
+    credential = PasswordHasher(PasswordHasher.PBKDF2_SHA256, iterations=1).hash_password(
+        'passwd', salt=b'salt')
+    secret_data = json.loads(credential[PasswordHasher.Credential.SECRET_DATA])
+    credential_data = json.loads(
+        credential[PasswordHasher.Credential.CREDENTIAL_DATA])
+    assert base64.b64decode(
+        secret_data[PasswordHasher.Credential.VALUE]).hex() == REFERENCE_HASH
+    assert base64.b64decode(
+        secret_data[PasswordHasher.Credential.SALT]) == b'salt'
+    assert credential_data[PasswordHasher.Credential.ITERATIONS] == 1
+    assert credential_data[PasswordHasher.Credential.ALGORITHM] == PasswordHasher.PBKDF2_SHA256
+
+
+def test_hash_users():
+    users = [SimpleNamespace(password=f'password{i}') for i in range(4)]
+    users.append(SimpleNamespace(password=None))
+    PasswordHasher(iterations=10).hash_users(users, workers=2)
+    for user in users[:4]:
+        secret_data = json.loads(
+            user.credential[PasswordHasher.Credential.SECRET_DATA])
+        salt = base64.b64decode(secret_data[PasswordHasher.Credential.SALT])
+        assert base64.b64decode(secret_data[PasswordHasher.Credential.VALUE]) == hashlib.pbkdf2_hmac(
+            'sha256', user.password.encode('utf-8'), salt, 10, 64)
+    assert not hasattr(users[4], 'credential')
+
+
+def test_from_policy():
+    hasher = PasswordHasher.from_policy(
+        'length(8) and hashIterations(100000) and hashAlgorithm(pbkdf2-sha512)')
+    assert (hasher.algorithm, hasher.iterations) == (
+        PasswordHasher.PBKDF2_SHA512, 100000)
+    hasher = PasswordHasher.from_policy(
+        'hashIterations(100000)', iterations=10)
+    assert (hasher.algorithm, hasher.iterations) == (
+        PasswordHasher.DEFAULT_ALGORITHM, 10)
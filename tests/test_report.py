@@ -0,0 +1,60 @@
+import pytest
+
+from keycloak_sync.model.kc import Keycloak
+from keycloak_sync.model.report import RunReport
+
+
+def shard_report(shard, failed=0, status=RunReport.FINISHED):
+    report = RunReport(command='sync', shard=shard)
+    report.add_results([Keycloak.Result(f'id{index}', f'user{index}', None)
+                        for index in range(10)])
+    report.add_results([Keycloak.Result(None, f'user{index}', 'error')
+                        for index in range(failed)])
+    report.status = status
+    return report
+
+
+def test_merge_shards(tmp_path):
+    paths = []
+    for index in range(3):
+        paths.append(tmp_path / f'report-{index}.json')
+        shard_report(f'{index}/3', failed=index).write(paths[-1])
+    merged = RunReport.merge([RunReport.read(path) for path in paths])
+    assert sorted(merged.shards) == ['0/3', '1/3', '2/3']
+    assert (merged.total, merged.succeeded, len(merged.failed)) == (33, 30, 3)
+    assert merged.complete
+    assert merged.status == RunReport.FINISHED
+
+
+def test_merge_missing_or_duplicated_shard():
+    assert not RunReport.merge(
+        [shard_report('0/3'), shard_report('2/3')]).complete
+    assert not RunReport.merge(
+        [shard_report('0/2'), shard_report('0/2'), shard_report('1/2')]).complete
+    assert not RunReport.merge(
+        [shard_report('0/2'), shard_report('1/3')]).complete
+
+
+def test_merge_keeps_least_finished_status():
+    aborted = shard_report('1/3', status=RunReport.ABORTED)
+    aborted.reason = 'Unable to connect server'
+    merged = RunReport.merge([shard_report('0/3'), aborted,
+                              shard_report('2/3', status=RunReport.DECLINED)])
+    assert (merged.status, merged.reason) == (
+        RunReport.ABORTED, 'Unable to connect server')
+
+
+def test_merge_errors():
+    with pytest.raises(RunReport.RunReportError):
+        RunReport.merge([])
+    with pytest.raises(RunReport.RunReportError):
+        RunReport.merge([RunReport('sync'), RunReport('delete')])
+
+
+def test_run_is_aborted_until_finished(tmp_path):
+    path = tmp_path / 'report.json'
+    RunReport('delete').write(path)
+    assert RunReport.read(path).status == RunReport.ABORTED
+    path.write_text(path.read_text().replace(RunReport.ABORTED, 'unknown'))
+    with pytest.raises(RunReport.RunReportError):
+        RunReport.read(path)
@@ -0,0 +1,73 @@
+import pytest
+
+from keycloak_sync.model.csvloader import Template
+from keycloak_sync.model.rowdelta import RowDelta
+
+from tests.users import user_row
+
+
+def test_first_run_applies_every_row(make_loader, tmp_path):
+    csvloader = make_loader([user_row(index) for index in range(3)])
+    delta = RowDelta.load(csvloader, tmp_path / 'state.parquet')
+    assert delta.added.tolist() == [True] * 3
+    assert delta.removed == []
+
+
+def test_failed_user_without_username(make_loader, tmp_path):
+    state_path = tmp_path / 'state.parquet'
+    csvloader = make_loader([user_row(0), user_row(1, mail=''), user_row(2)])
+    delta = RowDelta.load(csvloader, state_path)
+    delta.write_state(state_path, failed_usernames=[None, 'USER2@test.com'])
+    delta = RowDelta.load(make_loader(
+        [user_row(0), user_row(1, mail=''), user_row(2)]), state_path)
+    assert delta.added.tolist() == [False, True, True]
+
+
+def test_added_changed_removed(make_loader, tmp_path):
+    state_path = tmp_path / 'state.parquet'
+    RowDelta.load(make_loader([user_row(index) for index in range(4)]),
+                  state_path).write_state(state_path)
+    csvloader = make_loader([user_row(3), user_row(0), user_row(1, role='Admin'), user_row(4)])
+    delta = RowDelta.load(csvloader, state_path)
+    assert delta.added.tolist() == [False, False, False, True]
+    assert delta.changed.tolist() == [False, False, True, False]
+    assert delta.removed == ['user2@test.com']
+    delta.select_rows(csvloader)
+    assert csvloader.usernames().tolist() == ['user1@test.com', 'user4@test.com']
+
+
+def test_row_hashes_are_stable(make_loader):
+    rows = [user_row(index) for index in range(3)]
+    hashes = make_loader(rows).row_hashes()
+    assert hashes.dtype == 'uint64'
+    assert hashes.tolist() == make_loader(rows, name='copy.csv').row_hashes().tolist()
+    assert make_loader([user_row(0, custom='XYZ')]).row_hashes()[0] != hashes[0]
+
+
+def test_mapping_change_applies_every_row(make_loader, tmp_path):
+    state_path = tmp_path / 'state.parquet'
+    rows = [user_row(index) for index in range(2)]
+    RowDelta.load(make_loader(rows), state_path).write_state(state_path)
+    mapper = dict(make_loader(rows).template[Template.MAPPER])
+    mapper[Template.MAPPER_ATTRIBUTES] = []
+    delta = RowDelta.load(make_loader(rows, **{Template.MAPPER: mapper}), state_path)
+    assert delta.added.tolist() == [True, True]
+    assert delta.removed == []
+
+
+def test_pending_removed_are_removed_again(make_loader, tmp_path):
+    state_path = tmp_path / 'state.parquet'
+    RowDelta.load(make_loader([user_row(index) for index in range(3)]),
+                  state_path).write_state(state_path)
+    delta = RowDelta.load(make_loader([user_row(0)]), state_path)
+    assert delta.removed == ['user1@test.com', 'user2@test.com']
+    delta.write_state(state_path, pending_removed=['user2@test.com'])
+    assert RowDelta.load(make_loader([user_row(0)]), state_path).removed == [
+        'user2@test.com']
+
+
+def test_unreadable_state(make_loader, tmp_path):
+    state_path = tmp_path / 'state.parquet'
+    state_path.write_text('not parquet')
+    with pytest.raises(RowDelta.RowDeltaError):
+        RowDelta.load(make_loader([user_row(0)]), state_path)
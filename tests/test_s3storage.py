@@ -0,0 +1,90 @@
+import gzip
+from pathlib import PurePath
+
+import pandas as pd
+import pytest
+from botocore.exceptions import ClientError
+
+from keycloak_sync.model.fileformat import FileFormat
+from keycloak_sync.model.s3storage import S3Storage
+
+
+class StubS3Client:
+    """in memory stand-in of the boto3 s3 client calls used by S3Storage"""
+
+    def __init__(self):
+        self.objects = {}
+        self.uploads = {}
+        self.aborted = []
+
+    def put_object(self, Bucket, Key, Body):
+        self.objects[(Bucket, Key)] = bytes(Body)
+
+    def create_multipart_upload(self, Bucket, Key):
+        upload_id = f'upload-{len(self.uploads)}'
+        self.uploads[upload_id] = {}
+        return {'UploadId': upload_id}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body):
+        self.uploads[UploadId][PartNumber] = bytes(Body)
+        return {'ETag': f'etag-{PartNumber}'}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        parts = self.uploads.pop(UploadId)
+        assert [part['PartNumber'] for part in MultipartUpload['Parts']] == sorted(parts)
+        self.objects[(Bucket, Key)] = b''.join(parts[number] for number in sorted(parts))
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        self.uploads.pop(UploadId)
+        self.aborted.append(UploadId)
+
+    def head_object(self, Bucket, Key):
+        if (Bucket, Key) not in self.objects:
+            raise ClientError({'Error': {'Code': '404'}}, 'HeadObject')
+        return {}
+
+
+def test_small_file_is_put():
+    client = StubS3Client()
+    storage = S3Storage(client=client)
+    with storage.open_writer('bucket', PurePath('users.csv')) as writer:
+        writer.write(b'username\n')
+    assert client.objects[('bucket', 'users.csv')] == b'username\n'
+    assert not client.uploads
+    assert storage.exists('bucket', PurePath('users.csv'))
+    assert not storage.exists('bucket', PurePath('missing.csv'))
+
+
+def test_multipart_upload():
+    client = StubS3Client()
+    storage = S3Storage(client=client, part_size=S3Storage.MIN_PART_SIZE)
+    content = bytes(range(256)) * (S3Storage.MIN_PART_SIZE // 100)
+    with storage.open_writer('bucket', PurePath('export/users.bin')) as writer:
+        for start in range(0, len(content), 1000):
+            writer.write(content[start:start + 1000])
+        assert writer.tell() == len(content)
+        assert len(writer.parts) == 2
+    assert client.objects[('bucket', 'export/users.bin')] == content
+    assert not client.uploads
+
+
+def test_failed_export_is_aborted():
+    client = StubS3Client()
+    storage = S3Storage(client=client, part_size=S3Storage.MIN_PART_SIZE)
+    with pytest.raises(RuntimeError):
+        with storage.open_writer('bucket', PurePath('users.csv')) as writer:
+            writer.write(b'x' * S3Storage.MIN_PART_SIZE)
+            raise RuntimeError('export failed')
+    assert client.aborted == ['upload-0']
+    assert not client.objects
+
+
+def test_stream_gzip_csv():
+    client = StubS3Client()
+    dataframe = pd.DataFrame({'username': ['user1', 'user2'], 'role': ['Admin', None]})
+    with S3Storage(client=client).open_writer('bucket', PurePath('users.csv.gz')) as writer:
+        with gzip.GzipFile(fileobj=writer, mode='wb') as compressed:
+            FileFormat.write(file_format=FileFormat.CSV, dataframe=dataframe,
+                             path=compressed, separator=';')
+    assert gzip.decompress(client.objects[('bucket', 'users.csv.gz')]) == \
+        b'username;role\nuser1;Admin\nuser2;\n'
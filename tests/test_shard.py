@@ -0,0 +1,45 @@
+from types import SimpleNamespace
+
+import pandas as pd
+import pytest
+
+from keycloak_sync.model.shard import Shard
+
+USERNAMES = [f'user{index}@testonly.com' for index in range(200)]
+
+
+def test_parse():
+    shard = Shard.parse('2/8')
+    assert (shard.index, shard.count) == (2, 8)
+    assert str(shard) == '2/8'
+    for value in ['8/8', '-1/8', '1', 'a/b', '0/0']:
+        with pytest.raises(Shard.ShardError):
+            Shard.parse(value)
+
+
+def test_every_user_belongs_to_one_shard():
+    shards = [Shard(index, 4) for index in range(4)]
+    owners = [[shard.index for shard in shards if shard.contains(username)]
+              for username in USERNAMES]
+    assert all(len(owner) == 1 for owner in owners)
+    assert {owner[0] for owner in owners} == {0, 1, 2, 3}
+
+
+def test_index_is_stable_and_case_insensitive():
+    assert Shard.index_of('User1@TestOnly.com', 8) == Shard.index_of(
+        'user1@testonly.com', 8)
+    # md5 based, the same in every process and python version
+    assert [Shard.index_of(username, 8) for username in USERNAMES[:8]] == [
+        4, 3, 2, 6, 5, 7, 5, 1]
+    assert Shard.index_of(None, 8) == Shard.index_of('', 8)
+
+
+def test_filter_dataframe_and_users():
+    shard = Shard(1, 3)
+    dataframe = pd.DataFrame({'Mail': USERNAMES, 'row': range(len(USERNAMES))})
+    kept = shard.filter_dataframe(dataframe, 'Mail')
+    expected = [username for username in USERNAMES if shard.contains(username)]
+    assert kept['Mail'].tolist() == expected
+    assert kept.index.tolist() == list(range(len(expected)))
+    users = [SimpleNamespace(username=username) for username in USERNAMES]
+    assert [user.username for user in shard.filter_users(users)] == expected
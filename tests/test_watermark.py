@@ -0,0 +1,65 @@
+from datetime import datetime
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+from keycloak_sync.model.watermark import Watermark
+
+STARTED = 1600000000000
+
+
+def exported_user(user_id, created, modified=None):
+    return SimpleNamespace(id=user_id, createdtimestamp=created, modifiedtimestamp=modified)
+
+
+def test_advance_to_latest_user():
+    watermark = Watermark()
+    watermark.advance([exported_user('1', STARTED - 10 * Watermark.OVERLAP),
+                       exported_user('2', STARTED - 20 * Watermark.OVERLAP, STARTED - 9 * Watermark.OVERLAP)],
+                      started=STARTED)
+    assert watermark.timestamp == STARTED - 9 * Watermark.OVERLAP
+    assert watermark.exported == {}
+
+
+def test_advance_is_capped_at_listing_start():
+    watermark = Watermark(STARTED - 10 * Watermark.OVERLAP)
+    recent = exported_user('2', STARTED + 1000)
+    watermark.advance([exported_user('1', STARTED - 5 * Watermark.OVERLAP), recent],
+                      started=STARTED)
+    assert watermark.timestamp == STARTED - Watermark.OVERLAP
+    assert watermark.exported == {'2': STARTED + 1000}
+    # created during the listing, missing from the first one
+    missed = exported_user('3', STARTED - 1000)
+    assert watermark.select([missed, recent]) == [missed]
+    recent.modifiedtimestamp = STARTED + 2000
+    assert watermark.select([recent]) == [recent]
+
+
+def test_advance_never_goes_back():
+    watermark = Watermark(STARTED)
+    watermark.advance([exported_user('1', STARTED + 1000)], started=STARTED)
+    assert watermark.timestamp == STARTED
+    assert watermark.exported == {'1': STARTED + 1000}
+    watermark.advance([], started=STARTED)
+    assert watermark.timestamp == STARTED
+
+
+def test_read_write(tmp_path):
+    path = Watermark.default_path(tmp_path / 'users.csv')
+    assert path == tmp_path / 'users.csv.watermark.json'
+    assert Watermark.read(path).timestamp is None
+    Watermark(STARTED, {'1': STARTED + 1000}).write(path)
+    watermark = Watermark.read(path)
+    assert (watermark.timestamp, watermark.exported) == (STARTED, {'1': STARTED + 1000})
+    path.write_text('{}')
+    with pytest.raises(Watermark.WatermarkError):
+        Watermark.read(path)
+
+
+def test_part_path():
+    now = datetime(2021, 3, 1, 2, 0, 0)
+    assert Watermark.part_path(Path('export/users.csv'), now) == Path(
+        'export/users.20210301T020000.csv')
+    assert Watermark.part_path(Path('users'), now) == Path(
+        'users.20210301T020000')
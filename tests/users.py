@@ -0,0 +1,33 @@
+from pathlib import Path
+
+import yaml
+
+from keycloak_sync.model.csvloader import Template
+
+CLIENT_TEMPLATE = Path(__file__).parent.parent / 'client-template' / 'template.yaml'
+HEADER = 'Date active;Date desactive;Profil;lastname;firstname;Mail;password;Custom col'
+
+
+def user_row(index: int, role: str = 'User', custom: str = 'ABCDEF', mail: str = None) -> str:
+    """one valid row of client-template/template.yaml"""
+    mail = f'user{index}@test.com' if mail is None else mail
+    return f'01/01/20;;{role};Last;First;{mail};password{index};{custom}'
+
+
+def write_template(directory: Path, **changes) -> Path:
+    """write the client template with changed top-level labels, its Profil regex
+    '*$' is not a valid regex and is replaced by '^.*$'
+
+    Returns:
+        Path: template path
+    """
+    with open(CLIENT_TEMPLATE, 'r') as stream:
+        template = yaml.safe_load(stream)
+    for data_model in template[Template.DATA_MODEL]:
+        if data_model[Template.DATA_MODEL_REGEX] == '*$':
+            data_model[Template.DATA_MODEL_REGEX] = '^.*$'
+    template.update(changes)
+    path = Path(directory) / 'template.yaml'
+    with open(path, 'w') as stream:
+        yaml.safe_dump(template, stream, allow_unicode=True)
+    return path